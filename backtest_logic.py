@@ -1,6 +1,12 @@
 
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import argparse
+
+# The storage layer and the KRX listing (FinanceDataReader) are imported inside
+# sweep_universe/main only, so importing backtest_logic itself pulls in neither
+# FinanceDataReader nor krx_universe.
 
 def analyze_stock_history(df, compare_days, period_days=10, surge_threshold=0.10):
     """
@@ -16,50 +22,66 @@ def analyze_stock_history(df, compare_days, period_days=10, surge_threshold=0.10
     
     return _calculate_stats(df, conditions, period_days, surge_threshold)
 
-def analyze_ma_breakout(df, window, period_days=10, surge_threshold=0.10):
+def analyze_ma_breakout(df, window, period_days=10, surge_threshold=0.10, ma=None):
     """
     Analyzes average breakout patterns.
     Pattern: Close > MA(window) AND Prev_Close <= Prev_MA(window)
+    ma: optional precomputed MA(window) aligned with df (e.g. from indicator_cache)
+    df may also be a compact_market.CompactHistory (column arrays instead of a DataFrame)
     """
     if len(df) < window + period_days + 1:
         return None
+
+    if not isinstance(df, pd.DataFrame):
+        close = np.asarray(df['Close'], dtype=np.float64)
+        if ma is None or len(ma) != len(df):
+            csum = np.concatenate([[0.0], np.cumsum(close)])
+            ma = np.full(len(close), np.nan)
+            ma[window - 1:] = (csum[window:] - csum[:-window]) / window
+        with np.errstate(invalid='ignore'):
+            conditions = close > ma
+            conditions[1:] &= close[:-1] <= ma[:-1]
+        conditions[0] = False
+        return _calculate_stats(df, conditions, period_days, surge_threshold)
         
-    ma_series = df['Close'].rolling(window=window).mean()
+    if ma is not None and len(ma) == len(df):
+        ma_series = pd.Series(ma, index=df.index)
+    else:
+        ma_series = df['Close'].rolling(window=window).mean()
     
     # Crossover: Close > MA and Prev_Close <= Prev_MA
     conditions = (df['Close'] > ma_series) & (df['Close'].shift(1) <= ma_series.shift(1))
     
     return _calculate_stats(df, conditions, period_days, surge_threshold)
 
-def _calculate_stats(df, conditions, period_days, surge_threshold):
-    valid_indices = conditions[conditions].index
-    valid_locs = [df.index.get_loc(idx) for idx in valid_indices]
-    
-    total_signals = 0
-    success_count = 0
-    total_max_return = 0.0
-    
-    n_rows = len(df)
-    
-    for loc in valid_locs:
-        if loc + period_days >= n_rows:
-            continue
-            
-        total_signals += 1
-        entry_price = df['Close'].iloc[loc]
-        future_window = df['High'].iloc[loc+1 : loc+period_days+1]
-        
-        if future_window.empty: 
-            continue
-            
-        max_price = future_window.max()
-        max_return = (max_price - entry_price) / entry_price
-        
-        if max_return >= surge_threshold:
-            success_count += 1
-            
-        total_max_return += max_return
+def _forward_max(high, period_days):
+    """
+    forward_max[i] = max(High[i+1 : i+period_days+1]) for every row that has a full
+    future window (i.e. the first len(high) - period_days rows).
+    """
+    windows = sliding_window_view(high[1:], period_days)
+    with np.errstate(invalid='ignore'):
+        return np.nanmax(windows, axis=1) if np.isnan(windows).any() else windows.max(axis=1)
+
+def _signal_returns(close, high, signals, period_days, forward_max=None):
+    """
+    Max return within period_days after each signal that has a full future window.
+    Returns (total_signals, max_return); max_return is None when period_days < 1.
+    """
+    n_rows = len(close)
+    locs = np.nonzero(signals[:max(n_rows - period_days, 0)])[0]
+
+    if period_days < 1 or len(locs) == 0:
+        return len(locs), None
+
+    if forward_max is None:
+        forward_max = _forward_max(high, period_days)
+    entry_price = close[locs]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        max_return = (forward_max[locs] - entry_price) / entry_price
+    return len(locs), max_return
 
+def _summarize(total_signals, max_return, surge_threshold):
     if total_signals == 0:
         return {
             'total_signals': 0,
@@ -67,10 +89,167 @@ def _calculate_stats(df, conditions, period_days, surge_threshold):
             'success_rate': 0.0,
             'avg_max_return': 0.0
         }
-        
+
+    if max_return is None:
+        success_count = 0
+        total_max_return = 0.0
+    else:
+        success_count = int(np.count_nonzero(max_return >= surge_threshold))
+        # cumsum accumulates left to right, matching a running sum over the signals
+        total_max_return = np.cumsum(max_return)[-1]
+
     return {
         'total_signals': total_signals,
         'success_count': success_count,
         'success_rate': round((success_count / total_signals) * 100, 2),
         'avg_max_return': round((total_max_return / total_signals) * 100, 2)
     }
+
+def _calculate_stats(df, conditions, period_days, surge_threshold):
+    close = np.asarray(df['Close'], dtype=np.float64)
+    high = np.asarray(df['High'], dtype=np.float64)
+    signals = np.asarray(conditions, dtype=bool)
+
+    # Only signals with a full period_days window after them are counted
+    total_signals, max_return = _signal_returns(close, high, signals, period_days)
+    return _summarize(total_signals, max_return, surge_threshold)
+
+def sweep_ma_breakout(df, windows, periods, thresholds, close_sum=None):
+    """
+    Evaluates the MA breakout pattern for every (window, period_days, surge_threshold)
+    combination in one shot. All moving averages come from a single cumulative sum of
+    Close (close_sum from indicator_cache when given) and each holding period gets one
+    forward-max array of High.
+    Combinations without enough history (see analyze_ma_breakout) are skipped.
+    Returns a list of dicts: window, period_days, surge_threshold + the stats keys.
+    """
+    close = np.asarray(df['Close'], dtype=np.float64)
+    high = np.asarray(df['High'], dtype=np.float64)
+    n_rows = len(close)
+
+    if close_sum is not None and len(close_sum) == n_rows:
+        csum = np.concatenate([[0.0], np.asarray(close_sum, dtype=np.float64)])
+    else:
+        csum = np.concatenate([[0.0], np.cumsum(close)])
+    forward_max = {p: _forward_max(high, p) for p in periods if 1 <= p < n_rows}
+
+    results = []
+    for window in windows:
+        if n_rows < window + min(periods) + 1:
+            continue
+
+        ma = np.full(n_rows, np.nan)
+        ma[window - 1:] = (csum[window:] - csum[:-window]) / window
+        with np.errstate(invalid='ignore'):
+            above = close > ma
+            not_above_prev = np.zeros(n_rows, dtype=bool)
+            not_above_prev[1:] = close[:-1] <= ma[:-1]
+        signals = above & not_above_prev
+
+        for period_days in periods:
+            if n_rows < window + period_days + 1:
+                continue
+            total_signals, max_return = _signal_returns(close, high, signals, period_days,
+                                                        forward_max.get(period_days))
+            for surge_threshold in thresholds:
+                stats = _summarize(total_signals, max_return, surge_threshold)
+                results.append({'window': window, 'period_days': period_days,
+                                'surge_threshold': surge_threshold, **stats})
+    return results
+
+def sweep_universe(stocks, windows, periods, thresholds, load_prices=None):
+    """
+    Runs sweep_ma_breakout for every ticker in stocks (Code, Name).
+    Returns a long-format DataFrame: one row per (ticker, window, period_days, surge_threshold).
+    """
+    import price_store
+    import indicator_cache
+
+    use_cache = load_prices is None
+    if load_prices is None:
+        load_prices = price_store.load_prices
+
+    rows = []
+    for code, name in zip(stocks['Code'], stocks['Name']):
+        df = load_prices(code, name)
+        if df is None or df.empty:
+            continue
+        sums = indicator_cache.load(code) if use_cache else None
+        close_sum = sums['CloseSum'] if sums is not None else None
+        for res in sweep_ma_breakout(df.sort_index(), windows, periods, thresholds, close_sum):
+            rows.append({'Code': code, 'Name': name, **res})
+
+    columns = ['Code', 'Name', 'window', 'period_days', 'surge_threshold',
+               'total_signals', 'success_count', 'success_rate', 'avg_max_return']
+    return pd.DataFrame(rows, columns=columns)
+
+def sweep_market(market, windows, periods, thresholds):
+    """
+    sweep_universe over a compact_market.CompactMarket (whole market already in memory).
+    Returns the same long-format DataFrame.
+    """
+    rows = []
+    for history in market:
+        if len(history) == 0:
+            continue
+        for res in sweep_ma_breakout(history, windows, periods, thresholds):
+            rows.append({'Code': history.code, 'Name': history.name, **res})
+
+    columns = ['Code', 'Name', 'window', 'period_days', 'surge_threshold',
+               'total_signals', 'success_count', 'success_rate', 'avg_max_return']
+    return pd.DataFrame(rows, columns=columns)
+
+def aggregate_sweep(df_sweep):
+    """
+    Pools a sweep_universe table over tickers per parameter set
+    (success rate and average max return weighted by signal count).
+    """
+    df = df_sweep.assign(total_return=df_sweep['avg_max_return'] * df_sweep['total_signals'])
+    grouped = df.groupby(['window', 'period_days', 'surge_threshold'], as_index=False).agg(
+        tickers=('Code', 'count'),
+        total_signals=('total_signals', 'sum'),
+        success_count=('success_count', 'sum'),
+        total_return=('total_return', 'sum'),
+    )
+    signals = grouped['total_signals'].where(grouped['total_signals'] > 0)
+    grouped['success_rate'] = (grouped['success_count'] / signals * 100).fillna(0).round(2)
+    grouped['avg_max_return'] = (grouped['total_return'] / signals).fillna(0).round(2)
+    return grouped.drop(columns='total_return').sort_values(['success_rate', 'avg_max_return'], ascending=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="MA breakout parameter sweep over the whole market")
+    parser.add_argument('--windows', type=int, nargs='+', default=[20, 60, 120, 300], help="MA windows")
+    parser.add_argument('--periods', type=int, nargs='+', default=[5, 10, 20], help="holding periods (days)")
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.05, 0.10, 0.20], help="surge thresholds")
+    parser.add_argument('--limit', type=int, help="number of tickers (for testing)")
+    parser.add_argument('--output', type=str, default='sweep_results.csv', help="long-format result CSV")
+    parser.add_argument('--compact', action='store_true', help="load the whole market into the compact in-memory form first")
+    args = parser.parse_args()
+
+    import price_store
+    import krx_universe
+    import compact_market
+
+    codes = price_store.list_tickers()
+    if args.limit:
+        codes = codes[:args.limit]
+    stocks = pd.DataFrame({'Code': codes})
+    # Names are only for display; take them from the cached KRX universe when available
+    try:
+        names = krx_universe.load_universe(offline=True, verbose=False)[['Code', 'Name']]
+        stocks = stocks.merge(names.drop_duplicates('Code'), on='Code', how='left')
+    except Exception:
+        stocks['Name'] = None
+    stocks['Name'] = stocks['Name'].fillna(stocks['Code'])
+
+    if args.compact:
+        market = compact_market.load_market(stocks['Code'].tolist(), dict(zip(stocks['Code'], stocks['Name'])))
+        df_sweep = sweep_market(market, args.windows, args.periods, args.thresholds)
+    else:
+        df_sweep = sweep_universe(stocks, args.windows, args.periods, args.thresholds)
+    df_sweep.to_csv(args.output, index=False, encoding='utf-8-sig')
+    print(f"Saved {len(df_sweep)} rows to '{args.output}'")
+    print(aggregate_sweep(df_sweep).head(10).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
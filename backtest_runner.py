@@ -0,0 +1,113 @@
+import pandas as pd
+import concurrent.futures
+import math
+import os
+
+import backtest_logic
+import price_store
+import indicator_cache
+import data_cache
+
+# 종목을 여러 묶음으로 나눠 프로세스 풀에서 병렬로 백테스트합니다.
+# 각 워커는 자기 묶음의 종목 데이터를 저장소에서 직접 읽으므로 부모 → 워커로는 종목 코드만 전달됩니다.
+# 종목별 결과는 공용 캐시(data_cache)에 종목 태그로 저장해 두고, 업데이트로 바뀐 종목만 다시 계산합니다.
+
+SERIAL_THRESHOLD = 50  # 이보다 적은 종목은 프로세스 풀 없이 바로 실행
+
+_MISSING = object()
+
+def _result_key(ticker, window, period_days, surge_threshold):
+    return ('backtest', ticker, window, period_days, surge_threshold)
+
+def _run_chunk(chunk, window, period_days, surge_threshold):
+    """
+    워커 프로세스에서 실행: (순번, 코드, 이름) 묶음을 분석해 (순번, 코드, 결과) 리스트 반환
+    결과가 없는 종목(데이터 부족 등)도 None 으로 돌려줘 캐시에 남깁니다.
+    """
+    results = []
+    for order, ticker, name in chunk:
+        df_hist = price_store.load_prices(ticker, name)
+        res = None
+        if df_hist is not None:
+            # 저장소 종목은 지표 캐시의 누적합으로 이동평균 계산 (저장소 레코드와 같은 순서)
+            ma = indicator_cache.moving_average(ticker, window)
+            res = backtest_logic.analyze_ma_breakout(df_hist.sort_index(), window=window,
+                                                     period_days=period_days, surge_threshold=surge_threshold, ma=ma)
+        if res:
+            res['Code'] = ticker
+            res['Name'] = name
+        results.append((order, ticker, res or None))
+    return results
+
+def _finish(results):
+    """(순번, 코드, 결과) → 결과가 있는 종목의 결과 dict 리스트 (_order 포함, 캐시의 dict 는 복사)"""
+    return [{**res, '_order': order} for order, _, res in results if res]
+
+def iter_backtest(stocks, window, period_days=10, surge_threshold=0.10, workers=None, chunk_size=None):
+    """
+    stocks(Code, Name) 전 종목의 MA 돌파 백테스트를 병렬로 실행하며
+    묶음이 끝날 때마다 (완료 종목 수, 전체 종목 수, 묶음 결과 리스트)를 돌려줍니다.
+    """
+    items = [(i, row['Code'], row['Name']) for i, (_, row) in enumerate(stocks.iterrows())]
+    total = len(items)
+    if total == 0:
+        return
+
+    # 캐시에 있는 종목은 바로 돌려주고 나머지만 계산
+    cache = data_cache.get_cache()
+    cached, pending, generations = [], [], {}
+    for order, ticker, name in items:
+        key = _result_key(ticker, window, period_days, surge_threshold)
+        generations[ticker] = cache.generations([ticker])
+        res = cache.peek(key, _MISSING)
+        if res is _MISSING:
+            pending.append((order, ticker, name))
+        else:
+            cached.append((order, ticker, res))
+    done = len(cached)
+    if cached:
+        yield done, total, _finish(cached)
+
+    def store(results):
+        for _, ticker, res in results:
+            cache.put(_result_key(ticker, window, period_days, surge_threshold), res,
+                      tags=[ticker], generations=generations[ticker])
+        return _finish(results)
+
+    items = pending
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(items) < SERIAL_THRESHOLD:
+        chunk_size = chunk_size or 10
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            done += len(chunk)
+            yield done, total, store(_run_chunk(chunk, window, period_days, surge_threshold))
+        return
+
+    # 진행률이 자주 갱신되도록 워커 수보다 넉넉히 나눔
+    chunk_size = chunk_size or max(1, math.ceil(len(items) / (workers * 8)))
+    chunks = [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_run_chunk, chunk, window, period_days, surge_threshold): len(chunk)
+                   for chunk in chunks}
+        for future in concurrent.futures.as_completed(futures):
+            done += futures[future]
+            yield done, total, store(future.result())
+
+def run_backtest(stocks, window, period_days=10, surge_threshold=0.10, workers=None, progress=None):
+    """
+    iter_backtest 결과를 모아 DataFrame 으로 반환합니다. (stocks 순서 유지)
+    progress(done, total) 콜백으로 진행 상황을 알립니다.
+    """
+    results = []
+    for done, total, chunk_results in iter_backtest(stocks, window, period_days, surge_threshold, workers):
+        results.extend(chunk_results)
+        if progress:
+            progress(done, total)
+
+    columns = ['total_signals', 'success_count', 'success_rate', 'avg_max_return', 'Code', 'Name']
+    if not results:
+        return pd.DataFrame(columns=columns)
+    results.sort(key=lambda res: res['_order'])
+    return pd.DataFrame(results, columns=columns)
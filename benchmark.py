@@ -0,0 +1,279 @@
+import numpy as np
+import pandas as pd
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+# 스크리닝/백테스트/업데이트/차트/포트폴리오 핵심 경로 벤치마크
+# - 가상 시장(종목 수, 이력 길이 지정)을 stock_data/ 와 같은 CSV 형식(Date,Open,High,Low,Close,Volume,Change)으로
+#   임시 폴더에 만들고, 그 폴더에서 각 경로를 실행합니다. (실제 데이터/네트워크를 건드리지 않음)
+# - 데이터 소스(FinanceDataReader)는 가상 시장을 돌려주는 오프라인 스텁으로 바꿔 끼웁니다.
+# - 경로마다 실행 시간(최솟값), 최대 메모리(tracemalloc), 처리량(종목/초, 봉/초)을 측정하고
+#   --save-baseline 으로 저장한 기준값(benchmark_baseline.json)과 비교합니다.
+
+BASELINE_FILE = 'benchmark_baseline.json'
+END_DATE = '2025-12-19'  # 가상 시장의 마지막 거래일 (업데이트 벤치마크는 다음 거래일 1봉을 받음)
+CASES = ['screen', 'backtest', 'update', 'chart', 'portfolio']
+
+# --- 가상 시장 ---
+
+def synthetic_prices(seed, n_days, end_date=END_DATE):
+    """stock_data/ CSV 와 같은 컬럼의 가상 일봉 (가격/거래량은 정수)"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=end_date, periods=n_days, name='Date')
+    start = rng.uniform(1000, 200000)
+    close = np.maximum(np.round(start * np.exp(np.cumsum(rng.normal(0, 0.02, n_days)))), 1)
+    open_ = np.maximum(np.round(close * (1 + rng.normal(0, 0.01, n_days))), 1)
+    high = np.maximum(open_, close) + np.round(close * rng.uniform(0, 0.02, n_days))
+    low = np.maximum(np.minimum(open_, close) - np.round(close * rng.uniform(0, 0.02, n_days)), 1)
+    df = pd.DataFrame({
+        'Open': open_.astype(np.int64),
+        'High': high.astype(np.int64),
+        'Low': low.astype(np.int64),
+        'Close': close.astype(np.int64),
+        'Volume': rng.integers(1000, 5000000, n_days),
+    }, index=dates)
+    df['Change'] = df['Close'].pct_change()
+    return df
+
+def synthetic_listing(n_tickers):
+    """가상 종목 목록 (Code, Name)"""
+    codes = [f"{900000 + i:06d}" for i in range(n_tickers)]
+    return pd.DataFrame({'Code': codes, 'Name': [f"가상종목{i}" for i in range(n_tickers)]})
+
+def _next_bar(ticker, start):
+    """업데이트 벤치마크용: start 이후 첫 거래일의 가상 1봉"""
+    day = pd.bdate_range(start=start, periods=1)[0]
+    df = synthetic_prices(int(ticker), 2, end_date=day).tail(1)
+    df.index.name = 'Date'
+    return df
+
+def install_offline_source(listing):
+    """FinanceDataReader 를 가상 시장을 돌려주는 오프라인 스텁으로 바꿔 끼웁니다. (네트워크 사용 안 함)"""
+    stub = types.ModuleType('FinanceDataReader')
+    stub.DataReader = lambda ticker, start=None, *args, **kwargs: _next_bar(ticker, start or END_DATE)
+    stub.StockListing = lambda market='KRX': listing.copy()
+    sys.modules['FinanceDataReader'] = stub
+
+def generate_market(work_dir, n_tickers, n_days):
+    """작업 폴더에 가상 시장 CSV 를 만들고 바이너리 저장소/패널로 변환합니다."""
+    import price_store
+    import price_panel
+
+    listing = synthetic_listing(n_tickers)
+    os.makedirs(os.path.join(work_dir, price_store.DATA_DIR), exist_ok=True)
+    for i, (code, name) in enumerate(zip(listing['Code'], listing['Name'])):
+        synthetic_prices(int(code), n_days).to_csv(os.path.join(work_dir, price_store.csv_path(code, name)))
+
+    with _quiet():
+        price_store.migrate()
+        price_panel.build_panel(verbose=False)
+    return listing
+
+# --- 측정 ---
+
+@contextlib.contextmanager
+def _quiet():
+    """벤치마크 대상이 출력하는 진행 상황(PROGRESS 등)을 숨깁니다."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def measure(run, setup=None, repeat=3):
+    """
+    run() 을 repeat 번 실행한 최소 시간과, 한 번 더 실행했을 때의 최대 메모리(MB)를 반환합니다.
+    setup() 은 매 실행 전에 호출되며 측정에서 제외됩니다.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        with _quiet():
+            run()
+        times.append(time.perf_counter() - start)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        with _quiet():
+            run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(times), peak / 1024 / 1024
+
+# --- 벤치마크 대상 ---
+
+def bench_screen(listing, n_days, repeat):
+    """stock_filter.calculate_ma_and_filter: 전 종목 MA 돌파 스크리닝 (저장소에 모든 데이터가 있는 상태)"""
+    import stock_filter
+    return measure(lambda: stock_filter.calculate_ma_and_filter(listing, window=300), repeat=repeat), len(listing), len(listing) * n_days
+
+def bench_backtest(listing, n_days, repeat):
+    """backtest_logic._calculate_stats: 전 종목 MA 돌파 신호의 이후 수익률 통계 (신호 계산은 측정 전에 준비)"""
+    import backtest_logic
+    import price_store
+
+    inputs = []
+    for code in listing['Code']:
+        df = price_store.load_prices(code)
+        ma = df['Close'].rolling(window=20).mean()
+        inputs.append((df, (df['Close'] > ma) & (df['Close'].shift(1) <= ma.shift(1))))
+
+    def run():
+        for df, conditions in inputs:
+            backtest_logic._calculate_stats(df, conditions, 10, 0.10)
+    return measure(run, repeat=repeat), len(listing), len(listing) * n_days
+
+def bench_update(listing, n_days, repeat):
+    """update_data.process_stock: 종목별 1봉 추가 (데이터 소스는 오프라인 스텁, 매 실행 전 저장소 복원)"""
+    import update_data
+    import price_store
+    import price_catalog
+
+    update_data.fetch_data = lambda ticker, start_date, timeout=10: _next_bar(ticker, start_date)
+    snapshot = price_store.STORE_DIR + '.bench'
+    shutil.rmtree(snapshot, ignore_errors=True)
+    shutil.copytree(price_store.STORE_DIR, snapshot)
+
+    def setup():
+        shutil.rmtree(price_store.STORE_DIR)
+        shutil.copytree(snapshot, price_store.STORE_DIR)
+        price_catalog.reload()
+
+    def run():
+        for code, name in zip(listing['Code'], listing['Name']):
+            update_data.process_stock(code, name)
+
+    result = measure(run, setup=setup, repeat=repeat)
+    setup()
+    return result, len(listing), len(listing)
+
+def bench_chart(listing, n_days, repeat):
+    """dashboard.load_stock_data 의 본체(chart_data.load_chart_window): 최근 400일 + 300일 이동평균 + 5일 전 종가"""
+    import chart_data
+
+    def run():
+        for code, name in zip(listing['Code'], listing['Name']):
+            chart_data.load_chart_window(code, name, 300, 400, 5)
+    return measure(run, repeat=repeat), len(listing), len(listing) * min(400, n_days)
+
+def bench_portfolio(listing, n_days, repeat):
+    """portfolio_backtest.run_portfolio: 전 기간 매일 20일선 돌파 상위 10종목 매매 재생 (패널은 측정 전에 엶)"""
+    import portfolio_backtest
+    import price_panel
+
+    panel = price_panel.load_panel(rebuild_if_stale=False, verbose=False)
+    return measure(lambda: portfolio_backtest.run_portfolio(panel, listing, 20), repeat=repeat), \
+        len(listing), len(listing) * n_days
+
+BENCHES = {
+    'screen': bench_screen,
+    'backtest': bench_backtest,
+    'update': bench_update,
+    'chart': bench_chart,
+    'portfolio': bench_portfolio,
+}
+
+def run_benchmarks(n_tickers, n_days, cases=None, repeat=3, keep=False):
+    """가상 시장을 만들고 각 경로를 측정합니다. 반환: {경로: 측정 결과 dict}"""
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    if repo_dir not in sys.path:
+        sys.path.insert(0, repo_dir)
+    install_offline_source(synthetic_listing(n_tickers))
+
+    cwd = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix='bench_')
+    results = {}
+    try:
+        os.chdir(work_dir)
+        listing = generate_market(work_dir, n_tickers, n_days)
+        for case in cases or CASES:
+            (seconds, peak_mb), tickers, bars = BENCHES[case](listing, n_days, repeat)
+            results[case] = {
+                'seconds': round(seconds, 4),
+                'peak_mb': round(peak_mb, 1),
+                'tickers_per_sec': round(tickers / seconds, 1) if seconds else None,
+                'bars_per_sec': round(bars / seconds, 1) if seconds else None,
+            }
+    finally:
+        # 작업 폴더를 떠나기 전에 카탈로그를 저장 (종료 시 자동 저장이 원래 폴더에 쓰지 않도록)
+        if 'price_catalog' in sys.modules:
+            sys.modules['price_catalog'].save()
+        os.chdir(cwd)
+        if keep:
+            print(f"작업 폴더: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+def compare(results, baseline, tolerance=0.2):
+    """기준값 대비 변화율을 출력합니다. 실행 시간이 tolerance 이상 늘어난 경로 목록을 반환합니다."""
+    regressions = []
+    print(f"{'경로':<10}{'시간(s)':>10}{'기준(s)':>10}{'변화':>9}{'메모리(MB)':>12}{'종목/초':>12}{'봉/초':>14}")
+    for case, res in results.items():
+        base = baseline.get(case) if baseline else None
+        if base:
+            change = res['seconds'] / base['seconds'] - 1 if base['seconds'] else 0
+            base_text, change_text = f"{base['seconds']:.4f}", f"{change * 100:+.1f}%"
+            if change > tolerance:
+                regressions.append(case)
+        else:
+            base_text, change_text = '-', '-'
+        print(f"{case:<10}{res['seconds']:>10.4f}{base_text:>10}{change_text:>9}{res['peak_mb']:>12.1f}"
+              f"{res['tickers_per_sec']:>12,.1f}{res['bars_per_sec']:>14,.1f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="스크리닝/백테스트/업데이트/차트/포트폴리오 벤치마크 (가상 시장, 오프라인)")
+    parser.add_argument('--tickers', type=int, default=200, help="가상 종목 수 (기본값: 200)")
+    parser.add_argument('--days', type=int, default=3000, help="종목당 이력 길이 (거래일, 기본값: 3000)")
+    parser.add_argument('--only', nargs='+', choices=CASES, help="측정할 경로만 지정")
+    parser.add_argument('--repeat', type=int, default=3, help="반복 횟수 (최소 시간 사용, 기본값: 3)")
+    parser.add_argument('--baseline', type=str, default=BASELINE_FILE, help="기준값 파일")
+    parser.add_argument('--save-baseline', action='store_true', help="이번 결과를 기준값으로 저장")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="회귀로 판단할 실행 시간 증가율 (기본값: 0.2)")
+    parser.add_argument('--output', type=str, help="결과를 JSON 으로 저장할 파일")
+    parser.add_argument('--keep', action='store_true', help="가상 시장 작업 폴더를 지우지 않음")
+    args = parser.parse_args()
+
+    print(f"가상 시장: {args.tickers}개 종목 × {args.days}일")
+    results = run_benchmarks(args.tickers, args.days, args.only, args.repeat, args.keep)
+    config = {'tickers': args.tickers, 'days': args.days}
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved.get('config') == config:
+            baseline = saved['results']
+        else:
+            print(f"기준값의 시장 크기가 달라 비교하지 않습니다. (기준: {saved.get('config')})")
+
+    regressions = compare(results, baseline, args.tolerance)
+
+    report = {'config': config, 'created_at': datetime.datetime.now().isoformat(timespec='seconds'), 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"기준값을 '{args.baseline}'에 저장했습니다.")
+
+    if regressions:
+        print(f"느려진 경로: {', '.join(regressions)} (기준 대비 {args.tolerance * 100:.0f}% 이상)")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import FinanceDataReader as fdr
+import numpy as np
+import pandas as pd
+import datetime
+
+import price_store
+import price_catalog
+import indicator_cache
+
+# 대시보드 차트용 종목 데이터 로드 (Streamlit 없이도 호출할 수 있도록 dashboard.py 에서 분리)
+# - 화면에 보일 기간(display_days)과 이동평균/비교용 앞부분만 저장소에서 읽습니다.
+# - 봉 수가 CHART_POINT_BUDGET 을 넘으면 캔들은 주봉/월봉으로 합치고, 선(이동평균 등)은 LTTB 로 줄여서 그립니다.
+# - 결과 목록 그리드의 스파크라인은 전 종목 패널(price_panel)에서 여러 종목을 한 번에 읽습니다.
+
+CHART_POINT_BUDGET = 600  # 차트 한 계열에 그리는 최대 점 수
+SPARKLINE_BARS = 250  # 스파크라인에 그리는 최근 거래일 수
+
+def load_chart_data(ticker, name, window):
+    """
+    종목의 전체 주가 이력에 window 일 이동평균(MA{window}) 컬럼을 붙여 반환합니다.
+    로컬 저장소(price_store/{ticker}.npy, 미변환 종목은 stock_data/{ticker}_{name}.csv)를 우선 사용합니다.
+    """
+    df = price_store.load_prices(ticker, name)
+    if df is None:
+        # 캐시 없으면 다운로드 (혹시 모르니)
+        start_date = (datetime.datetime.now() - datetime.timedelta(days=window*2 + 365)).strftime('%Y-%m-%d')
+        df = fdr.DataReader(ticker, start=start_date)
+
+    # 저장소 종목은 지표 캐시(종가 누적합)에서 이동평균을 읽고, 아니면 직접 계산
+    ma = indicator_cache.moving_average(ticker, window)
+    if ma is not None and len(ma) == len(df):
+        df[f'MA{window}'] = ma
+    else:
+        df[f'MA{window}'] = df['Close'].rolling(window=window).mean()
+    return df
+
+def load_chart_window(ticker, name, window, display_days, compare_days=None):
+    """
+    최근 display_days 거래일의 주가에 MA{window} (와 compare_days 가 있으면 Close_{N}d_ago) 컬럼을 붙여 반환합니다.
+    저장소에서는 display_days + compare_days 행과 누적합 display_days + window 행만 읽습니다.
+    데이터가 없으면 빈 DataFrame
+    """
+    need = display_days + (compare_days or 0)
+    df = price_store.load_prices_tail(ticker, need, name)
+    if df is None:
+        # 캐시 없으면 다운로드 (혹시 모르니)
+        start_date = (datetime.datetime.now() - datetime.timedelta(days=(need + window) * 2 + 365)).strftime('%Y-%m-%d')
+        df = fdr.DataReader(ticker, start=start_date)
+        if df is None or df.empty:
+            return pd.DataFrame()
+        df[f'MA{window}'] = df['Close'].rolling(window=window).mean()
+    else:
+        tail = indicator_cache.moving_average_tail(ticker, window, len(df))
+        if tail is not None and np.array_equal(tail[0], df.index.values.astype('M8[D]')):
+            df[f'MA{window}'] = tail[1]
+        else:
+            # 지표 캐시가 없는 종목 (미변환 CSV 등): 앞부분을 더 읽어 직접 계산
+            full = price_store.load_prices_tail(ticker, need + window - 1, name)
+            df[f'MA{window}'] = full['Close'].rolling(window=window).mean().tail(len(df)).values
+
+    if compare_days:
+        df[f'Close_{compare_days}d_ago'] = df['Close'].shift(compare_days)
+    return df.tail(display_days)
+
+def lttb_indices(y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: 선 모양을 최대한 유지하면서 n_out 개 점의 위치를 고릅니다.
+    x 는 행 번호(거래일 순서)로 봅니다. NaN 은 고르지 않습니다.
+    """
+    valid = np.nonzero(~np.isnan(y))[0]
+    if len(valid) <= n_out or n_out < 3:
+        return valid
+    values = y[valid]
+    selected = [0]
+    # 처음/끝 점을 제외한 점들을 n_out - 2 개 구간으로 나눔
+    edges = np.linspace(1, len(valid) - 1, n_out - 1).astype(np.int64)
+    for b in range(n_out - 2):
+        start, stop = edges[b], edges[b + 1]
+        # 다음 구간의 평균점 (마지막 구간은 끝 점)
+        next_start, next_stop = (edges[b + 1], edges[b + 2]) if b + 2 < len(edges) else (len(valid) - 1, len(valid))
+        avg_x = valid[next_start:next_stop].mean()
+        avg_y = values[next_start:next_stop].mean()
+        a = selected[-1]
+        xs, ys = valid[start:stop], values[start:stop]
+        area = np.abs((valid[a] - avg_x) * (ys - values[a]) - (valid[a] - xs) * (avg_y - values[a]))
+        selected.append(start + int(np.argmax(area)))
+    selected.append(len(valid) - 1)
+    return valid[selected]
+
+def resample_ohlc(df, freq):
+    """
+    일봉 → 주봉('W') 또는 월봉('M'). 시가는 첫 날, 고가/저가는 최댓값/최솟값, 종가는 마지막 날, 거래량은 합계.
+    인덱스는 각 구간의 마지막 거래일입니다.
+    """
+    periods = df.index.to_period(freq)
+    grouped = df.groupby(periods)
+    candles = grouped.agg({'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'})
+    last_dates = pd.Series(df.index, index=df.index).groupby(periods).last()
+    candles.index = pd.DatetimeIndex(last_dates.values, name='Date')
+    return candles
+
+def downsample(df, line_columns=(), max_points=CHART_POINT_BUDGET):
+    """
+    차트에 그릴 데이터를 max_points 이하로 줄입니다.
+    반환: (캔들 DataFrame, {선 컬럼: Series}, 봉 단위 '일봉'/'주봉'/'월봉')
+    - 캔들: 일봉 → 주봉 → 월봉 순으로 max_points 이하가 되는 단위로 합침
+    - 선: 일봉 값을 LTTB 로 max_points 개까지 줄임 (합친 캔들과 달리 고점/저점 모양 유지)
+    """
+    lines = {}
+    for col in line_columns:
+        values = df[col].to_numpy(dtype=np.float64)
+        idx = lttb_indices(values, max_points)
+        lines[col] = pd.Series(values[idx], index=df.index[idx])
+
+    if len(df) <= max_points:
+        return df, lines, '일봉'
+    candles = resample_ohlc(df, 'W')
+    if len(candles) <= max_points:
+        return candles, lines, '주봉'
+    return resample_ohlc(df, 'M'), lines, '월봉'
+
+def load_sparklines(panel, codes, window, bars=SPARKLINE_BARS):
+    """
+    여러 종목의 최근 bars 거래일 종가와 MA{window} 를 패널에서 한 번에 읽습니다. (스파크라인용)
+    반환: (close, ma) — 각각 (bars × 종목) float64 배열. 종목별 마지막 거래일이 마지막 행이며, 없는 칸은 NaN
+    이동평균은 스크리닝과 같이 패널의 누적합으로 계산합니다. (종목 자신의 데이터 행 기준, 데이터가 window 개 미만이면 NaN)
+    패널에 없거나 패널 생성 이후 업데이트된 종목만 저장소에서 종목별로 읽습니다.
+    """
+    cols = panel.ticker_index(codes)
+    close = panel.tail('Close', bars, cols)
+    csum = panel.tail('CloseSum', bars + window, cols)
+    count = panel.tail('Count', bars + window, cols)
+    with np.errstate(invalid='ignore'):
+        filled = count[window:] - count[:-window] == window
+        ma = np.where(filled, (csum[window:] - csum[:-window]) / window, np.nan)
+
+    panel_last = np.where(cols >= 0, panel.last_row[np.maximum(cols, 0)], -1)
+    for i, code in enumerate(codes):
+        last = price_catalog.last_date(code)
+        if panel_last[i] >= 0 and (last is None or np.datetime64(last, 'D') <= panel.dates[panel_last[i]]):
+            continue
+        close[:, i] = ma[:, i] = np.nan
+        df = price_store.load_prices_tail(code, bars + window - 1)
+        if df is None or df.empty:
+            continue
+        values = df['Close'].to_numpy(dtype=np.float64)
+        close[-min(len(values), bars):, i] = values[-bars:]
+        ma_values = df['Close'].rolling(window=window).mean().to_numpy()[-bars:]
+        ma[-len(ma_values):, i] = ma_values
+    return close, ma
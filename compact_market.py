@@ -0,0 +1,214 @@
+import numpy as np
+import pandas as pd
+import argparse
+import sys
+
+import price_store
+import price_catalog
+import screen_engine
+
+# 전 종목 주가 이력의 압축 메모리 표현
+# 종목마다 pandas DataFrame(float64/int64 컬럼 + Change + DatetimeIndex)을 들고 있는 대신,
+# 전 종목을 컬럼별 배열 하나씩으로 이어 붙여 메모리에 올립니다.
+# - 가격(Open/High/Low/Close): int32 (원화 호가는 정수, 최대 약 21억 원)
+# - 거래량(Volume): int64
+# - 날짜(Day): 공유 달력(calendar: 전 종목 거래일의 합집합)의 int32 번호
+# - 등락률(Change): 저장하지 않고 필요할 때 종가로 계산
+# 종목 i 의 행은 offsets[i]:offsets[i+1] 구간이며, 종목 이력(CompactHistory)은 이 구간의 뷰(복사 없음)입니다.
+# 봉당 28바이트 → 약 3,000봉 × 2,900종목이 250MB 정도입니다.
+
+PRICE_FIELDS = ['Open', 'High', 'Low', 'Close']
+FIELDS = ['Day'] + PRICE_FIELDS + ['Volume']
+FIELD_DTYPES = {'Day': np.int32, 'Open': np.int32, 'High': np.int32, 'Low': np.int32,
+                'Close': np.int32, 'Volume': np.int64}
+PRICE_MAX = np.iinfo(np.int32).max
+
+def change(close):
+    """종가 배열 → 등락률 (첫 행은 NaN, pandas pct_change 와 같은 값)"""
+    close = np.asarray(close, dtype=np.float64)
+    result = np.full(len(close), np.nan)
+    if len(close) > 1:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result[1:] = close[1:] / close[:-1] - 1
+    return result
+
+class CompactHistory:
+    """
+    한 종목의 이력 (CompactMarket 배열의 뷰).
+    h['Close'] 처럼 컬럼 배열을 꺼내 쓰며, 'Date' 는 달력 날짜, 'Change' 는 종가로 계산한 등락률입니다.
+    backtest_logic 의 함수에 DataFrame 대신 그대로 넘길 수 있습니다.
+    """
+    __slots__ = ('market', 'code', 'name', '_start', '_stop')
+
+    def __init__(self, market, code, name, start, stop):
+        self.market = market
+        self.code = code
+        self.name = name
+        self._start = start
+        self._stop = stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, field):
+        if field == 'Date':
+            return self.market.calendar[self['Day']]
+        if field == 'Change':
+            return change(self['Close'])
+        return self.market.columns[field][self._start:self._stop]
+
+    @property
+    def dates(self):
+        return self['Date']
+
+    def to_frame(self):
+        """price_store.load_prices 와 같은 형태의 DataFrame (가격은 int64, Change 는 종가로 계산)"""
+        index = pd.DatetimeIndex(self['Date'].astype('M8[ns]'), name='Date')
+        data = {field: self[field].astype(np.int64) for field in PRICE_FIELDS + ['Volume']}
+        data['Change'] = self['Change']
+        return pd.DataFrame(data, index=index)
+
+class CompactMarket:
+    """
+    전 종목 압축 이력.
+    calendar: 공유 달력 (datetime64[D], 오름차순)
+    codes, names: 종목 코드/이름 (같은 순서)
+    offsets: 종목별 행 구간 (len(codes) + 1)
+    columns: {필드: 전 종목을 이어 붙인 1차원 배열} (FIELDS, FIELD_DTYPES)
+    """
+
+    def __init__(self, calendar, codes, names, offsets, columns):
+        self.calendar = calendar
+        self.codes = list(codes)
+        self.names = list(names)
+        self.offsets = offsets
+        self.columns = columns
+        self._index = {code: i for i, code in enumerate(self.codes)}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return code in self._index
+
+    def __iter__(self):
+        for i in range(len(self.codes)):
+            yield self.history(i)
+
+    @property
+    def nbytes(self):
+        """메모리 사용량 (바이트, 배열만)"""
+        return self.calendar.nbytes + self.offsets.nbytes + sum(values.nbytes for values in self.columns.values())
+
+    @property
+    def n_rows(self):
+        return np.diff(self.offsets)
+
+    def history(self, key):
+        """종목 코드 또는 순번 → CompactHistory (없는 코드는 None)"""
+        i = key if isinstance(key, (int, np.integer)) else self._index.get(key)
+        if i is None:
+            return None
+        return CompactHistory(self, self.codes[i], self.names[i], int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def get(self, code, name=None):
+        """price_store.load_prices 처럼 (code, name) 으로 이력을 찾습니다. (없으면 None)"""
+        return self.history(code)
+
+    def last_dates(self):
+        """종목별 마지막 거래일 (datetime64[D], 이력이 없으면 NaT)"""
+        last = self.offsets[1:] - 1
+        has_rows = self.n_rows > 0
+        days = self.columns['Day'][np.maximum(last, 0)]
+        return np.where(has_rows, self.calendar[days], np.datetime64('NaT', 'D'))
+
+    def screen(self, windows, compare_days_list=None, codes=None):
+        """
+        전 종목(또는 codes)의 이동평균 돌파 스크리닝 (screen_engine.screen_arrays 와 같은 조건/결과).
+        종가는 복사 없이 종목별 뷰로 넘깁니다.
+        반환: {(window, compare_days): 결과 DataFrame}
+        """
+        histories = [self.history(i) for i in range(len(self.codes))] if codes is None else \
+                    [h for h in (self.history(code) for code in codes) if h is not None]
+        return screen_engine.screen_arrays([h.code for h in histories], [h.name for h in histories],
+                                           [h['Close'] for h in histories], windows, compare_days_list)
+
+def from_records(records, names=None):
+    """
+    {종목 코드: 저장소 레코드 배열} → CompactMarket
+    가격이 int32 범위를 벗어나면 ValueError
+    """
+    names = names or {}
+    codes = list(records)
+    calendar = np.unique(np.concatenate([rec['Date'] for rec in records.values()])) if records \
+        else np.array([], dtype='M8[D]')
+
+    offsets = np.zeros(len(codes) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(records[code]) for code in codes])
+
+    columns = {}
+    for field in FIELDS:
+        # 필드 하나씩 이어 붙여 변환 중 메모리 사용을 줄임
+        values = np.empty(offsets[-1], dtype=FIELD_DTYPES[field])
+        for i, code in enumerate(codes):
+            rec = records[code]
+            if field == 'Day':
+                values[offsets[i]:offsets[i + 1]] = np.searchsorted(calendar, rec['Date'])
+            else:
+                column = rec[field]
+                if field in PRICE_FIELDS and len(column) and (column.min() < 0 or column.max() > PRICE_MAX):
+                    raise ValueError(f"{code}: {field} 가 int32 범위를 벗어납니다.")
+                values[offsets[i]:offsets[i + 1]] = column
+        columns[field] = values
+    return CompactMarket(calendar, codes, [names.get(code, code) for code in codes], offsets, columns)
+
+def load_market(codes=None, names=None, verbose=True):
+    """
+    저장소의 전 종목(또는 codes)을 압축 표현으로 읽습니다.
+    names: 종목 코드 → 이름 (없으면 카탈로그의 이름, 그것도 없으면 코드)
+    """
+    if codes is None:
+        codes = price_catalog.tickers() or price_store.list_tickers()
+    names = dict(names or {})
+
+    records = {}
+    for i, code in enumerate(codes, 1):
+        rec = price_store.load_records(code)
+        if rec is None:
+            df = price_store.load_prices(code, names.get(code))
+            rec = price_store.to_records(df) if df is not None else None
+        if rec is not None and len(rec):
+            # 레코드(봉당 56바이트)는 바로 압축 컬럼으로 줄여 둠
+            compact = np.empty(len(rec), dtype=[('Date', '<M8[D]')] + [(f, FIELD_DTYPES[f]) for f in FIELDS[1:]])
+            compact['Date'] = rec['Date']
+            for field in FIELDS[1:]:
+                compact[field] = rec[field]
+            records[code] = compact
+        if verbose and (i % 500 == 0 or i == len(codes)):
+            sys.stdout.write(f"\r[{i}/{len(codes)}] 종목 읽는 중...")
+            sys.stdout.flush()
+    if verbose:
+        print()
+
+    for code in records:
+        if code not in names:
+            entry = price_catalog.get(code)
+            names[code] = entry['name'] if entry and entry.get('name') else code
+    return from_records(records, names)
+
+def main():
+    parser = argparse.ArgumentParser(description="전 종목 압축 메모리 표현 생성 및 메모리 사용량 확인")
+    parser.add_argument('--limit', type=int, help="읽을 종목 수 제한 (테스트용)")
+    args = parser.parse_args()
+
+    codes = price_catalog.tickers() or price_store.list_tickers()
+    if args.limit:
+        codes = codes[:args.limit]
+    market = load_market(codes)
+    rows = int(market.offsets[-1])
+    # DataFrame 기준: 가격/거래량 int64 5개 + Change float64 + DatetimeIndex → 봉당 56바이트
+    print(f"{len(market)}개 종목, {rows:,}봉, 달력 {len(market.calendar)}일")
+    print(f"압축 표현: {market.nbytes / 1024 / 1024:,.1f}MB (DataFrame 기준 약 {rows * 56 / 1024 / 1024:,.1f}MB)")
+
+if __name__ == "__main__":
+    main()
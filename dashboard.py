@@ -1,10 +1,10 @@
 import streamlit as st
 import pandas as pd
-import FinanceDataReader as fdr
 import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+import numpy as np
 import datetime
-import subprocess
-import os
+import math
 
 # 페이지 설정
 st.set_page_config(layout="wide", page_title="이동평균선 돌파 종목 분석")
@@ -17,6 +17,20 @@ import threading
 import time
 import datetime
 import update_data  # 데이터 업데이트 모듈 임포트
+import chart_data  # 차트용 종목 데이터
+import screen_service  # 프로세스 내 스크리닝 서비스
+import stock_filter
+import run_metrics  # 실행 단계별 소요 시간 보고서
+import data_cache  # 프로세스 공용 데이터 캐시
+
+@st.cache_resource
+def get_screen_service():
+    """스크리닝 서비스 (서버 프로세스에 하나, 종목 목록/패널은 백그라운드에서 미리 읽어 둠)"""
+    service = screen_service.get_service()
+    threading.Thread(target=service.warm_up, daemon=True).start()
+    return service
+
+get_screen_service()
 
 @st.cache_resource
 def start_background_scheduler():
@@ -35,7 +49,7 @@ def start_background_scheduler():
             
             print("[Scheduler] Starting daily update...")
             try:
-                update_data.main()
+                update_data.main(snapshot=True)
                 print("[Scheduler] Daily update completed.")
             except Exception as e:
                 print(f"[Scheduler] Update failed: {e}")
@@ -86,74 +100,28 @@ with col2:
 window_size = st.session_state.window_size
 should_update = st.sidebar.checkbox("최신 데이터 추가 다운로드 (오늘 날짜 반영)", value=False, help="평소에는 체크를 해제하세요! (매일 밤 자동으로 업데이트됩니다)\n장 마감 직후 등, 오늘 데이터를 즉시 반영해서 보고 싶을 때만 체크하세요.")
 
-# 분석 실행 버튼
+# 분석 실행 버튼: 백그라운드에서 스트리밍 스크리닝 시작 (찾은 종목은 바로 아래 표/차트에 표시)
 if st.sidebar.button("분석 시작"):
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    with st.spinner(f"{window_size}일 이동평균선 기준으로 분석 중입니다... (시간이 다소 소요됩니다)"):
-        try:
-            # 명령어 구성
-            import sys
-            cmd = [sys.executable, "stock_filter.py", "--window", str(window_size)]
-            if should_update:
-                cmd.append("--update")
-
-            # OS에 따른 인코딩 설정
-            encoding_type = 'cp949' if os.name == 'nt' else 'utf-8'
-
-            # stock_filter.py 실행 (Popen으로 실시간 출력 캡처)
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding=encoding_type,
-                bufsize=1 # Line buffered
-            )
-            
-            # 초기 상태 표시
-            status_text.text("데이터 준비 중... (KRX 종목 리스트 다운로드)")
-            
-            # 실시간 출력 읽기
-            while True:
-                # 한 줄씩 읽기
-                line = process.stdout.readline()
-                
-                if not line and process.poll() is not None:
-                    break
-                
-                if line:
-                    line = line.strip()
-                    # 진행률 파싱 (PROGRESS:현재/전체)
-                    if line.startswith("PROGRESS:"):
-                        try:
-                            parts = line.split(":")[1].split("/")
-                            current = int(parts[0])
-                            total = int(parts[1])
-                            progress = current / total
-                            progress_bar.progress(progress)
-                            status_text.text(f"진행 중: {current}/{total} ({progress*100:.1f}%)")
-                        except:
-                            pass
-                    elif "KRX" in line:
-                         status_text.text(line) # KRX 다운로드 메시지 표시
-                    # else:
-                        # print(f"DEBUG: {line}") # 디버깅용
-
-            return_code = process.poll()
-            
-            if return_code == 0:
-                progress_bar.progress(1.0)
-                status_text.text("분석 완료!")
-                st.success("분석이 완료되었습니다!")
-                st.session_state['run_backtest'] = True  # 자동으로 백테스팅 실행
-            else:
-                stderr = process.stderr.read()
-                st.error(f"오류가 발생했습니다:\n{stderr}")
-                
-        except Exception as e:
-            st.error(f"실행 중 오류 발생: {e}")
+    st.session_state['screen_job'] = get_screen_service().start_screen(window_size, update=should_update)
+
+screen_job = st.session_state.get('screen_job')
+screening = screen_job is not None and screen_job.window == window_size
+
+if screening and not screen_job.running:
+    # 작업 완료: 결과 파일 저장 후 자동으로 백테스팅 실행
+    del st.session_state['screen_job']
+    screening = False
+    if screen_job.error is not None:
+        st.error(f"실행 중 오류 발생: {screen_job.error}")
+    else:
+        df_result = screen_job.result()
+        stock_filter.save_result(df_result, window_size, None, f'stocks_above_{window_size}ma.csv')
+        st.success(f"분석이 완료되었습니다! (총 {len(df_result)}개 종목)")
+        st.session_state['run_backtest'] = True
+elif screening:
+    progress = screen_job.done / screen_job.total if screen_job.total else 0.0
+    st.progress(progress, text=f"{window_size}일 이동평균선 기준으로 분석 중... ({screen_job.done}/{screen_job.total}) "
+                               f"- 지금까지 {len(screen_job.result())}개 종목 발견")
 
 st.sidebar.markdown("---")
 st.sidebar.header(f"과거 패턴 분석 ({window_size}일 이평선 기준)")
@@ -164,57 +132,101 @@ st.sidebar.markdown("---")
 st.sidebar.header("과거 가격 비교 설정")
 compare_days = st.sidebar.number_input("과거 비교 기간 (일)", min_value=1, max_value=1000, value=5, help="N일 전 종가가 전일 종가보다 높은 종목을 찾습니다.")
 
+# 마지막 업데이트/분석 실행의 단계별 소요 시간 (run_reports/*_last.json)
+st.sidebar.markdown("---")
+with st.sidebar.expander("마지막 실행 기록"):
+    for kind, label in [('update', "데이터 업데이트"), ('screen', "분석")]:
+        report = run_metrics.last_report(kind)
+        if report is None:
+            st.caption(f"{label}: 기록 없음")
+            continue
+        st.markdown(f"**{label}** ({report['started_at'].replace('T', ' ')}, 총 {report['wall_seconds']:.1f}초)")
+        if report['stages']:
+            st.dataframe(pd.DataFrame([{"단계": stage, "시간 (초)": round(value['seconds'], 2), "횟수": value['calls']}
+                                       for stage, value in report['stages'].items()]), hide_index=True)
+        if report['counters']:
+            st.caption(", ".join(f"{counter}: {value}" for counter, value in sorted(report['counters'].items())))
+        if report['slowest']:
+            st.caption("오래 걸린 종목: " + ", ".join(f"{ticker} ({seconds:.1f}초)" for ticker, seconds in report['slowest'][:5]))
+    cache_stats = data_cache.get_cache().stats()
+    st.caption(f"데이터 캐시: {cache_stats['items']}개, {cache_stats['bytes'] / 1024 / 1024:,.1f}/"
+               f"{cache_stats['budget_bytes'] / 1024 / 1024:,.0f}MB (적중 {cache_stats['hits']}, 실패 {cache_stats['misses']})")
+
 # ... (기존 코드) ... 
 
 # 데이터 파일명 (window size에 따라 다름)
 csv_file = f'stocks_above_{window_size}ma.csv'
 
+# 다른 프로세스(update_data.py 등)가 저장소를 바꿨으면 바뀐 종목의 캐시만 버림 (카탈로그 파일 하나만 확인)
+data_cache.sync_external()
+
 # 데이터 로드 함수
 # 데이터 로드 함수
 def load_data(file_path):
-    try:
-        df = pd.read_csv(file_path)
-        # Code 컬럼을 문자열로 변환하고 6자리로 맞춤
-        df['Code'] = df['Code'].astype(str).str.zfill(6)
-        return df
-    except FileNotFoundError:
-        return pd.DataFrame()
-
-import re
-
-def sanitize_filename(name):
-    """파일명으로 사용할 수 없는 문자를 제거합니다."""
-    return re.sub(r'[\\/*?:"<>|]', "", name)
-
-# 주가 데이터 로드 함수
-@st.cache_data
-def load_stock_data(ticker, name, window, last_modified=None):
-    # 로컬 캐시 확인 ({ticker}_{name}.csv)
-    safe_name = sanitize_filename(name)
-    file_name = f"{ticker}_{safe_name}.csv"
-    cache_path = f'stock_data/{file_name}'
-    
-    # 구형 파일명 호환성 체크
-    old_cache_path = f'stock_data/{ticker}.csv'
-    
-    if os.path.exists(cache_path):
-        df = pd.read_csv(cache_path, parse_dates=['Date'], index_col='Date')
-    elif os.path.exists(old_cache_path):
-        df = pd.read_csv(old_cache_path, parse_dates=['Date'], index_col='Date')
-    else:
-        # 캐시 없으면 다운로드 (혹시 모르니)
-        start_date = (datetime.datetime.now() - datetime.timedelta(days=window*2 + 365)).strftime('%Y-%m-%d')
-        df = fdr.DataReader(ticker, start=start_date)
-    
-    df[f'MA{window}'] = df['Close'].rolling(window=window).mean()
-    return df
+    # 공용 캐시의 결과 표는 공유되므로 복사해서 사용 (Code 는 6자리 문자열)
+    return data_cache.result_table(file_path).copy()
+
+# 주가 데이터 로드 함수 (화면에 보일 기간 + 이동평균/비교용 앞부분만 읽음)
+# 공용 캐시에 종목 태그로 저장 → 업데이트가 종목 파일을 쓰면 해당 종목 차트만 다시 읽음
+def load_stock_data(ticker, name, window, display_days, compare_days=None):
+    return data_cache.get_cache().get(
+        ('chart', ticker, window, display_days, compare_days),
+        lambda: chart_data.load_chart_window(ticker, name, window, display_days, compare_days),
+        tags=[ticker])
+
+# 차트 기간 선택지 (거래일 수, None 은 이동평균 기간에 맞춘 기본값)
+CHART_RANGES = {"기본": None, "1년": 250, "3년": 750, "5년": 1250, "전체": 100000}
+
+# 결과 목록 그리드 (한 페이지에 SPARKLINE_PAGE_SIZE 개 종목, 한 줄에 SPARKLINE_COLUMNS 개)
+SPARKLINE_COLUMNS = 4
+SPARKLINE_PAGE_SIZE = 24
+
+# 결과 목록 전 종목의 스파크라인 배열 (패널에서 한 번에 읽어 공용 캐시에 저장, 종목/결과 파일이 바뀌면 다시 읽음)
+def load_sparklines(result_key, codes, window):
+    return data_cache.get_cache().get(
+        ('sparklines', result_key, tuple(codes), window),
+        lambda: chart_data.load_sparklines(get_screen_service().current_panel(), codes, window),
+        tags=[result_key, *codes])
+
+def render_sparkline_grid(df_stocks, window, result_key):
+    """결과 목록을 종가/이동평균 스파크라인 그리드로 표시 (페이지당 그림 1개)"""
+    n_pages = max(1, math.ceil(len(df_stocks) / SPARKLINE_PAGE_SIZE))
+    page = st.number_input(f"페이지 (전체 {n_pages}쪽, {len(df_stocks)}종목)", min_value=1, max_value=n_pages, value=1)
+    close, ma = load_sparklines(result_key, df_stocks['Code'].tolist(), window)
+
+    start = (page - 1) * SPARKLINE_PAGE_SIZE
+    df_page = df_stocks.iloc[start:start + SPARKLINE_PAGE_SIZE]
+    n_rows = math.ceil(len(df_page) / SPARKLINE_COLUMNS)
+    titles = [f"{row['Name']} ({row['Code']}) {row['Ratio']}%" for _, row in df_page.iterrows()]
+    fig = make_subplots(rows=n_rows, cols=SPARKLINE_COLUMNS, subplot_titles=titles,
+                        vertical_spacing=min(0.3 / n_rows, 0.08), horizontal_spacing=0.03)
+    x = np.arange(close.shape[0])
+    for k, i in enumerate(range(start, start + len(df_page))):
+        row, col = k // SPARKLINE_COLUMNS + 1, k % SPARKLINE_COLUMNS + 1
+        fig.add_trace(go.Scatter(x=x, y=close[:, i], line=dict(color='white', width=1), hoverinfo='skip'), row=row, col=col)
+        fig.add_trace(go.Scatter(x=x, y=ma[:, i], line=dict(color='orange', width=1), hoverinfo='skip'), row=row, col=col)
+
+    fig.update_xaxes(visible=False)
+    fig.update_yaxes(visible=False)
+    fig.update_annotations(font_size=11)
+    fig.update_layout(height=150 * n_rows, showlegend=False, template="plotly_dark",
+                      margin=dict(l=10, r=10, t=30, b=10))
+    st.caption(f"최근 {close.shape[0]}거래일 종가(흰색)와 {window}일 이동평균선(주황색)")
+    st.plotly_chart(fig, use_container_width=True)
 
 # 메인 로직
-df_stocks = load_data(csv_file)
+# 분석 중이면 지금까지 찾은 종목, 아니면 마지막 결과 파일
+df_stocks = screen_job.result() if screening else load_data(csv_file)
 
-if df_stocks.empty:
+if df_stocks.empty and screening:
+    st.info("분석 중입니다. 조건에 맞는 종목이 발견되면 바로 표시됩니다.")
+elif df_stocks.empty:
     st.info(f"아직 {window_size}일 기준 분석 결과가 없습니다. 사이드바의 '분석 시작' 버튼을 눌러주세요.")
 else:
+    view = st.radio("보기", ["종목 상세", "전체 그리드"], horizontal=True, label_visibility="collapsed")
+    if view == "전체 그리드":
+        render_sparkline_grid(df_stocks, window_size, csv_file)
+
     st.sidebar.markdown("---")
     st.sidebar.header("종목 선택")
     
@@ -222,7 +234,7 @@ else:
     stock_options = df_stocks.apply(lambda x: f"{x['Name']} ({x['Code']}) - Ratio: {x['Ratio']}%", axis=1)
     selected_option = st.sidebar.selectbox("종목을 선택하세요", stock_options)
     
-    if selected_option:
+    if selected_option and view == "종목 상세":
         # 선택된 종목 정보 추출
         selected_index = stock_options[stock_options == selected_option].index[0]
         selected_stock = df_stocks.iloc[selected_index]
@@ -243,60 +255,49 @@ else:
 
         # 차트 그리기
         st.subheader(f"주가 및 {window_size}일 이동평균선 차트")
+        chart_range = st.radio("차트 기간", list(CHART_RANGES), horizontal=True, label_visibility="collapsed")
+        # 기본: 최근 400일 (혹은 window에 비례해서)
+        display_days = CHART_RANGES[chart_range] or max(400, window_size + 100)
         
         with st.spinner('차트 데이터를 불러오는 중...'):
-            # 파일 수정 시간 확인 (캐시 무효화용)
-            safe_name = sanitize_filename(name)
-            file_name = f"{ticker}_{safe_name}.csv"
-            cache_path = f'stock_data/{file_name}'
-            old_cache_path = f'stock_data/{ticker}.csv'
-            
-            mtime = 0
-            if os.path.exists(cache_path):
-                mtime = os.path.getmtime(cache_path)
-            elif os.path.exists(old_cache_path):
-                mtime = os.path.getmtime(old_cache_path)
-
-            df_chart = load_stock_data(ticker, name, window_size, mtime)
-            
-
+            df_chart = load_stock_data(ticker, name, window_size, display_days, compare_days)
 
             if not df_chart.empty:
-                # N일 전 주가 (비교용) - tail 자르기 전에 미리 계산해야 함
-                shifted_col = None
-                if compare_days > 0:
-                     shifted_col = f'Close_{compare_days}d_ago'
-                     df_chart[shifted_col] = df_chart['Close'].shift(compare_days)
-
-                # 최근 400일 데이터만 표시 (혹은 window에 비례해서)
-                display_days = max(400, window_size + 100)
-                df_chart = df_chart.tail(display_days)
+                # N일 전 주가 (비교용)
+                shifted_col = f'Close_{compare_days}d_ago' if compare_days > 0 else None
+
+                # 봉이 많으면 주봉/월봉으로 합치고 선은 LTTB 로 줄여서 전송량 제한
+                line_cols = [f'MA{window_size}'] + ([shifted_col] if shifted_col else [])
+                df_candles, lines, bar_unit = chart_data.downsample(df_chart, line_cols)
+                if bar_unit != '일봉':
+                    st.caption(f"{len(df_chart):,}거래일을 {bar_unit}으로 표시합니다.")
                 
                 fig = go.Figure()
                 
                 # 캔들스틱 차트
                 fig.add_trace(go.Candlestick(
-                    x=df_chart.index,
-                    open=df_chart['Open'],
-                    high=df_chart['High'],
-                    low=df_chart['Low'],
-                    close=df_chart['Close'],
+                    x=df_candles.index,
+                    open=df_candles['Open'],
+                    high=df_candles['High'],
+                    low=df_candles['Low'],
+                    close=df_candles['Close'],
                     name='주가'
                 ))
                 
                 # 이동평균선
+                ma_line = lines[f'MA{window_size}']
                 fig.add_trace(go.Scatter(
-                    x=df_chart.index,
-                    y=df_chart[f'MA{window_size}'],
+                    x=ma_line.index,
+                    y=ma_line.values,
                     line=dict(color='orange', width=2),
                     name=f'{window_size}일 이동평균선'
                 ))
 
                 # N일 전 주가 (비교용)
-                if shifted_col and shifted_col in df_chart.columns:
+                if shifted_col:
                      fig.add_trace(go.Scatter(
-                        x=df_chart.index,
-                        y=df_chart[shifted_col],
+                        x=lines[shifted_col].index,
+                        y=lines[shifted_col].values,
                         line=dict(color='cyan', width=1, dash='dot'),
                         name=f'{compare_days}일 전 주가'
                     ))
@@ -314,32 +315,32 @@ else:
             else:
                 st.warning("차트 데이터를 불러올 수 없습니다.")
 
-        # 데이터 테이블 표시
-        st.subheader("전체 필터링 결과")
-        
-        # 정수형으로 변환 (원화 표기 위해 소수점 제거)
-        numeric_cols = ['Close', f'MA{window_size}', 'Prev_Close', f'Prev_MA{window_size}', 'Compare_Price']
-        for col in numeric_cols:
-            if col in df_stocks.columns:
-                df_stocks[col] = df_stocks[col].fillna(0).round(0).astype('int64')
-
-        # 숫자 포맷 설정
-        column_config = {
-            "Close": st.column_config.NumberColumn("Close", format="localized"),
-            f"MA{window_size}": st.column_config.NumberColumn(f"MA{window_size}", format="localized"),
-            "Prev_Close": st.column_config.NumberColumn("Prev_Close", format="localized"),
-            f"Prev_MA{window_size}": st.column_config.NumberColumn(f"Prev_MA{window_size}", format="localized"),
-            "Ratio": st.column_config.NumberColumn("Ratio", format="%.2f%%"),
-        }
-        
-        if 'Compare_Price' in df_stocks.columns:
-            column_config['Compare_Price'] = st.column_config.NumberColumn(f"{compare_days}일 전 종가", format="localized")
+    # 데이터 테이블 표시
+    st.subheader("전체 필터링 결과")
+    
+    # 정수형으로 변환 (원화 표기 위해 소수점 제거)
+    numeric_cols = ['Close', f'MA{window_size}', 'Prev_Close', f'Prev_MA{window_size}', 'Compare_Price']
+    for col in numeric_cols:
+        if col in df_stocks.columns:
+            df_stocks[col] = df_stocks[col].fillna(0).round(0).astype('int64')
+
+    # 숫자 포맷 설정
+    column_config = {
+        "Close": st.column_config.NumberColumn("Close", format="localized"),
+        f"MA{window_size}": st.column_config.NumberColumn(f"MA{window_size}", format="localized"),
+        "Prev_Close": st.column_config.NumberColumn("Prev_Close", format="localized"),
+        f"Prev_MA{window_size}": st.column_config.NumberColumn(f"Prev_MA{window_size}", format="localized"),
+        "Ratio": st.column_config.NumberColumn("Ratio", format="%.2f%%"),
+    }
+    
+    if 'Compare_Price' in df_stocks.columns:
+        column_config['Compare_Price'] = st.column_config.NumberColumn(f"{compare_days}일 전 종가", format="localized")
 
-        st.dataframe(
-            df_stocks,
-            column_config=column_config,
-            hide_index=True
-        )
+    st.dataframe(
+        df_stocks,
+        column_config=column_config,
+        hide_index=True
+    )
 
     # 백테스팅 실행 로직
     if st.session_state.get('run_backtest', False):
@@ -347,38 +348,18 @@ else:
         st.header(f"🔍 과거 패턴 승률 분석 (기준: {window_size}일 이동평균선 돌파)")
         st.info(f"조건: {window_size}일 이동평균선을 어제 종가가 돌파했을 때, 이후 2주(10거래일) 내 10% 이상 상승한 확률")
         
-        import backtest_logic
-        import importlib
-        importlib.reload(backtest_logic)
+        import backtest_runner
         
-        results = []
         progress_text = "이력 분석 중..."
         my_bar = st.progress(0, text=progress_text)
         
-        total_stocks = len(df_stocks)
+        def update_progress(done, total):
+            my_bar.progress(done / total, text=f"이력 분석 중... ({done}/{total})")
         
-        for i, row in df_stocks.iterrows():
-            ticker = row['Code']
-            name = row['Name']
-            
-            # 데이터 로드
-            safe_name = sanitize_filename(name)
-            file_name = f"{ticker}_{safe_name}.csv"
-            file_path = f'stock_data/{file_name}'
-            
-            if os.path.exists(file_path):
-                df_hist = pd.read_csv(file_path, parse_dates=['Date'], index_col='Date').sort_index()
-                
-                # 분석 실행 (MA 기준으로 변경)
-                # window_size 사용
-                res = backtest_logic.analyze_ma_breakout(df_hist, window=window_size, period_days=10, surge_threshold=0.10)
-                
-                if res:
-                    res['Code'] = ticker
-                    res['Name'] = name
-                    results.append(res)
-            
-            my_bar.progress((i + 1) / total_stocks, text=f"{name} 분석 중...")
+        # 종목들을 여러 프로세스에 나눠 병렬 분석 (MA 기준, window_size 사용)
+        df_results = backtest_runner.run_backtest(df_stocks, window=window_size, period_days=10,
+                                                  surge_threshold=0.10, progress=update_progress)
+        results = df_results.to_dict('records')
             
         my_bar.empty()
         st.session_state['run_backtest'] = False # 실행 후 초기화
@@ -431,3 +412,7 @@ else:
         else:
             st.write("승률 70% 이상인 종목이 없습니다.")
 
+# 분석이 진행 중이면 1초 뒤 화면을 다시 그려 새로 찾은 종목을 표시
+if screening:
+    time.sleep(1)
+    st.rerun()
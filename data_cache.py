@@ -0,0 +1,226 @@
+import numpy as np
+import pandas as pd
+import collections
+import os
+import sys
+import threading
+
+import price_store
+import price_catalog
+import indicator_cache
+
+# 프로세스 전체에서 공유하는 데이터 캐시 (대시보드의 차트, 결과 표, 백테스트가 함께 사용)
+# - 메모리 예산(CACHE_BUDGET_MB)을 넘으면 가장 오래 쓰지 않은 항목부터 버립니다. (LRU)
+# - 항목마다 태그(종목 코드, 결과 파일 경로)를 붙여 두고, 데이터를 바꾸는 쪽이 태그 단위로 무효화합니다.
+#   · price_store 가 종목 파일을 쓰면 해당 종목 항목 삭제 (같은 프로세스의 업데이트)
+#   · stock_filter.save_result 가 결과 파일을 쓰면 해당 파일 항목 삭제 (다른 프로세스가 쓴 결과 파일은 수정 시각으로 확인)
+#   · 다른 프로세스의 업데이트는 sync_external() 이 카탈로그 파일 하나만 확인해 바뀐 종목만 삭제
+# - 반환된 객체는 여러 곳에서 공유하므로 수정하지 말고, 필요하면 복사해서 쓰세요.
+
+CACHE_BUDGET_MB = 256
+
+def _size_of(value):
+    """항목 크기 추정 (바이트)"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, tuple):
+        return sum(_size_of(item) for item in value)
+    return sys.getsizeof(value)
+
+class DataCache:
+    """메모리 예산(바이트)이 있는 LRU 캐시. 여러 스레드에서 동시에 사용할 수 있습니다."""
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self._items = collections.OrderedDict()  # 키 → (값, 크기, 태그)
+        self._tags = collections.defaultdict(set)  # 태그 → 키 집합
+        self._generations = collections.Counter()  # 태그 → 무효화 횟수
+        self._epoch = 0  # clear() 횟수 (모든 태그의 무효화로 취급)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def get(self, key, loader, tags=()):
+        """
+        키에 해당하는 값을 돌려줍니다. 없으면 loader() 로 만들어 저장합니다. (None 도 저장)
+        (loader 는 잠금 밖에서 실행되므로 같은 키를 두 스레드가 동시에 만들 수도 있음)
+        읽는 도중 태그가 무효화되면 (업데이트가 파일을 씀) 결과는 돌려주되 저장하지 않습니다.
+        """
+        missing = object()
+        generations = self.generations(tags)
+        value = self.peek(key, missing)
+        if value is not missing:
+            return value
+        value = loader()
+        self.put(key, value, tags, generations)
+        return value
+
+    def peek(self, key, default=None):
+        """저장된 값 (없으면 default)"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def generations(self, tags):
+        """태그별 무효화 횟수. 값을 만들기 전에 받아 put 에 넘기면, 그 사이 무효화(또는 clear)된 값은 저장되지 않습니다."""
+        with self._lock:
+            return self._current_generations(tags)
+
+    def _current_generations(self, tags):
+        return [self._epoch] + [self._generations[tag] for tag in tags]
+
+    def put(self, key, value, tags=(), generations=None):
+        size = _size_of(value)
+        tags = tuple(tags)
+        with self._lock:
+            if generations is not None and generations != self._current_generations(tags):
+                return
+            self._remove(key)
+            if size > self.budget_bytes:
+                return
+            self._items[key] = (value, size, tags)
+            self._bytes += size
+            for tag in tags:
+                self._tags[tag].add(key)
+            while self._bytes > self.budget_bytes:
+                self._remove(next(iter(self._items)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        item = self._items.pop(key, None)
+        if item is None:
+            return
+        _, size, tags = item
+        self._bytes -= size
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, tag):
+        """태그(종목 코드, 파일 경로 등)가 붙은 항목을 모두 버립니다. 반환: 버린 항목 수"""
+        with self._lock:
+            self._generations[tag] += 1
+            keys = list(self._tags.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._items.clear()
+            self._tags.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """항목 수, 사용량, 적중/실패/제거 횟수"""
+        with self._lock:
+            return {'items': len(self._items), 'bytes': self._bytes, 'budget_bytes': self.budget_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """프로세스 전체에서 공유하는 캐시 (처음 호출 시 생성)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DataCache(CACHE_BUDGET_MB * 1024 * 1024)
+        return _cache
+
+def invalidate(tag):
+    """태그가 붙은 항목을 버립니다. (캐시를 아직 만들지 않았으면 아무것도 하지 않음)"""
+    if _cache is not None:
+        _cache.invalidate(tag)
+
+# --- 다른 프로세스의 업데이트 감지 ---
+
+_catalog_key = None
+_seen_mtimes = {}
+_sync_lock = threading.Lock()
+
+def sync_external():
+    """
+    카탈로그 파일이 바뀌었으면 (다른 프로세스가 업데이트) 다시 읽고, 수정 시각이 바뀐 종목의 항목만 버립니다.
+    카탈로그 파일 하나만 확인하므로 화면을 그릴 때마다 호출해도 됩니다. 반환: 바뀐 종목 수
+    """
+    global _catalog_key, _seen_mtimes
+    try:
+        stat = os.stat(price_catalog.catalog_path())
+    except FileNotFoundError:
+        return 0
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _sync_lock:
+        if key == _catalog_key:
+            return 0
+        _catalog_key = key
+        if not price_catalog.has_unsaved_changes():
+            # 이 프로세스에 저장하지 않은 변경이 있으면 메모리 사본이 더 최신이므로 그대로 사용
+            price_catalog.reload()
+        mtimes = price_catalog.mtimes()
+        changed = [ticker for ticker in set(mtimes) | set(_seen_mtimes) if mtimes.get(ticker) != _seen_mtimes.get(ticker)]
+        _seen_mtimes = mtimes
+    for ticker in changed:
+        invalidate(ticker)
+    return len(changed)
+
+# --- 공용 조회 함수 ---
+
+def prices(ticker, name=None):
+    """종목의 전체 주가 이력 (price_store.load_prices, 없으면 None)"""
+    return get_cache().get(('prices', ticker), lambda: price_store.load_prices(ticker, name), tags=[ticker])
+
+def moving_average(ticker, window):
+    """저장소 레코드 순서의 window 일 이동평균 배열 (indicator_cache.moving_average, 없으면 None)"""
+    return get_cache().get(('ma', ticker, window), lambda: indicator_cache.moving_average(ticker, window),
+                           tags=[ticker])
+
+def _file_version(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def result_table(path):
+    """
+    스크리닝 결과 CSV (Code 는 6자리 문자열, 파일이 없으면 빈 DataFrame)
+    결과 파일은 stock_filter.py 를 따로 실행해도 바뀌므로 파일 하나의 수정 시각을 함께 확인합니다.
+    """
+    def load():
+        version = _file_version(path)
+        try:
+            df = pd.read_csv(path, dtype={'Code': str})
+        except FileNotFoundError:
+            return version, pd.DataFrame()
+        df['Code'] = df['Code'].str.zfill(6)
+        return version, df
+
+    cache = get_cache()
+    version, df = cache.get(('results', path), load, tags=[path])
+    if version != _file_version(path):
+        cache.invalidate(path)
+        version, df = cache.get(('results', path), load, tags=[path])
+    return df
@@ -0,0 +1,140 @@
+import FinanceDataReader as fdr
+import numpy as np
+import pandas as pd
+import atexit
+import itertools
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+
+import price_store
+import run_metrics
+
+# 데이터 수집용 상주 워커 프로세스 풀
+# - 종목마다 프로세스를 새로 띄우는 대신, 미리 띄워 둔 워커에 작업을 보냅니다.
+# - 작업마다 타임아웃을 적용하고, 응답이 없는 워커는 강제 종료 후 새 워커로 교체합니다.
+# - 결과 DataFrame 은 파이프로 피클링하지 않고, 워커가 임시 .npy 파일로 저장한 뒤 경로만 전달합니다.
+
+def _worker_loop(tasks, results, result_dir):
+    """워커 프로세스: 작업(task_id, ticker, start_date)을 받아 결과 파일 경로를 돌려줌"""
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, ticker, start_date = task
+        try:
+            df = fdr.DataReader(ticker, start=start_date)
+            if df is None or df.empty:
+                results.put((task_id, None))
+                continue
+            path = os.path.join(result_dir, f"{task_id}.npy")
+            np.save(path, price_store.to_records(df))
+            results.put((task_id, path))
+        except Exception:
+            results.put((task_id, None))
+
+class _Worker:
+    def __init__(self, ctx, result_dir):
+        self.tasks = ctx.Queue()
+        self.results = ctx.Queue()
+        self.process = ctx.Process(target=_worker_loop, args=(self.tasks, self.results, result_dir), daemon=True)
+        self.process.start()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join(timeout=5)
+
+class FetchPool:
+    """
+    fdr.DataReader 호출을 상주 워커 프로세스에서 실행하는 풀.
+    fetch() 는 여러 스레드에서 동시에 호출할 수 있습니다.
+    """
+
+    def __init__(self, processes=4):
+        # spawn: 스레드가 도는 중에 워커를 교체해도 안전하도록 fork 대신 사용
+        self._ctx = multiprocessing.get_context('spawn')
+        self._result_dir = tempfile.mkdtemp(prefix='fetch_pool_')
+        self._ids = itertools.count()
+        self._idle = queue.Queue()
+        self._closed = False
+        for _ in range(processes):
+            self._idle.put(_Worker(self._ctx, self._result_dir))
+        self.processes = processes
+
+    def fetch(self, ticker, start_date, timeout=10):
+        """종목 데이터를 가져옵니다. 실패하거나 timeout 초 안에 응답이 없으면 빈 DataFrame"""
+        with run_metrics.stage('fetch', ticker):
+            df = self._fetch(ticker, start_date, timeout)
+        if df.empty:
+            run_metrics.count('empty_fetches', ticker=ticker)
+        return df
+
+    def _fetch(self, ticker, start_date, timeout):
+        worker = self._idle.get()
+        try:
+            if not worker.process.is_alive():
+                worker = _Worker(self._ctx, self._result_dir)
+
+            task_id = next(self._ids)
+            worker.tasks.put((task_id, ticker, start_date))
+            try:
+                result_id, path = worker.results.get(timeout=timeout)
+            except queue.Empty:
+                # 타임아웃: 멈춘 워커를 종료하고 새 워커로 교체
+                run_metrics.count('timeouts', ticker=ticker)
+                worker.kill()
+                worker = _Worker(self._ctx, self._result_dir)
+                return pd.DataFrame()
+
+            if result_id != task_id or path is None:
+                # 이전 작업의 늦은 결과: 워커가 쓴 임시 파일은 지움
+                if path is not None and os.path.exists(path):
+                    os.remove(path)
+                return pd.DataFrame()
+            try:
+                return price_store.from_records(np.load(path))
+            finally:
+                os.remove(path)
+        except Exception:
+            run_metrics.count('failures', ticker=ticker)
+            return pd.DataFrame()
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for _ in range(self.processes):
+            worker = self._idle.get()
+            try:
+                worker.tasks.put(None)
+                worker.process.join(timeout=5)
+            finally:
+                worker.kill()
+        shutil.rmtree(self._result_dir, ignore_errors=True)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool(processes=4):
+    """프로세스 전체에서 공유하는 풀 (처음 호출 시 생성)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = FetchPool(processes)
+        return _pool
+
+def shutdown():
+    """공유 풀의 워커를 모두 종료합니다. (다음 get_pool 호출 시 다시 생성)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+atexit.register(shutdown)
@@ -0,0 +1,170 @@
+import numpy as np
+import argparse
+import os
+import sys
+
+import price_store
+import price_catalog
+import run_metrics
+
+# 설정
+CACHE_DIR = 'indicator_cache'  # 종목별 지표 캐시 ({ticker}.npy)
+
+# 종목별 종가 누적합을 저장소 레코드와 같은 순서로 저장합니다.
+# 어떤 window 의 이동평균이든 MA[i] = (CloseSum[i] - CloseSum[i-window]) / window 로 봉당 O(1) 에 구합니다.
+# - 저장소에 새 봉이 덧붙여지면 마지막 누적합에 이어서 새 행만 추가합니다. (price_store 가 호출)
+# - 수정된 봉으로 저장소 파일을 다시 쓰면 누적합도 다시 만듭니다.
+# - 종가는 정수이므로 누적합도 정수(int64)로 저장해 오차가 없습니다.
+SUM_DTYPE = np.dtype([
+    ('Date', '<M8[D]'),
+    ('CloseSum', '<i8'),
+])
+
+def cache_path(ticker):
+    return os.path.join(CACHE_DIR, f"{ticker}.npy")
+
+def _sums(rec, base=0):
+    """레코드 배열 → 누적합 배열 (base: 직전 행까지의 누적합)"""
+    sums = np.empty(len(rec), dtype=SUM_DTYPE)
+    sums['Date'] = rec['Date']
+    sums['CloseSum'] = base + np.cumsum(rec['Close'], dtype=np.int64)
+    return sums
+
+def rebuild(ticker, rec=None):
+    """저장소 레코드 전체로 누적합을 새로 만듭니다. (저장소에 없으면 캐시 삭제 후 None)"""
+    with run_metrics.stage('indicator', ticker):
+        return _rebuild(ticker, rec)
+
+def _rebuild(ticker, rec):
+    if rec is None:
+        rec = price_store.load_records(ticker)
+    if rec is None:
+        if os.path.exists(cache_path(ticker)):
+            os.remove(cache_path(ticker))
+        return None
+    sums = _sums(rec)
+    price_store._atomic_save(cache_path(ticker), sums)
+    return sums
+
+def extend(ticker, new_rec):
+    """
+    저장소 끝에 덧붙인 새 레코드만큼 누적합을 이어 붙입니다.
+    캐시가 없거나 저장소와 어긋나 있으면 전체를 다시 만듭니다.
+    """
+    if len(new_rec) == 0:
+        return
+    with run_metrics.stage('indicator', ticker):
+        _extend(ticker, new_rec)
+
+def _extend(ticker, new_rec):
+    path = cache_path(ticker)
+    try:
+        with open(path, 'rb') as f:
+            _, n_rows, dtype, offset = price_store._read_header(f)
+            if dtype == SUM_DTYPE and n_rows > 0:
+                f.seek(offset + (n_rows - 1) * dtype.itemsize)
+                last = np.frombuffer(f.read(dtype.itemsize), dtype=dtype)[0]
+            else:
+                last = None
+    except FileNotFoundError:
+        last = None
+
+    # 저장소의 직전 마지막 봉까지 캐시가 맞춰져 있어야 이어 붙일 수 있음
+    entry = price_catalog.get(ticker)
+    aligned = (last is not None and entry is not None and
+               entry['rows'] == n_rows + len(new_rec) and last['Date'] < new_rec['Date'][0])
+    if aligned and price_store._append_in_place(path, _sums(new_rec, base=int(last['CloseSum']))):
+        return
+    rebuild(ticker)
+
+def load(ticker, rec=None):
+    """
+    종목의 누적합 배열을 읽습니다. (저장소에 없으면 None)
+    캐시가 없거나 저장소(카탈로그 또는 rec)와 행 수/마지막 날짜가 다르면 다시 만듭니다.
+    """
+    path = cache_path(ticker)
+    sums = np.load(path) if os.path.exists(path) else None
+
+    if sums is not None:
+        if rec is not None:
+            valid = len(sums) == len(rec) and (len(rec) == 0 or sums['Date'][-1] == rec['Date'][-1])
+        else:
+            entry = price_catalog.get(ticker)
+            valid = (entry is not None and len(sums) == entry['rows'] and
+                     (len(sums) == 0 or str(sums['Date'][-1]) == entry['last_date']))
+        if valid:
+            return sums
+    return rebuild(ticker, rec)
+
+def load_tail(ticker, n):
+    """
+    누적합 배열의 마지막 n 행만 읽습니다. (저장소에 없으면 None)
+    캐시가 카탈로그와 행 수/마지막 날짜가 다르면 전체를 다시 만든 뒤 자릅니다.
+    """
+    path = cache_path(ticker)
+    entry = price_catalog.get(ticker)
+    if entry is not None and os.path.exists(path):
+        with open(path, 'rb') as f:
+            _, n_rows, dtype, _ = price_store._read_header(f)
+        if dtype == SUM_DTYPE and n_rows == entry['rows']:
+            sums = price_store._read_tail(path, n)
+            if len(sums) == 0 or str(sums['Date'][-1]) == entry['last_date']:
+                return sums
+    sums = load(ticker)
+    return sums[-n:] if sums is not None else None
+
+def moving_average_tail(ticker, window, n):
+    """
+    저장소 마지막 n 행의 window 일 이동평균: (날짜 배열, 이동평균 배열) (저장소에 없으면 None)
+    누적합은 n + window 행만 읽습니다.
+    """
+    sums = load_tail(ticker, n + window)
+    if sums is None:
+        return None
+    close_sum = sums['CloseSum']
+    if len(close_sum) < n + window:
+        # 이력 전체를 읽은 경우: 앞쪽 window-1 행은 NaN
+        ma = ma_from_sums(close_sum, window)
+    else:
+        ma = (close_sum[window:] - close_sum[:-window]) / window
+    return sums['Date'][-n:], ma[-n:]
+
+def moving_average(ticker, window, rec=None):
+    """
+    저장소 레코드 순서에 맞춘 window 일 이동평균 배열 (앞쪽 window-1 개는 NaN).
+    df['Close'].rolling(window).mean() 과 같은 값입니다. (저장소에 없으면 None)
+    """
+    sums = load(ticker, rec)
+    if sums is None:
+        return None
+    return ma_from_sums(sums['CloseSum'], window)
+
+def ma_from_sums(close_sum, window):
+    """누적합 배열 → 이동평균 배열 (앞쪽 window-1 개는 NaN)"""
+    n = len(close_sum)
+    ma = np.full(n, np.nan)
+    if window < 1 or n < window:
+        return ma
+    upper = close_sum[window - 1:]
+    lower = np.concatenate([[0], close_sum[:n - window]])
+    ma[window - 1:] = (upper - lower) / window
+    return ma
+
+def main():
+    parser = argparse.ArgumentParser(description="종목별 지표(종가 누적합) 캐시 관리")
+    parser.add_argument('--rebuild', action='store_true', help="저장소 전 종목의 캐시를 새로 생성")
+    args = parser.parse_args()
+
+    tickers = price_catalog.tickers() or price_store.list_tickers()
+    for i, ticker in enumerate(tickers, 1):
+        if args.rebuild:
+            rebuild(ticker)
+        else:
+            load(ticker)
+        if i % 100 == 0 or i == len(tickers):
+            sys.stdout.write(f"\r[{i}/{len(tickers)}] 지표 캐시 확인 중...")
+            sys.stdout.flush()
+    print(f"\n{len(tickers)}개 종목의 지표 캐시가 '{CACHE_DIR}'에 준비되었습니다.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import FinanceDataReader as fdr
+import pandas as pd
+import argparse
+import datetime
+import os
+
+# KRX 종목 목록(유니버스) 로더
+# - fdr.StockListing('KRX') 결과를 로컬 캐시(krx_universe.pkl, Code 는 문자열)에 저장하고
+#   거래일마다 최대 한 번만 새로 받습니다. (주말에는 직전 금요일에 받은 목록을 그대로 사용)
+# - 네트워크가 안 되면 오래된 캐시 → krx_stocks.csv(generate_krx_list.py) 순으로 읽습니다.
+# - 새로 받을 때마다 이전 목록과 비교해 신규 상장/상장 폐지 종목을 krx_universe_changes.csv 에 기록합니다.
+# - KRX 전체 조회가 실패해 KOSPI/KOSDAQ 만 받은 목록(KONEX 누락)은 일부 목록이므로
+#   변경을 기록하지 않고, 전체 목록 캐시를 덮어쓰지도 않습니다. (KONEX 종목이 폐지로 기록되지 않도록)
+
+CACHE_FILE = 'krx_universe.pkl'
+CHANGES_FILE = 'krx_universe_changes.csv'
+FALLBACK_CSV = 'krx_stocks.csv'
+
+def last_trading_day(now=None):
+    """now 기준 가장 최근 거래일 (주말이면 직전 금요일, 공휴일은 고려하지 않음)"""
+    day = (now or datetime.datetime.now()).date()
+    while day.weekday() >= 5:
+        day -= datetime.timedelta(days=1)
+    return day
+
+def _read_cache():
+    """캐시 → (종목 목록 DataFrame, 받은 시각, 전체 목록 여부) (없거나 깨졌으면 (None, None, False))"""
+    try:
+        cached = pd.read_pickle(CACHE_FILE)
+        return cached['stocks'], cached['fetched_at'], cached.get('complete', True)
+    except Exception:
+        return None, None, False
+
+def _write_cache(stocks, fetched_at, complete=True):
+    tmp_path = f"{CACHE_FILE}.{os.getpid()}.tmp"
+    pd.to_pickle({'stocks': stocks, 'fetched_at': fetched_at, 'complete': complete}, tmp_path)
+    os.replace(tmp_path, CACHE_FILE)
+
+def is_fresh(fetched_at, now=None, ttl_hours=None):
+    """
+    캐시를 그대로 써도 되는지 확인합니다.
+    ttl_hours 를 지정하면 받은 지 ttl_hours 시간 이내인지, 아니면 최근 거래일 이후에 받았는지로 판단합니다.
+    """
+    if fetched_at is None:
+        return False
+    now = now or datetime.datetime.now()
+    if ttl_hours is not None:
+        return now - fetched_at < datetime.timedelta(hours=ttl_hours)
+    return fetched_at.date() >= last_trading_day(now)
+
+def _normalize(stocks):
+    """Code 를 6자리 문자열로 맞추고 중복 종목을 제거합니다."""
+    stocks = stocks.copy()
+    stocks['Code'] = stocks['Code'].astype(str).str.zfill(6)
+    return stocks.drop_duplicates('Code').reset_index(drop=True)
+
+def _fetch():
+    """
+    네트워크에서 전 종목 목록을 받습니다. (KRX 전체 → KOSPI/KOSDAQ 개별 조회 순)
+    반환: (종목 목록, 전체 목록 여부) (KOSPI/KOSDAQ 개별 조회는 KONEX 가 빠지므로 False)
+    """
+    try:
+        return fdr.StockListing('KRX'), True
+    except Exception as e:
+        print(f"KRX 전체 리스트 가져오기 실패 ({e}), KOSPI/KOSDAQ 개별 조회로 시도합니다...")
+        kospi = fdr.StockListing('KOSPI')
+        kosdaq = fdr.StockListing('KOSDAQ')
+        return pd.concat([kospi, kosdaq]), False
+
+def _log_changes(old, new, when):
+    """이전/새 목록을 비교해 신규 상장·상장 폐지 종목을 변경 기록에 추가합니다. 반환: 추가된 기록 DataFrame"""
+    old_codes = set(old['Code'])
+    new_codes = set(new['Code'])
+    listed = new[new['Code'].isin(new_codes - old_codes)]
+    delisted = old[old['Code'].isin(old_codes - new_codes)]
+
+    changes = pd.concat([
+        pd.DataFrame({'Date': when.strftime('%Y-%m-%d'), 'Code': listed['Code'], 'Name': listed['Name'], 'Change': 'listed'}),
+        pd.DataFrame({'Date': when.strftime('%Y-%m-%d'), 'Code': delisted['Code'], 'Name': delisted['Name'], 'Change': 'delisted'}),
+    ], ignore_index=True)
+    if not changes.empty:
+        changes.to_csv(CHANGES_FILE, mode='a', index=False, header=not os.path.exists(CHANGES_FILE), encoding='utf-8-sig')
+    return changes
+
+def refresh():
+    """
+    네트워크에서 목록을 새로 받아 캐시를 갱신합니다.
+    반환: (종목 목록, 이번에 기록된 상장/폐지 변경 DataFrame)
+    일부 목록(KOSPI/KOSDAQ 만)을 받았으면 변경은 비어 있고, 이전 전체 목록 캐시는 그대로 둡니다.
+    """
+    now = datetime.datetime.now()
+    listing, complete = _fetch()
+    stocks = _normalize(listing)
+    old, _, old_complete = _read_cache()
+    if complete and old is not None and old_complete:
+        changes = _log_changes(old, stocks, now)
+    else:
+        changes = pd.DataFrame(columns=['Date', 'Code', 'Name', 'Change'])
+        if not complete:
+            print("KONEX 가 빠진 목록이므로 상장/폐지 변경을 기록하지 않습니다.")
+    if complete or not old_complete:
+        _write_cache(stocks, now, complete)
+    return stocks, changes
+
+def load_universe(refresh_cache=False, offline=False, ttl_hours=None, verbose=True):
+    """
+    전 종목 목록 (Code 는 문자열).
+    - 캐시가 최신이면 (offline 이면 항상) 캐시를 그대로 사용
+    - 아니면 새로 받고, 실패하면 오래된 캐시 → krx_stocks.csv 순으로 사용
+    refresh_cache: 캐시가 최신이어도 새로 받음 (업데이트 등 당일 시세가 필요한 경우)
+    """
+    stocks, fetched_at, _ = _read_cache()
+    if stocks is not None and (offline or (not refresh_cache and is_fresh(fetched_at, ttl_hours=ttl_hours))):
+        if verbose:
+            print(f"캐시된 종목 목록 사용: {len(stocks)}개 ({fetched_at:%Y-%m-%d %H:%M} 기준)")
+        return stocks
+
+    if not offline:
+        try:
+            if verbose:
+                print("KRX 상장 종목을 가져오는 중...")
+            stocks, changes = refresh()
+            if verbose and not changes.empty:
+                counts = changes['Change'].value_counts()
+                print(f"종목 변경: 신규 상장 {counts.get('listed', 0)}개, 상장 폐지 {counts.get('delisted', 0)}개")
+            return stocks
+        except Exception as e:
+            print(f"종목 목록 다운로드 실패: {e}")
+
+    if stocks is not None:
+        print(f"오래된 캐시의 종목 목록을 사용합니다. ({fetched_at:%Y-%m-%d %H:%M} 기준)")
+        return stocks
+
+    # 최후의 수단: 로컬 파일(krx_stocks.csv) 로드
+    print(f"로컬 '{FALLBACK_CSV}' 파일에서 종목 리스트를 읽어옵니다...")
+    return _normalize(pd.read_csv(FALLBACK_CSV, dtype={'Code': str}))  # Code는 문자열로 읽어야 함 (005930 유지)
+
+def changes_since(date=None):
+    """변경 기록 (date 이후만, 없으면 빈 DataFrame): Date, Code, Name, Change('listed'/'delisted')"""
+    try:
+        changes = pd.read_csv(CHANGES_FILE, dtype={'Code': str})
+    except FileNotFoundError:
+        return pd.DataFrame(columns=['Date', 'Code', 'Name', 'Change'])
+    if date is not None:
+        changes = changes[changes['Date'] >= str(date)]
+    return changes
+
+def main():
+    parser = argparse.ArgumentParser(description="KRX 종목 목록 캐시 관리")
+    parser.add_argument('--refresh', action='store_true', help="캐시가 최신이어도 새로 받기")
+    parser.add_argument('--offline', action='store_true', help="네트워크 없이 캐시만 사용")
+    parser.add_argument('--changes', type=str, nargs='?', const='', help="상장/폐지 변경 기록 출력 (YYYY-MM-DD 이후)")
+    args = parser.parse_args()
+
+    if args.changes is not None:
+        print(changes_since(args.changes or None).to_string(index=False))
+        return
+    stocks = load_universe(refresh_cache=args.refresh, offline=args.offline)
+    print(f"{len(stocks)}개의 종목")
+
+if __name__ == "__main__":
+    main()
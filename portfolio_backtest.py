@@ -0,0 +1,235 @@
+import numpy as np
+import pandas as pd
+import argparse
+import datetime
+import math
+import time
+
+import price_panel
+import price_catalog
+import screen_engine
+
+# 포트폴리오 백테스트: 매일 장 마감 후 이동평균 돌파 스크리닝 결과를 실제로 매매했다고 보고 다시 재생합니다.
+# (backtest_logic 은 종목별 "신호 후 N일 안에 고가 +10%" 적중률만 보므로 동시 보유, 자금, 청산을 고려하지 않음)
+# - 신호: screen_engine.signal_blocks 로 전 종목 × 전 기간을 배열로 한 번에 평가 (종목별 DataFrame 없음)
+# - 진입: 신호 다음 거래일 시가, 이격도(Ratio) 순으로 빈 자리(top_n)만큼, 자리당 전일 평가금액 / top_n
+# - 청산: 손절(stop) → 목표(target) → 보유 기간(period_days 거래일째 종가) 순으로 확인
+#         시가가 이미 손절/목표가를 넘으면 시가, 장중에 닿으면 해당 가격 (같은 날 둘 다 닿으면 손절로 봄)
+#         데이터가 끝난 종목(상장 폐지 등)은 마지막 종가에 청산
+#         거래정지일 봉(시가/고가/저가 0, 거래량 0, 종가는 전일 값)은 거래 없는 날로 보고 종가로 평가만 함
+# - 비용: 매수/매도 수수료(fee), 매도 시 거래세(tax)
+
+DEFAULT_CAPITAL = 100_000_000
+DEFAULT_FEE = 0.00015
+DEFAULT_TAX = 0.0018
+
+def _candidates(panel, cols, window, row_start, row_stop, ascending=False):
+    """행(신호 발생일)별 진입 후보 종목 위치 (cols 기준, Ratio 순)"""
+    candidates = {}
+    # 진입은 다음 날이므로 마지막 행의 신호는 쓰지 않음
+    for b0, selected, latest_close, _, _, latest_ma, _ in \
+            screen_engine.signal_blocks(panel, cols, window, row_start, row_stop - 1):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = latest_close / latest_ma - 1
+        for r in np.nonzero(selected.any(axis=1))[0]:
+            js = np.nonzero(selected[r])[0]
+            order = np.argsort(ratio[r, js] if ascending else -ratio[r, js], kind='stable')
+            candidates[b0 + r] = js[order]
+    return candidates
+
+def run_portfolio(panel, stocks, window, top_n=10, target=0.10, stop=0.05, period_days=10, start=None, end=None,
+                  capital=DEFAULT_CAPITAL, fee=DEFAULT_FEE, tax=DEFAULT_TAX, ascending=False):
+    """
+    stocks(Code, Name) 로 포트폴리오 매매를 재생합니다. target/stop 이 0 이나 None 이면 해당 청산 규칙은 쓰지 않습니다.
+    반환: (일별 자산 DataFrame, 매매 내역 DataFrame, 요약 dict)
+    """
+    codes = np.array(stocks['Code'].tolist(), dtype=object)
+    names = np.array(stocks['Name'].tolist(), dtype=object)
+    cols = panel.ticker_index(codes)
+    keep = cols >= 0
+    codes, names, cols = codes[keep], names[keep], cols[keep]
+    last_row = panel.last_row[cols]
+    final_row = panel.last_row.max()  # 이 행보다 먼저 데이터가 끝난 종목은 상장 폐지 등으로 봄
+
+    row_start = int(np.searchsorted(panel.dates, np.datetime64(start or panel.dates[0], 'D'), side='left'))
+    row_stop = int(np.searchsorted(panel.dates, np.datetime64(end or panel.dates[-1], 'D'), side='right'))
+    # 첫날도 전일 신호로 진입할 수 있도록 신호는 하루 앞부터 계산
+    candidates = _candidates(panel, cols, window, max(row_start - 1, 0), row_stop, ascending)
+
+    fields = {name: panel.field(name) for name in ['Open', 'High', 'Low', 'Close', 'Volume']}
+    cash = float(capital)
+    equity = float(capital)
+    positions = []  # dict: j, shares, entry_price, entry_row, days, last_close
+    trades = []
+    equity_rows = []
+    traded_value = 0.0
+
+    def close_position(pos, row, price, reason):
+        nonlocal cash, traded_value
+        proceeds = pos['shares'] * price
+        cash += proceeds * (1 - fee - tax)
+        traded_value += proceeds
+        cost = pos['shares'] * pos['entry_price'] * (1 + fee)
+        trades.append({
+            'Code': codes[pos['j']], 'Name': names[pos['j']],
+            'EntryDate': panel.dates[pos['entry_row']], 'EntryPrice': pos['entry_price'],
+            'ExitDate': panel.dates[row], 'ExitPrice': price, 'Shares': pos['shares'],
+            'Days': pos['days'], 'Return': round((proceeds * (1 - fee - tax) / cost - 1) * 100, 2),
+            'Reason': reason,
+        })
+
+    for row in range(row_start, row_stop):
+        values = {name: field[row][cols] for name, field in fields.items()}
+        open_, high, low, close = values['Open'], values['High'], values['Low'], values['Close']
+        # 실제로 거래된 봉 (거래정지일은 시가/고가/저가가 0 이고 거래량이 0)
+        with np.errstate(invalid='ignore'):
+            traded = (open_ > 0) & (high > 0) & (low > 0) & (values['Volume'] > 0)
+
+        # 1) 전일 신호 종목 진입 (오늘 청산으로 생기는 자리/현금은 내일부터 사용)
+        held = {pos['j'] for pos in positions}
+        slot_value = equity / top_n
+        for j in candidates.get(row - 1, ()):
+            if len(positions) >= top_n:
+                break
+            price = open_[j]
+            if j in held or not traded[j]:
+                continue
+            shares = math.floor(min(slot_value, cash) / (price * (1 + fee)))
+            if shares == 0:
+                continue
+            cash -= shares * price * (1 + fee)
+            traded_value += shares * price
+            positions.append({'j': j, 'shares': shares, 'entry_price': price, 'entry_row': row, 'days': 0,
+                              'last_close': price})
+            held.add(j)
+
+        # 2) 청산 확인
+        remaining = []
+        for pos in positions:
+            j = pos['j']
+            if np.isnan(close[j]):
+                # 거래 없는 날 (거래정지 등): 데이터가 끝난 종목만 마지막 종가에 청산
+                if row > last_row[j]:
+                    close_position(pos, row, pos['last_close'], 'delisted')
+                else:
+                    remaining.append(pos)
+                continue
+            if not traded[j]:
+                # 거래정지일: 청산 조건은 보지 않고 종가로 평가 (데이터가 끝나면 그 종가에 청산)
+                if close[j] > 0:
+                    pos['last_close'] = close[j]
+                if row == last_row[j] and row < final_row:
+                    close_position(pos, row, pos['last_close'], 'delisted')
+                else:
+                    remaining.append(pos)
+                continue
+
+            pos['days'] += 1
+            stop_price = pos['entry_price'] * (1 - stop) if stop else None
+            target_price = pos['entry_price'] * (1 + target) if target else None
+            gap = pos['entry_row'] != row  # 진입일 시가는 진입가
+            exit_price = reason = None
+            if gap and stop_price is not None and open_[j] <= stop_price:
+                exit_price, reason = open_[j], 'stop'
+            elif gap and target_price is not None and open_[j] >= target_price:
+                exit_price, reason = open_[j], 'target'
+            elif stop_price is not None and low[j] <= stop_price:
+                exit_price, reason = stop_price, 'stop'
+            elif target_price is not None and high[j] >= target_price:
+                exit_price, reason = target_price, 'target'
+            elif pos['days'] >= period_days:
+                exit_price, reason = close[j], 'time'
+            elif row == last_row[j] and row < final_row:
+                exit_price, reason = close[j], 'delisted'
+
+            if reason is None:
+                pos['last_close'] = close[j]
+                remaining.append(pos)
+            else:
+                close_position(pos, row, exit_price, reason)
+        positions = remaining
+
+        invested = sum(pos['shares'] * pos['last_close'] for pos in positions)
+        equity = cash + invested
+        equity_rows.append((panel.dates[row], equity, cash, len(positions), invested / equity if equity else 0.0))
+
+    # 기간 끝에 남은 보유 종목은 마지막 종가로 평가 (매매 내역에는 'open' 으로 표시)
+    for pos in positions:
+        trades.append({
+            'Code': codes[pos['j']], 'Name': names[pos['j']],
+            'EntryDate': panel.dates[pos['entry_row']], 'EntryPrice': pos['entry_price'],
+            'ExitDate': panel.dates[row_stop - 1], 'ExitPrice': pos['last_close'], 'Shares': pos['shares'],
+            'Days': pos['days'], 'Return': round((pos['last_close'] / (pos['entry_price'] * (1 + fee)) - 1) * 100, 2),
+            'Reason': 'open',
+        })
+
+    df_equity = pd.DataFrame(equity_rows, columns=['Date', 'Equity', 'Cash', 'Positions', 'Exposure'])
+    df_equity['Date'] = pd.to_datetime(df_equity['Date'])
+    df_equity['Drawdown'] = df_equity['Equity'] / df_equity['Equity'].cummax() - 1
+    df_trades = pd.DataFrame(trades, columns=['Code', 'Name', 'EntryDate', 'EntryPrice', 'ExitDate', 'ExitPrice',
+                                              'Shares', 'Days', 'Return', 'Reason'])
+    return df_equity, df_trades, summarize(df_equity, df_trades, capital, traded_value)
+
+def summarize(df_equity, df_trades, capital, traded_value):
+    """수익률, 연환산 수익률, 최대 낙폭, 회전율(연간, 매수+매도 / 2 / 평균 자산), 승률 등"""
+    if df_equity.empty:
+        return {'days': 0}
+    years = max(len(df_equity) / 252, 1 / 252)
+    final = float(df_equity['Equity'].iloc[-1])
+    closed = df_trades[df_trades['Reason'] != 'open']
+    # 값은 모두 파이썬 기본 타입 (np.float64 가 아닌 float/int, JSON 등에 바로 쓸 수 있도록)
+    return {
+        'start': df_equity['Date'].iloc[0].date().isoformat(),
+        'end': df_equity['Date'].iloc[-1].date().isoformat(),
+        'days': len(df_equity),
+        'final_equity': round(final),
+        'total_return': round((final / capital - 1) * 100, 2),
+        'cagr': round(((final / capital) ** (1 / years) - 1) * 100, 2) if final > 0 else -100.0,
+        'max_drawdown': round(float(df_equity['Drawdown'].min()) * 100, 2),
+        'turnover': round(float(traded_value / 2 / df_equity['Equity'].mean() / years), 2),
+        'exposure': round(float(df_equity['Exposure'].mean()) * 100, 2),
+        'trades': len(closed),
+        'win_rate': round(float((closed['Return'] > 0).mean()) * 100, 2) if len(closed) else 0.0,
+        'avg_return': round(float(closed['Return'].mean()), 2) if len(closed) else 0.0,
+        'avg_days': round(float(closed['Days'].mean()), 1) if len(closed) else 0.0,
+        'exits': {str(reason): int(count) for reason, count in closed['Reason'].value_counts().items()},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="이동평균 돌파 스크리닝 결과를 매일 매매하는 포트폴리오 백테스트")
+    parser.add_argument('--window', type=int, default=20, help="이동평균선 기간 (기본값: 20)")
+    parser.add_argument('--top', type=int, default=10, help="최대 보유 종목 수 (기본값: 10)")
+    parser.add_argument('--target', type=float, default=0.10, help="목표 수익률, 0 이면 사용 안 함 (기본값: 0.10)")
+    parser.add_argument('--stop', type=float, default=0.05, help="손절 비율, 0 이면 사용 안 함 (기본값: 0.05)")
+    parser.add_argument('--period', type=int, default=10, help="최대 보유 거래일 (기본값: 10)")
+    parser.add_argument('--start', type=datetime.date.fromisoformat, help="시작일 (YYYY-MM-DD, 기본: 데이터 처음)")
+    parser.add_argument('--end', type=datetime.date.fromisoformat, help="종료일 (YYYY-MM-DD, 기본: 데이터 끝)")
+    parser.add_argument('--capital', type=float, default=DEFAULT_CAPITAL, help="초기 자금 (원)")
+    parser.add_argument('--fee', type=float, default=DEFAULT_FEE, help="매수/매도 수수료율")
+    parser.add_argument('--tax', type=float, default=DEFAULT_TAX, help="매도 거래세율")
+    parser.add_argument('--ascending', action='store_true', help="이격도(Ratio)가 작은 종목부터 진입 (기본: 큰 종목부터)")
+    parser.add_argument('--output', type=str, default='portfolio', help="결과 파일 접두어 ({접두어}_equity.csv, {접두어}_trades.csv)")
+    args = parser.parse_args()
+    if args.top < 1 or args.period < 1:
+        parser.error("--top 과 --period 는 1 이상이어야 합니다.")
+
+    started = time.time()
+    panel = price_panel.load_panel()
+    # 상장 폐지 종목까지 포함한 저장소 전 종목 (이름은 카탈로그)
+    codes = panel.tickers.tolist()
+    stocks = pd.DataFrame({'Code': codes,
+                           'Name': [(price_catalog.get(code) or {}).get('name') or code for code in codes]})
+
+    df_equity, df_trades, summary = run_portfolio(
+        panel, stocks, args.window, top_n=args.top, target=args.target, stop=args.stop, period_days=args.period,
+        start=args.start, end=args.end, capital=args.capital, fee=args.fee, tax=args.tax, ascending=args.ascending)
+
+    df_equity.to_csv(f'{args.output}_equity.csv', index=False, encoding='utf-8-sig')
+    df_trades.to_csv(f'{args.output}_trades.csv', index=False, encoding='utf-8-sig')
+    print(f"{len(codes)}개 종목, {summary['days']}거래일 재생 ({time.time() - started:.1f}초)")
+    for key, value in summary.items():
+        print(f"  {key}: {value}")
+    print(f"결과: '{args.output}_equity.csv', '{args.output}_trades.csv'")
+
+if __name__ == "__main__":
+    main()
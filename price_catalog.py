@@ -0,0 +1,322 @@
+import numpy as np
+import argparse
+import atexit
+import datetime
+import json
+import os
+import threading
+import zlib
+
+import price_store
+
+# 종목 메타데이터 카탈로그 (price_store/catalog.json)
+# 종목 코드 → 이름, 저장 경로, 첫/마지막 거래일, 행 수, 수정 시각, 체크섬
+# - price_store 가 파일을 쓸 때마다 해당 종목 항목을 갱신합니다.
+# - 읽는 쪽은 파일을 열거나 경로를 찾아보지 않고 카탈로그만 보고
+#   "데이터 있음/최신/이력 부족" 여부를 판단합니다.
+# - 다른 프로세스가 쓴 변경은 sync() 가 폴더의 수정 시각만 비교해 반영합니다.
+# - 체크섬은 .npy 헤더를 뺀 레코드 부분의 CRC32 입니다. 파일 끝에 덧붙일 때는 덧붙인 바이트만으로
+#   이어서 계산하고, 전체를 다시 쓸 때는 메모리의 레코드로 계산합니다. (파일을 다시 읽지 않음)
+# - 파일 읽기/체크섬 계산은 잠금 밖에서 하고, 잠금은 항목을 바꿔 넣을 때만 잡습니다.
+
+CATALOG_NAME = 'catalog.json'
+CHECKSUM_SCOPE = 'data'  # 이전 형식(항목에 checksum_scope 없음)은 파일 전체의 CRC32
+
+_entries = None
+_dirty = False
+_lock = threading.Lock()
+
+def catalog_path():
+    return os.path.join(price_store.STORE_DIR, CATALOG_NAME)
+
+def _format_crc(value):
+    return format(value & 0xffffffff, '08x')
+
+def _checksum(path, scope=CHECKSUM_SCOPE):
+    """파일 체크섬 (scope 'data': 헤더 뒤 레코드 부분, None: 파일 전체)"""
+    value = 0
+    with open(path, 'rb') as f:
+        if scope == CHECKSUM_SCOPE:
+            price_store._read_header(f)
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                break
+            value = zlib.crc32(chunk, value)
+    return _format_crc(value)
+
+def _describe(ticker, name=None, rec=None):
+    """
+    저장소 파일 하나의 카탈로그 항목을 만듭니다. (파일이 없으면 None)
+    rec: 방금 쓴 레코드 배열 (있으면 파일을 다시 읽지 않고 날짜/행 수/체크섬을 계산)
+    """
+    path = price_store.store_path(ticker)
+    try:
+        stat = os.stat(path)
+        if rec is None:
+            rec = np.load(path, mmap_mode='r')
+            checksum = _checksum(path)
+        else:
+            checksum = _format_crc(zlib.crc32(np.ascontiguousarray(rec).tobytes()))
+        first_date = str(rec['Date'][0]) if len(rec) else None
+        last_date = str(rec['Date'][-1]) if len(rec) else None
+        rows = len(rec)
+        del rec
+    except (FileNotFoundError, ValueError):
+        return None
+    return {
+        'name': name,
+        'path': path,
+        'first_date': first_date,
+        'last_date': last_date,
+        'rows': rows,
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'checksum': checksum,
+        'checksum_scope': CHECKSUM_SCOPE,
+    }
+
+def _extended(ticker, old, appended):
+    """
+    파일 끝에 appended 레코드를 덧붙인 뒤의 항목 (기존 항목에서 이어서 계산, 파일은 stat 만 함).
+    기존 항목이 이전 형식이거나 파일 크기가 맞지 않으면 None (전체를 다시 계산해야 함)
+    """
+    if not old or old.get('checksum_scope') != CHECKSUM_SCOPE:
+        return None
+    try:
+        stat = os.stat(old['path'])
+    except FileNotFoundError:
+        return None
+    data = np.ascontiguousarray(appended).tobytes()
+    if stat.st_size != old['size'] + len(data):
+        return None
+    return dict(old,
+                first_date=old['first_date'] or str(appended['Date'][0]),
+                last_date=str(appended['Date'][-1]),
+                rows=old['rows'] + len(appended),
+                mtime=stat.st_mtime,
+                size=stat.st_size,
+                checksum=_format_crc(zlib.crc32(data, int(old['checksum'], 16))))
+
+def _load():
+    global _entries
+    if _entries is None:
+        try:
+            with open(catalog_path(), encoding='utf-8') as f:
+                _entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            _entries = {}
+    return _entries
+
+def save():
+    """카탈로그를 임시 파일에 쓴 뒤 교체합니다."""
+    global _dirty
+    with _lock:
+        entries = dict(_load())
+        _dirty = False
+    os.makedirs(price_store.STORE_DIR, exist_ok=True)
+    path = catalog_path()
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def has_unsaved_changes():
+    """이 프로세스에 아직 파일에 기록하지 않은 변경이 있는지"""
+    return _dirty
+
+def record(ticker, name=None, rec=None, appended=None):
+    """
+    종목 파일이 바뀐 뒤 호출: 해당 항목을 다시 계산합니다. (이름을 모르면 기존 이름 유지)
+    rec: 파일 전체를 새로 쓴 레코드 배열, appended: 파일 끝에 덧붙인 레코드 배열
+    (둘 다 없으면 파일을 읽어 계산). 파일에는 save() 또는 프로세스 종료 시 한 번에 기록합니다.
+    """
+    global _dirty
+    with _lock:
+        old = _load().get(ticker)
+
+    entry = _extended(ticker, old, appended) if appended is not None else None
+    if entry is None:
+        entry = _describe(ticker, None, rec)
+
+    with _lock:
+        _dirty = True
+        entries = _load()
+        current = entries.get(ticker) or {}
+        if entry is None:
+            entries.pop(ticker, None)
+            return
+        entry['name'] = name or current.get('name') or (old or {}).get('name')
+        if current.get('retired'):
+            entry['retired'] = current['retired']
+        entries[ticker] = entry
+
+def get(ticker):
+    """종목 항목 (dict, 없으면 None)"""
+    with _lock:
+        return _load().get(ticker)
+
+def tickers():
+    """카탈로그에 있는 종목 코드 목록"""
+    with _lock:
+        return sorted(_load())
+
+def _to_date(value):
+    return datetime.date.fromisoformat(value) if value else None
+
+def mtimes():
+    """종목 → 파일 수정 시각 (다른 프로세스의 변경 확인용)"""
+    with _lock:
+        return {ticker: entry['mtime'] for ticker, entry in _load().items()}
+
+def first_date(ticker):
+    entry = get(ticker)
+    return _to_date(entry['first_date']) if entry else None
+
+def last_date(ticker):
+    entry = get(ticker)
+    return _to_date(entry['last_date']) if entry else None
+
+def needs_update(ticker, today=None):
+    """마지막 거래일이 today(기본: 오늘) 이전이거나 카탈로그에 없으면 True"""
+    today = today or datetime.datetime.now().date()
+    last = last_date(ticker)
+    return last is None or last < today
+
+def covers(ticker, start_date, slack_days=30):
+    """
+    저장된 이력이 start_date 부근(slack_days 허용)부터 시작하는지 확인합니다.
+    False 이면 "과거 데이터 부족" → 새로 다운로드 대상
+    """
+    first = first_date(ticker)
+    if first is None:
+        return False
+    if isinstance(start_date, str):
+        start_date = datetime.datetime.strptime(start_date, '%Y-%m-%d').date()
+    return first <= start_date + datetime.timedelta(days=slack_days)
+
+def sync(save_changes=True):
+    """
+    저장소 폴더와 카탈로그를 맞춥니다.
+    파일 크기/수정 시각이 카탈로그와 다른 종목만 다시 읽고, 사라진 파일의 항목은 지웁니다.
+    반환: 다시 읽은 종목 수
+    """
+    current = {}
+    if os.path.isdir(price_store.STORE_DIR):
+        with os.scandir(price_store.STORE_DIR) as it:
+            for entry in it:
+                if entry.name.endswith('.npy'):
+                    stat = entry.stat()
+                    current[entry.name[:-4]] = (stat.st_mtime, stat.st_size)
+
+    global _dirty
+    with _lock:
+        entries = _load()
+        removed = [ticker for ticker in entries if ticker not in current]
+        stale = [ticker for ticker, (mtime, size) in current.items()
+                 if not (ticker in entries and entries[ticker]['mtime'] == mtime and entries[ticker].get('size') == size)]
+
+    # 바뀐 파일은 잠금 밖에서 읽음
+    described = {ticker: _describe(ticker) for ticker in stale}
+
+    changed = 0
+    with _lock:
+        entries = _load()
+        for ticker in removed:
+            if entries.pop(ticker, None) is not None:
+                changed += 1
+        for ticker, entry in described.items():
+            if entry is None:
+                continue
+            old = entries.get(ticker) or {}
+            entry['name'] = old.get('name')
+            if old.get('retired'):
+                entry['retired'] = old['retired']
+            entries[ticker] = entry
+            changed += 1
+        if changed:
+            _dirty = True
+    if changed and save_changes:
+        save()
+    return changed
+
+def set_names(names):
+    """{종목 코드: 이름} 으로 항목의 종목명을 갱신합니다. (종목명 변경 반영)"""
+    global _dirty
+    with _lock:
+        entries = _load()
+        for ticker, name in names.items():
+            if ticker in entries and entries[ticker]['name'] != name:
+                entries[ticker] = dict(entries[ticker], name=name)
+                _dirty = True
+
+def retire(codes, date):
+    """상장 폐지된 종목 항목에 폐지일(retired)을 기록합니다. (데이터는 그대로 둠)"""
+    global _dirty
+    with _lock:
+        entries = _load()
+        for ticker in codes:
+            if ticker in entries:
+                entries[ticker] = dict(entries[ticker], retired=date)
+                _dirty = True
+
+def active_tickers():
+    """상장 폐지 표시가 없는 종목 코드 목록"""
+    with _lock:
+        return sorted(ticker for ticker, entry in _load().items() if not entry.get('retired'))
+
+def verify():
+    """체크섬이 맞지 않는 (중간에 손상되었거나 카탈로그 밖에서 바뀐) 종목 코드 목록"""
+    broken = []
+    for ticker in tickers():
+        entry = get(ticker)
+        try:
+            if _checksum(entry['path'], entry.get('checksum_scope')) != entry['checksum']:
+                broken.append(ticker)
+        except FileNotFoundError:
+            broken.append(ticker)
+    return broken
+
+def reload():
+    """다음 조회 때 카탈로그 파일을 다시 읽도록 메모리 사본을 버립니다."""
+    global _entries
+    with _lock:
+        _entries = None
+
+def _save_if_dirty():
+    if _dirty:
+        try:
+            save()
+        except Exception:
+            pass
+
+# 명시적으로 save() 하지 않은 변경은 프로세스 종료 시 기록
+atexit.register(_save_if_dirty)
+
+def main():
+    parser = argparse.ArgumentParser(description="종목 메타데이터 카탈로그 관리")
+    parser.add_argument('--rebuild', action='store_true', help="저장소 전체를 다시 읽어 카탈로그를 새로 생성")
+    parser.add_argument('--verify', action='store_true', help="체크섬으로 저장소 파일 손상 여부 확인")
+    parser.add_argument('--show', type=str, help="종목 코드의 카탈로그 항목 출력")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        global _entries
+        names = {ticker: entry.get('name') for ticker, entry in _load().items()}
+        _entries = {}
+        sync(save_changes=False)
+        set_names({ticker: name for ticker, name in names.items() if name})
+        save()
+        print(f"카탈로그 생성 완료: {len(tickers())}개 종목")
+    elif args.verify:
+        broken = verify()
+        print(f"체크섬 불일치: {len(broken)}개 종목" + (f" ({', '.join(broken[:20])})" if broken else ""))
+    elif args.show:
+        sync()
+        print(json.dumps(get(args.show), ensure_ascii=False, indent=2))
+    else:
+        changed = sync()
+        print(f"카탈로그: {len(tickers())}개 종목 ({changed}개 갱신)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import numpy as np
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sys
+import time
+
+import price_store
+import indicator_cache
+
+# 설정
+PANEL_DIR = 'price_panel'
+FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+# 이동평균용 누적 필드: 종목별 종가 누적합(CloseSum)과 데이터 개수(Count).
+# 데이터가 없는 칸은 직전 값을 이어 받으므로 (상장 전은 0)
+# 최근 window 행의 합/개수 = 마지막 행 값 - window 행 앞 값 으로 두 행만 읽어 구합니다.
+SUM_FIELDS = ['CloseSum', 'Count']
+
+# 전 종목 주가를 (날짜 × 종목) 2차원 배열로 필드별 .npy 파일에 저장하고 mmap 으로 읽습니다.
+# - 행(날짜)이 연속으로 저장되므로 "최근 N일" 조회는 파일 끝부분 N행만 읽습니다.
+# - 상장 전/데이터 없는 칸은 NaN 입니다.
+# - "N행 앞" 은 종목 자신의 데이터 행 기준입니다. (종목별 rolling 과 같음)
+#   중간에 데이터가 빠진 구간이 있는 종목은 빈 칸을 건너뛰고 셉니다. (data_rows 참고)
+# - 빌드마다 새 하위 폴더에 쓰고 CURRENT 파일로 전환합니다.
+#   (Windows 에서는 mmap 으로 열려 있는 파일을 덮어쓸 수 없기 때문)
+
+class PricePanel:
+    """
+    mmap 으로 열린 전 종목 주가 패널.
+    dates: 날짜 축 (datetime64[D]), tickers: 종목 코드 축
+    first_row / last_row: 종목별 첫/마지막 데이터 행 (데이터 없으면 -1)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.dates = np.load(os.path.join(path, 'dates.npy'))
+        self.tickers = np.load(os.path.join(path, 'tickers.npy'))
+        self.first_row = np.load(os.path.join(path, 'first_row.npy'))
+        self.last_row = np.load(os.path.join(path, 'last_row.npy'))
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self._columns = {ticker: i for i, ticker in enumerate(self.tickers.tolist())}
+        self._fields = {}
+        self._data_counts = None
+        self._gap_columns = None
+
+    def __len__(self):
+        return len(self.tickers)
+
+    @property
+    def n_rows(self):
+        """종목별 데이터 개수"""
+        if self._data_counts is None:
+            self._data_counts = np.zeros(len(self.tickers), dtype=np.int64)
+            cols = np.nonzero(self.last_row >= 0)[0]
+            self._data_counts[cols] = self.field('Count')[self.last_row[cols], cols]
+        return self._data_counts
+
+    @property
+    def gap_columns(self):
+        """첫/마지막 데이터 행 사이에 데이터가 빠진 날이 있는 종목의 열 번호"""
+        if self._gap_columns is None:
+            span = np.where(self.last_row >= 0, self.last_row - self.first_row + 1, 0)
+            self._gap_columns = np.nonzero(self.n_rows < span)[0]
+        return self._gap_columns
+
+    def field(self, name):
+        """필드 전체 배열 (mmap, 읽기 전용)"""
+        if name not in self._fields:
+            self._fields[name] = np.load(os.path.join(self.path, f'{name}.npy'), mmap_mode='r')
+        return self._fields[name]
+
+    def ticker_index(self, tickers):
+        """종목 코드 → 열 번호 배열 (패널에 없는 종목은 -1)"""
+        return np.array([self._columns.get(ticker, -1) for ticker in tickers], dtype=np.int64)
+
+    def date_index(self, date):
+        """date 당일(휴장일이면 그 이전 마지막 거래일)의 행 번호 (이전 데이터가 없으면 -1)"""
+        date = np.datetime64(date, 'D')
+        return int(np.searchsorted(self.dates, date, side='right')) - 1
+
+    def end_rows(self, date, columns=None):
+        """
+        종목별로 date 당일(휴장일이면 그 이전) 기준 마지막 데이터 행 (없으면 -1).
+        기준 행이 빈 칸(거래정지 등)이면 직전 데이터 행입니다.
+        """
+        if columns is None:
+            columns = np.arange(len(self.tickers))
+        columns = np.asarray(columns, dtype=np.int64)
+        safe = np.maximum(columns, 0)
+        first = self.first_row[safe]
+        end = np.minimum(self.last_row[safe], self.date_index(date))
+        end = np.where((columns >= 0) & (end >= first) & (first >= 0), end, -1)
+
+        close = self.field('Close')
+        for j in np.nonzero(end >= 0)[0]:
+            while end[j] >= first[j] and np.isnan(close[end[j], safe[j]]):
+                end[j] -= 1
+            if end[j] < first[j]:
+                end[j] = -1
+        return end
+
+    def data_rows(self, offsets, columns=None, end_rows=None):
+        """
+        종목별 마지막 데이터 행(또는 end_rows)에서 데이터 offset 개 앞의 패널 행 번호 (len(offsets) × 종목).
+        데이터가 빠진 구간이 있는 종목(gap_columns)은 빈 칸을 건너뛰고 자기 데이터 행만 셉니다.
+        첫 데이터 행보다 앞이면 그만큼 앞의 행 번호(음수 가능), 기준 행이 없으면 -1 입니다.
+        """
+        if columns is None:
+            columns = np.arange(len(self.tickers))
+        columns = np.asarray(columns, dtype=np.int64)
+        offsets = np.asarray(offsets, dtype=np.int64)
+
+        if end_rows is None:
+            last_rows = np.where(columns >= 0, self.last_row[np.maximum(columns, 0)], -1)
+        else:
+            last_rows = np.where(columns >= 0, np.asarray(end_rows, dtype=np.int64), -1)
+        rows = last_rows[None, :] - offsets[:, None]
+
+        # 빈 칸이 있는 종목: Count(자기 데이터 개수) 열에서 목표 개수가 처음 나오는 행
+        for i in np.nonzero(np.isin(columns, self.gap_columns) & (last_rows >= 0))[0]:
+            count = np.asarray(self.field('Count')[:, columns[i]])
+            target = count[last_rows[i]] - offsets
+            first = self.first_row[columns[i]]
+            rows[:, i] = np.where(target >= 1, np.searchsorted(count, np.maximum(target, 1), side='left'),
+                                  first + target - 1)
+        rows[:, last_rows < 0] = -1
+        return rows
+
+    def at_offsets(self, name, offsets, columns=None, fill=np.nan, end_rows=None):
+        """
+        종목별 마지막 데이터 행에서 데이터 offset 개 앞(data_rows)의 값을 (len(offsets) × 종목) 배열로 반환합니다.
+        패널 범위 밖(첫 행 이전)이거나 패널에 없는 종목은 fill 입니다.
+        end_rows: 마지막 행 대신 기준으로 쓸 종목별 행 번호 (-1 이면 데이터 없음 취급)
+        """
+        if columns is None:
+            columns = np.arange(len(self.tickers))
+        columns = np.asarray(columns, dtype=np.int64)
+
+        rows = self.data_rows(offsets, columns, end_rows)
+        valid = (columns >= 0)[None, :] & (rows >= 0)
+
+        out = np.full(rows.shape, fill, dtype=np.float64)
+        cols = np.broadcast_to(columns, rows.shape)
+        out[valid] = self.field(name)[rows[valid], cols[valid]]
+        return out
+
+    def tail(self, name, n, columns=None):
+        """
+        종목별 마지막 데이터 행 기준으로 최근 데이터 n개를 (n × 종목) float64 배열로 반환합니다.
+        마지막 행은 종목마다 다를 수 있으므로 (거래정지, 업데이트 누락 등)
+        같은 마지막 행을 가진 종목끼리 묶어 해당 n행만 읽습니다.
+        데이터가 빠진 구간이 있는 종목(gap_columns)은 빈 칸을 건너뛴 데이터 행(data_rows)을 읽습니다.
+        """
+        if columns is None:
+            columns = np.arange(len(self.tickers))
+        columns = np.asarray(columns, dtype=np.int64)
+
+        data = self.field(name)
+        out = np.full((n, len(columns)), np.nan)
+        last_rows = np.where(columns >= 0, self.last_row[columns], -1)
+
+        for last in np.unique(last_rows):
+            if last < 0:
+                continue
+            sel = np.nonzero(last_rows == last)[0]
+            start = max(last - n + 1, 0)
+            block = data[start:last + 1][:, columns[sel]]
+            out[n - len(block):, sel] = block
+
+        gaps = np.nonzero(np.isin(columns, self.gap_columns) & (last_rows >= 0))[0]
+        if len(gaps):
+            out[:, gaps] = self.at_offsets(name, np.arange(n - 1, -1, -1), columns[gaps])
+        return out
+
+def _current_path(panel_dir=PANEL_DIR):
+    try:
+        with open(os.path.join(panel_dir, 'CURRENT'), encoding='utf-8') as f:
+            return os.path.join(panel_dir, f.read().strip())
+    except FileNotFoundError:
+        return None
+
+def _store_mtime():
+    """저장소 파일들의 최신 수정 시각 (패널 갱신 필요 여부 판단용)"""
+    latest = 0
+    if os.path.isdir(price_store.STORE_DIR):
+        with os.scandir(price_store.STORE_DIR) as entries:
+            for entry in entries:
+                if entry.name.endswith('.npy'):
+                    latest = max(latest, entry.stat().st_mtime)
+    return latest
+
+def _load_ticker_records(ticker):
+    rec = price_store.load_records(ticker)
+    if rec is None:
+        df = price_store.load_prices(ticker)
+        rec = price_store.to_records(df) if df is not None else None
+    return rec
+
+def build_panel(panel_dir=PANEL_DIR, verbose=True):
+    """저장소의 전 종목 데이터로 패널을 새로 만듭니다."""
+    tickers = price_store.list_tickers()
+    records = {}
+    for i, ticker in enumerate(tickers, 1):
+        try:
+            rec = _load_ticker_records(ticker)
+            if rec is not None and len(rec):
+                records[ticker] = rec
+        except Exception:
+            pass
+        if verbose and (i % 500 == 0 or i == len(tickers)):
+            sys.stdout.write(f"\r패널 생성: [{i}/{len(tickers)}] 종목 읽는 중...")
+            sys.stdout.flush()
+    if verbose:
+        print()
+
+    tickers = np.array(sorted(records), dtype=str)
+    dates = np.unique(np.concatenate([rec['Date'] for rec in records.values()])) if len(records) else np.array([], dtype='M8[D]')
+    rows = {ticker: np.searchsorted(dates, records[ticker]['Date']) for ticker in records}
+    first_row = np.array([rows[t][0] for t in tickers.tolist()], dtype=np.int64)
+    last_row = np.array([rows[t][-1] for t in tickers.tolist()], dtype=np.int64)
+
+    build_id = datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    path = os.path.join(panel_dir, build_id)
+    os.makedirs(path)
+
+    for name in FIELDS:
+        # 메모리에서 (날짜 × 종목) 배열을 만든 뒤 한 번에 기록
+        values = np.full((len(dates), len(tickers)), np.nan)
+        for j, ticker in enumerate(tickers.tolist()):
+            values[rows[ticker], j] = records[ticker][name]
+        np.save(os.path.join(path, f'{name}.npy'), values)
+        del values
+
+    # 누적 필드: 종목별 지표 캐시의 종가 누적합을 날짜 축에 펼침 (빈 칸은 직전 값)
+    close_sum = np.zeros((len(dates), len(tickers)))
+    count = np.zeros((len(dates), len(tickers)), dtype=np.int32)
+    for j, ticker in enumerate(tickers.tolist()):
+        sums = indicator_cache.load(ticker, records[ticker])
+        filled = np.zeros(len(dates), dtype=np.int64)
+        filled[rows[ticker]] = np.arange(1, len(rows[ticker]) + 1)
+        filled = np.maximum.accumulate(filled)
+        close_sum[:, j] = np.concatenate([[0], sums['CloseSum']])[filled]
+        count[:, j] = filled
+    np.save(os.path.join(path, 'CloseSum.npy'), close_sum)
+    np.save(os.path.join(path, 'Count.npy'), count)
+    del close_sum, count
+
+    np.save(os.path.join(path, 'dates.npy'), dates)
+    np.save(os.path.join(path, 'tickers.npy'), tickers)
+    np.save(os.path.join(path, 'first_row.npy'), first_row)
+    np.save(os.path.join(path, 'last_row.npy'), last_row)
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'built_at': time.time(), 'tickers': len(tickers), 'dates': len(dates)}, f)
+
+    # 새 빌드로 전환
+    tmp_current = os.path.join(panel_dir, 'CURRENT.tmp')
+    with open(tmp_current, 'w', encoding='utf-8') as f:
+        f.write(build_id)
+    os.replace(tmp_current, os.path.join(panel_dir, 'CURRENT'))
+
+    # 이전 빌드 정리 (다른 프로세스가 mmap 으로 열고 있으면 실패할 수 있으므로 무시)
+    for entry in os.listdir(panel_dir):
+        old_path = os.path.join(panel_dir, entry)
+        if entry != build_id and os.path.isdir(old_path):
+            shutil.rmtree(old_path, ignore_errors=True)
+
+    if verbose:
+        print(f"패널 생성 완료: {len(tickers)}개 종목 × {len(dates)}일")
+    return PricePanel(path)
+
+def is_stale(panel):
+    """패널 생성 이후 저장소가 변경되었는지 (또는 이전 버전 패널이라 필드가 빠졌는지) 확인합니다."""
+    if any(not os.path.exists(os.path.join(panel.path, f'{name}.npy')) for name in SUM_FIELDS):
+        return True
+    return _store_mtime() > panel.meta['built_at']
+
+def load_panel(panel_dir=PANEL_DIR, rebuild_if_stale=True, verbose=True):
+    """
+    최신 패널을 엽니다.
+    패널이 없거나 (rebuild_if_stale 이면) 저장소보다 오래된 경우 새로 만듭니다.
+    """
+    path = _current_path(panel_dir)
+    if path is not None and os.path.isdir(path):
+        panel = PricePanel(path)
+        if not (rebuild_if_stale and is_stale(panel)):
+            return panel
+    return build_panel(panel_dir, verbose=verbose)
+
+def main():
+    parser = argparse.ArgumentParser(description="전 종목 주가 패널(mmap) 생성")
+    parser.add_argument('--force', action='store_true', help="변경 여부와 관계없이 새로 생성")
+    args = parser.parse_args()
+
+    if args.force:
+        build_panel()
+    else:
+        panel = load_panel()
+        print(f"패널: {panel.path} ({len(panel)}개 종목 × {len(panel.dates)}일)")
+
+if __name__ == "__main__":
+    main()
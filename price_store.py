@@ -0,0 +1,337 @@
+import numpy as np
+import pandas as pd
+import argparse
+import glob
+import io
+import os
+import re
+import sys
+import threading
+
+import price_catalog
+import indicator_cache
+import run_metrics
+import data_cache
+
+# 설정
+DATA_DIR = 'stock_data'    # 기존 CSV 캐시 ({ticker}_{name}.csv)
+STORE_DIR = 'price_store'  # 바이너리 저장소 ({ticker}.npy)
+
+# 종목당 .npy 파일 1개에 일자별 레코드를 저장합니다.
+# 날짜는 일 단위 datetime64 로 저장하므로 모든 종목이 같은 날짜 축(1970-01-01 기준 일수)을 공유합니다.
+RECORD_DTYPE = np.dtype([
+    ('Date', '<M8[D]'),
+    ('Open', '<i8'),
+    ('High', '<i8'),
+    ('Low', '<i8'),
+    ('Close', '<i8'),
+    ('Volume', '<i8'),
+    ('Change', '<f8'),
+])
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume', 'Change']
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close']
+
+def sanitize_filename(name):
+    """파일명으로 사용할 수 없는 문자를 제거합니다."""
+    return re.sub(r'[\\/*?:"<>|]', "", name)
+
+def store_path(ticker):
+    return os.path.join(STORE_DIR, f"{ticker}.npy")
+
+def csv_path(ticker, name):
+    return os.path.join(DATA_DIR, f"{ticker}_{sanitize_filename(name)}.csv")
+
+def _find_csv(ticker, name=None):
+    """기존 CSV 캐시 경로를 찾습니다. (신규 형식 → 구형 ticker.csv 순)"""
+    if name is not None:
+        path = csv_path(ticker, name)
+        if os.path.exists(path):
+            return path
+    else:
+        matches = glob.glob(os.path.join(DATA_DIR, f"{glob.escape(ticker)}_*.csv"))
+        if matches:
+            return max(matches, key=os.path.getmtime)
+
+    old_path = os.path.join(DATA_DIR, f"{ticker}.csv")
+    if os.path.exists(old_path):
+        return old_path
+    return None
+
+def _name_from_csv(path):
+    """{ticker}_{name}.csv → name (구형 {ticker}.csv 는 None)"""
+    stem = os.path.basename(path)[:-4]
+    return stem.split('_', 1)[1] if '_' in stem else None
+
+def to_records(df):
+    """DataFrame(Date 인덱스) → 저장용 레코드 배열"""
+    df = df.sort_index()
+    df = df[~df.index.duplicated(keep='last')]
+    # 가격이 비어 있는 행은 정수 컬럼에 담을 수 없으므로 제외
+    df = df.dropna(subset=PRICE_COLUMNS)
+
+    rec = np.empty(len(df), dtype=RECORD_DTYPE)
+    rec['Date'] = pd.DatetimeIndex(df.index).values.astype('M8[D]')
+    for col in PRICE_COLUMNS:
+        rec[col] = df[col].round().astype('int64').values
+    rec['Volume'] = df['Volume'].fillna(0).astype('int64').values
+    if 'Change' in df.columns:
+        rec['Change'] = df['Change'].astype('float64').values
+    else:
+        rec['Change'] = df['Close'].pct_change().values
+    return rec
+
+def from_records(rec):
+    """저장용 레코드 배열 → DataFrame (pd.read_csv(..., index_col='Date') 와 같은 형태)"""
+    index = pd.DatetimeIndex(rec['Date'].astype('M8[ns]'), name='Date')
+    return pd.DataFrame({col: rec[col] for col in COLUMNS}, index=index)
+
+def has_prices(ticker, name=None):
+    return os.path.exists(store_path(ticker)) or _find_csv(ticker, name) is not None
+
+def load_records(ticker):
+    """바이너리 저장소의 레코드 배열을 그대로 읽습니다. (없으면 None)"""
+    path = store_path(ticker)
+    if not os.path.exists(path):
+        return None
+    with run_metrics.stage('read', ticker):
+        return np.load(path)
+
+def load_prices(ticker, name=None):
+    """
+    종목의 전체 주가 이력을 읽습니다.
+    바이너리 저장소를 우선 사용하고, 아직 변환되지 않은 종목은 기존 CSV를 읽습니다.
+    데이터가 없으면 None을 반환합니다.
+    """
+    rec = load_records(ticker)
+    if rec is not None:
+        return from_records(rec)
+
+    path = _find_csv(ticker, name)
+    if path is not None:
+        with run_metrics.stage('read', ticker):
+            return pd.read_csv(path, parse_dates=['Date'], index_col='Date')
+    return None
+
+def _read_tail(path, n):
+    """.npy 파일의 마지막 n 행만 읽습니다. (파일이 더 짧으면 전체)"""
+    with open(path, 'rb') as f:
+        _, n_rows, dtype, offset = _read_header(f)
+        start = max(n_rows - n, 0)
+        f.seek(offset + start * dtype.itemsize)
+        return np.frombuffer(f.read((n_rows - start) * dtype.itemsize), dtype=dtype).copy()
+
+def load_records_tail(ticker, n):
+    """바이너리 저장소의 마지막 n 개 레코드만 읽습니다. (없으면 None)"""
+    path = store_path(ticker)
+    if not os.path.exists(path):
+        return None
+    with run_metrics.stage('read', ticker):
+        return _read_tail(path, n)
+
+def load_prices_tail(ticker, n, name=None):
+    """
+    종목의 최근 n 거래일 주가 이력 (load_prices 와 같은 형태, 데이터가 없으면 None).
+    바이너리 저장소는 필요한 행만 읽고, 미변환 CSV 는 전체를 읽은 뒤 자릅니다.
+    """
+    rec = load_records_tail(ticker, n)
+    if rec is not None:
+        return from_records(rec)
+    df = load_prices(ticker, name)
+    return df.tail(n) if df is not None else None
+
+def _atomic_save(path, arr):
+    """배열을 임시 파일에 쓴 뒤 교체합니다. (중간에 중단돼도 기존 파일은 그대로)"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.save(f, arr)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _write_records(ticker, rec, name=None):
+    """레코드 배열 전체를 임시 파일에 쓴 뒤 교체합니다."""
+    with run_metrics.stage('write', ticker):
+        _atomic_save(store_path(ticker), rec)
+    price_catalog.record(ticker, name, rec=rec)
+    indicator_cache.rebuild(ticker, rec)
+    data_cache.invalidate(ticker)
+
+def save_prices(ticker, df, name=None):
+    """종목의 전체 주가 이력을 바이너리 저장소에 씁니다."""
+    _write_records(ticker, to_records(df), name)
+
+def _read_header(f):
+    """.npy 헤더를 읽어 (버전, 행 수, dtype, 데이터 시작 위치)를 반환합니다."""
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    return version, shape[0], dtype, f.tell()
+
+def _header_bytes(version, n_rows, dtype=RECORD_DTYPE):
+    buf = io.BytesIO()
+    header = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (n_rows,)}
+    if version == (1, 0):
+        np.lib.format.write_array_header_1_0(buf, header)
+    else:
+        np.lib.format.write_array_header_2_0(buf, header)
+    return buf.getvalue()
+
+def last_record(ticker, name=None):
+    """
+    저장된 마지막 거래일의 레코드 (Date, Open, ..., Change 필드, 데이터가 없으면 None).
+    바이너리 저장소는 헤더와 마지막 레코드만 읽습니다.
+    """
+    path = store_path(ticker)
+    if os.path.exists(path):
+        with run_metrics.stage('read', ticker), open(path, 'rb') as f:
+            _, n_rows, dtype, offset = _read_header(f)
+            if n_rows == 0:
+                return None
+            f.seek(offset + (n_rows - 1) * dtype.itemsize)
+            return np.frombuffer(f.read(dtype.itemsize), dtype=dtype)[0]
+
+    df = load_prices(ticker, name)
+    if df is None or df.empty:
+        return None
+    return to_records(df.tail(1))[0]
+
+def last_date(ticker, name=None):
+    """저장된 마지막 거래일 (datetime.date, 데이터가 없으면 None)"""
+    rec = last_record(ticker, name)
+    if rec is None:
+        return None
+    return pd.Timestamp(rec['Date']).date()
+
+def _append_in_place(path, new_rec):
+    """
+    new_rec 가 모두 저장된 마지막 날짜 이후이면 파일 끝에 덧붙이고 True 를 반환합니다.
+    1) 데이터를 먼저 쓰고 2) 헤더의 행 수를 갱신.
+    중간에 중단되면 헤더는 이전 행 수 그대로라 늘어난 꼬리는 읽히지 않음 (다음 추가 때 덮어씀)
+    형식이 다르거나 헤더 길이가 바뀌거나 겹치는 날짜가 있으면 아무것도 쓰지 않고 False.
+    """
+    with open(path, 'r+b') as f:
+        version, n_rows, dtype, offset = _read_header(f)
+        header = _header_bytes(version, n_rows + len(new_rec), new_rec.dtype)
+        if dtype != new_rec.dtype or len(header) != offset:
+            return False
+        if n_rows > 0:
+            f.seek(offset + (n_rows - 1) * dtype.itemsize)
+            stored_last = np.frombuffer(f.read(dtype.itemsize), dtype=dtype)['Date'][0]
+            if new_rec['Date'][0] <= stored_last:
+                return False
+
+        f.seek(offset + n_rows * dtype.itemsize)
+        f.truncate()
+        f.write(new_rec.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+        f.seek(0)
+        f.write(header)
+        f.flush()
+        os.fsync(f.fileno())
+        return True
+
+def append_prices(ticker, new_df, name=None):
+    """
+    새로 받은 행만 저장소에 추가합니다.
+    - 모두 마지막 저장일 이후 행이면: 파일 끝에 레코드만 덧붙이고 헤더의 행 수를 갱신 (기존 이력은 다시 쓰지 않음)
+    - 마지막 저장일 이전/당일 행이 섞여 있으면 (수정된 봉): 겹치는 꼬리 부분을 합쳐 임시 파일 + 교체로 다시 씀
+    - 바이너리 파일이 아직 없으면: 기존 CSV(있다면)와 합쳐 전체 저장
+    """
+    new_rec = to_records(new_df)
+    if len(new_rec) == 0:
+        return
+
+    path = store_path(ticker)
+    if not os.path.exists(path):
+        df = load_prices(ticker, name)
+        if df is not None:
+            new_df = pd.concat([df, new_df])
+            new_df = new_df[~new_df.index.duplicated(keep='last')]
+        save_prices(ticker, new_df, name)
+        return
+
+    with run_metrics.stage('write', ticker):
+        appended = _append_in_place(path, new_rec)
+    if appended:
+        price_catalog.record(ticker, name, appended=new_rec)
+        indicator_cache.extend(ticker, new_rec)
+        data_cache.invalidate(ticker)
+        return
+
+    # 수정된 봉이 있거나 형식이 달라 덧붙일 수 없는 경우: 겹치는 부분부터 합쳐서 다시 씀
+    rec = np.load(path)
+    start = np.searchsorted(rec['Date'], new_rec['Date'][0])
+    tail = from_records(rec[start:])
+    merged = pd.concat([tail, from_records(new_rec)])
+    merged = merged[~merged.index.duplicated(keep='last')]
+    _write_records(ticker, np.concatenate([rec[:start].astype(RECORD_DTYPE), to_records(merged)]), name)
+
+def last_modified(ticker, name=None):
+    """저장된 데이터의 수정 시각 (캐시 무효화용, 없으면 0)"""
+    path = store_path(ticker)
+    if not os.path.exists(path):
+        path = _find_csv(ticker, name)
+    return os.path.getmtime(path) if path else 0
+
+def list_tickers():
+    """저장소(및 미변환 CSV)에 데이터가 있는 종목 코드 목록"""
+    tickers = set()
+    if os.path.isdir(STORE_DIR):
+        tickers.update(f[:-4] for f in os.listdir(STORE_DIR) if f.endswith('.npy'))
+    if os.path.isdir(DATA_DIR):
+        tickers.update(f[:-4].split('_', 1)[0] for f in os.listdir(DATA_DIR) if f.endswith('.csv'))
+    return sorted(tickers)
+
+def migrate(overwrite=False):
+    """stock_data/ 의 CSV 캐시를 바이너리 저장소로 일괄 변환합니다."""
+    os.makedirs(STORE_DIR, exist_ok=True)
+
+    # 종목명이 바뀐 종목은 같은 코드의 CSV가 여러 개 있을 수 있음 (예: 구형 ticker.csv, 변경 전 이름)
+    files_by_ticker = {}
+    for file_name in sorted(os.listdir(DATA_DIR)):
+        if file_name.endswith('.csv'):
+            ticker = file_name[:-4].split('_', 1)[0]
+            files_by_ticker.setdefault(ticker, []).append(os.path.join(DATA_DIR, file_name))
+
+    total = len(files_by_ticker)
+    converted = 0
+
+    for i, (ticker, paths) in enumerate(files_by_ticker.items(), 1):
+        if overwrite or not os.path.exists(store_path(ticker)):
+            try:
+                frames = [pd.read_csv(path, parse_dates=['Date'], index_col='Date') for path in paths]
+                # 가장 최근까지 이어진 (같으면 더 긴) 이력을 사용
+                best = max(range(len(frames)), key=lambda i: (frames[i].index[-1] if len(frames[i]) else pd.Timestamp.min, len(frames[i])))
+                save_prices(ticker, frames[best], _name_from_csv(paths[best]))
+                converted += 1
+            except Exception as e:
+                print(f"\n변환 실패: {ticker} ({e})")
+
+        if i % 100 == 0 or i == total:
+            sys.stdout.write(f"\r[{i}/{total}] 변환 중...")
+            sys.stdout.flush()
+
+    price_catalog.save()
+    print(f"\n{converted}개 종목을 '{STORE_DIR}'로 변환했습니다.")
+
+def main():
+    parser = argparse.ArgumentParser(description="주가 데이터 바이너리 저장소 관리")
+    parser.add_argument('--migrate', action='store_true', help="stock_data/ 의 CSV를 바이너리 저장소로 변환")
+    parser.add_argument('--overwrite', action='store_true', help="이미 변환된 종목도 다시 변환")
+    args = parser.parse_args()
+
+    if args.migrate:
+        migrate(overwrite=args.overwrite)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+import argparse
+import collections
+import contextlib
+import cProfile
+import datetime
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+# 실행(업데이트/스크리닝) 단위 계측
+# - 단계별 소요 시간: universe(종목 목록), read(파일 읽기), fetch(네트워크), indicator(지표 계산),
+#   write(저장), panel(패널 생성) 등을 종목별/실행 전체로 집계합니다.
+#   단계가 겹치면 (예: write 안에서 indicator) 안쪽 단계 시간은 바깥 단계에서 빼고 기록합니다.
+# - 카운터: timeouts(타임아웃), retries(재시도), failures(실패) 등
+# - 실행이 끝나면 run_reports/{kind}_last.json 에 보고서를 쓰고 run_reports/history.jsonl 에 요약을 추가합니다.
+# - 실행을 시작한 코드는 start_run() 이 돌려준 기록기를, 저장소/수집 모듈은 모듈 함수 stage()/count() 를 씁니다.
+#   실행 중이 아니면 모듈 함수는 아무것도 하지 않습니다.
+
+REPORT_DIR = 'run_reports'
+HISTORY_FILE = 'history.jsonl'
+SLOWEST_TICKERS = 20
+PROFILE_TOP = 30
+
+class _Stage:
+    """기록기의 단계 하나 (with 문으로 사용)"""
+    __slots__ = ('run', 'name', 'ticker', 'start')
+
+    def __init__(self, run, name, ticker):
+        self.run = run
+        self.name = name
+        self.ticker = ticker
+
+    def __enter__(self):
+        self.run._stack().append(0.0)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stack = self.run._stack()
+        inner = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        self.run.add(self.name, elapsed - inner, self.ticker)
+        return False
+
+class RunRecorder:
+    """
+    한 번의 실행에 대한 단계별 시간과 카운터를 모읍니다. 여러 스레드에서 동시에 기록할 수 있습니다.
+    kind: 실행 종류 ('update', 'screen' 등, 보고서 파일명에 사용)
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.started_at = datetime.datetime.now()
+        self.finished_at = None
+        self.stages = {}    # 단계 → [초, 횟수]
+        self.counters = collections.Counter()
+        self.tickers = {}   # 종목 → {'seconds': {단계: 초}, 'counts': {카운터: 값}}
+        self.extra = {}
+        self.profile = None
+        self._start = time.perf_counter()
+        self._wall = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _ticker(self, ticker):
+        entry = self.tickers.get(ticker)
+        if entry is None:
+            entry = self.tickers[ticker] = {'seconds': {}, 'counts': {}}
+        return entry
+
+    def stage(self, name, ticker=None):
+        """단계 시간을 재는 컨텍스트 매니저 (ticker 를 주면 종목별로도 기록)"""
+        return _Stage(self, name, ticker)
+
+    def add(self, name, seconds, ticker=None):
+        """직접 잰 단계 시간을 더합니다. (asyncio 처럼 한 스레드에서 단계가 번갈아 실행될 때)"""
+        with self._lock:
+            total = self.stages.get(name)
+            if total is None:
+                total = self.stages[name] = [0.0, 0]
+            total[0] += seconds
+            total[1] += 1
+            if ticker is not None:
+                per_ticker = self._ticker(ticker)['seconds']
+                per_ticker[name] = per_ticker.get(name, 0.0) + seconds
+
+    def count(self, name, n=1, ticker=None):
+        with self._lock:
+            self.counters[name] += n
+            if ticker is not None:
+                counts = self._ticker(ticker)['counts']
+                counts[name] = counts.get(name, 0) + n
+
+    def finish(self):
+        if self._wall is None:
+            self._wall = time.perf_counter() - self._start
+            self.finished_at = datetime.datetime.now()
+
+    def report(self):
+        """보고서 dict (JSON 으로 저장 가능)"""
+        with self._lock:
+            tickers = {ticker: {'seconds': {k: round(v, 6) for k, v in entry['seconds'].items()},
+                                'counts': dict(entry['counts'])}
+                       for ticker, entry in self.tickers.items()}
+            stages = {name: {'seconds': round(seconds, 6), 'calls': calls}
+                      for name, (seconds, calls) in sorted(self.stages.items(), key=lambda item: -item[1][0])}
+            counters = dict(self.counters)
+        totals = sorted(((ticker, sum(entry['seconds'].values())) for ticker, entry in tickers.items()),
+                        key=lambda item: -item[1])
+        wall = self._wall if self._wall is not None else time.perf_counter() - self._start
+        return {
+            'kind': self.kind,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'finished_at': self.finished_at.isoformat(timespec='seconds') if self.finished_at else None,
+            'wall_seconds': round(wall, 6),
+            'stages': stages,
+            'counters': counters,
+            'slowest': [[ticker, round(seconds, 6)] for ticker, seconds in totals[:SLOWEST_TICKERS]],
+            'extra': self.extra,
+            'profile': self.profile,
+            'tickers': tickers,
+        }
+
+# --- 현재 실행 ---
+
+_current = None
+_current_lock = threading.Lock()
+_NULL = contextlib.nullcontext()
+
+def start_run(kind):
+    """
+    새 실행 기록을 시작합니다.
+    이미 다른 실행이 기록 중이면 (예: 스크리닝 중 자정 업데이트) 새 기록기는 자기 단계(run.stage)만 기록하고,
+    저장소/수집 모듈의 세부 단계는 먼저 시작한 실행에 기록됩니다.
+    """
+    global _current
+    run = RunRecorder(kind)
+    with _current_lock:
+        if _current is None:
+            _current = run
+    return run
+
+def current():
+    """세부 단계를 기록 중인 실행 (없으면 None)"""
+    return _current
+
+def stage(name, ticker=None):
+    """현재 실행에 단계 시간을 기록하는 컨텍스트 매니저 (실행 중이 아니면 아무것도 하지 않음)"""
+    run = _current
+    return run.stage(name, ticker) if run is not None else _NULL
+
+def add(name, seconds, ticker=None):
+    run = _current
+    if run is not None:
+        run.add(name, seconds, ticker)
+
+def count(name, n=1, ticker=None):
+    run = _current
+    if run is not None:
+        run.count(name, n, ticker)
+
+def report_path(kind, report_dir=REPORT_DIR):
+    return os.path.join(report_dir, f"{kind}_last.json")
+
+def finish_run(run, report_dir=REPORT_DIR):
+    """실행 기록을 끝내고 보고서를 저장합니다. 반환: 보고서 dict"""
+    global _current
+    run.finish()
+    with _current_lock:
+        if _current is run:
+            _current = None
+
+    report = run.report()
+    os.makedirs(report_dir, exist_ok=True)
+    path = report_path(run.kind, report_dir)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+    summary = {key: value for key, value in report.items() if key not in ('tickers', 'profile')}
+    with open(os.path.join(report_dir, HISTORY_FILE), 'a', encoding='utf-8') as f:
+        f.write(json.dumps(summary, ensure_ascii=False) + '\n')
+    return report
+
+def last_report(kind, report_dir=REPORT_DIR):
+    """마지막 실행 보고서 (없으면 None)"""
+    try:
+        with open(report_path(kind, report_dir), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+# --- 프로파일러 ---
+
+class _Sampler(threading.Thread):
+    """interval 초마다 모든 스레드의 호출 스택을 표본 추출합니다. (작업 스레드까지 포함)"""
+
+    def __init__(self, interval=0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = 0
+        self.own = collections.Counter()    # 스택 맨 위 (실행 중인 함수)
+        self.total = collections.Counter()  # 스택 어딘가에 있는 함수
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident:
+                    continue
+                self.samples += 1
+                seen = set()
+                top = True
+                while frame is not None:
+                    code = frame.f_code
+                    key = f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})"
+                    if top:
+                        self.own[key] += 1
+                        top = False
+                    if key not in seen:
+                        self.total[key] += 1
+                        seen.add(key)
+                    frame = frame.f_back
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def top(self, n=PROFILE_TOP):
+        return [{'function': key, 'own_samples': own, 'total_samples': self.total[key]}
+                for key, own in self.own.most_common(n)]
+
+@contextlib.contextmanager
+def profiled(run, mode=None, report_dir=REPORT_DIR):
+    """
+    실행 구간을 프로파일링해 결과를 run.profile 에 넣습니다. (mode 가 None 이면 아무것도 하지 않음)
+    - 'cprofile': 이 스레드의 모든 함수 호출 (run_reports/{kind}_last.prof 저장, snakeviz 등으로 열기)
+    - 'sample': 모든 스레드의 호출 스택 표본 (오버헤드가 작고 작업 스레드까지 포함)
+    """
+    if mode is None:
+        yield
+        return
+
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            os.makedirs(report_dir, exist_ok=True)
+            path = os.path.join(report_dir, f"{run.kind}_last.prof")
+            profiler.dump_stats(path)
+            stats = pstats.Stats(profiler).stats
+            rows = sorted(stats.items(), key=lambda item: -item[1][3])[:PROFILE_TOP]
+            run.profile = {
+                'mode': mode,
+                'path': path,
+                'top': [{'function': f"{os.path.basename(file)}:{line}({func})", 'calls': nc,
+                         'own_seconds': round(tt, 6), 'total_seconds': round(ct, 6)}
+                        for (file, line, func), (cc, nc, tt, ct, callers) in rows],
+            }
+    elif mode == 'sample':
+        sampler = _Sampler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            run.profile = {'mode': mode, 'interval': sampler.interval, 'samples': sampler.samples,
+                           'top': sampler.top()}
+    else:
+        raise ValueError(f"알 수 없는 프로파일 모드: {mode}")
+
+# --- 출력 ---
+
+def format_report(report, limit=10):
+    """보고서를 사람이 읽는 여러 줄 문자열로 만듭니다."""
+    lines = [f"[{report['kind']}] {report['started_at']} ~ {report['finished_at'] or '-'} "
+             f"(총 {report['wall_seconds']:.1f}초)"]
+    lines.append("단계별 시간 (종목 작업이 병렬이면 합계가 전체 시간보다 클 수 있음):")
+    for name, value in report['stages'].items():
+        lines.append(f"  {name:<12}{value['seconds']:>10.2f}초 {value['calls']:>8}회")
+    if report['counters']:
+        lines.append("카운터: " + ", ".join(f"{name}={value}" for name, value in sorted(report['counters'].items())))
+    if report['extra']:
+        lines.append("정보: " + ", ".join(f"{name}={value}" for name, value in report['extra'].items()))
+    if report['slowest']:
+        lines.append("오래 걸린 종목: " + ", ".join(f"{ticker}({seconds:.2f}s)" for ticker, seconds in report['slowest'][:limit]))
+    if report.get('profile'):
+        lines.append(f"프로파일 ({report['profile']['mode']}):")
+        for row in report['profile']['top'][:limit]:
+            lines.append("  " + ", ".join(f"{key}={value}" for key, value in row.items()))
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="마지막 실행(업데이트/스크리닝) 보고서 보기")
+    parser.add_argument('kind', nargs='?', default='update', help="실행 종류 (update, screen, 기본값: update)")
+    parser.add_argument('--ticker', type=str, help="종목별 단계 시간/카운터 출력")
+    parser.add_argument('--limit', type=int, default=10, help="출력할 종목/프로파일 항목 수 (기본값: 10)")
+    args = parser.parse_args()
+
+    report = last_report(args.kind)
+    if report is None:
+        print(f"'{report_path(args.kind)}' 보고서가 없습니다.")
+        return
+    if args.ticker:
+        print(json.dumps(report['tickers'].get(args.ticker), ensure_ascii=False, indent=2))
+        return
+    print(format_report(report, args.limit))
+
+if __name__ == "__main__":
+    main()
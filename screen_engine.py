@@ -0,0 +1,285 @@
+import numpy as np
+import pandas as pd
+
+# 전 종목 이동평균 돌파 스크리닝 엔진
+# 종목별 DataFrame 대신 price_panel 에서 전 종목을 한 번에 계산합니다.
+# 이동평균은 패널의 종가 누적합(지표 캐시)에서 읽고, 종가는 비교에 필요한 최근 몇 행만 읽습니다.
+# 전일/N일 전/window 일은 종목 자신의 데이터 행 기준입니다. (종목별 rolling(window).mean() 과 같음)
+# 데이터가 빠진 구간이 있는 종목도 빈 칸을 건너뛰고 세므로 이동평균이 NaN 이 되지 않습니다.
+
+def _window_mas(panel, cols, windows, end_rows=None):
+    """
+    패널의 누적 필드(CloseSum, Count)에서 모든 window 의 당일/전일 이동평균을 구합니다.
+    종목마다 마지막 행(또는 end_rows) 기준 데이터 0, 1, window, window+1 개 앞의 값만 읽습니다.
+    데이터가 window 개보다 적으면 해당 이동평균은 NaN 입니다.
+    반환: {window: (latest_ma, prev_ma)}
+    """
+    offsets = sorted({0, 1} | {w for w in windows} | {w + 1 for w in windows})
+    pos = {offset: i for i, offset in enumerate(offsets)}
+    csum = panel.at_offsets('CloseSum', offsets, cols, fill=0, end_rows=end_rows)
+    count = panel.at_offsets('Count', offsets, cols, fill=0, end_rows=end_rows)
+
+    mas = {}
+    for window in windows:
+        ma_pair = []
+        for end in (0, 1):  # 당일, 전일
+            total = csum[pos[end]] - csum[pos[end + window]]
+            filled = count[pos[end]] - count[pos[end + window]] == window
+            ma_pair.append(np.where(filled, total / window, np.nan))
+        mas[window] = tuple(ma_pair)
+    return mas
+
+def _tail_window_mas(close, windows):
+    """
+    최근 종가 배열(행 × 종목)의 누적합 1개로 모든 window 의 당일/전일 이동평균을 구합니다.
+    (패널 없이 종목별 배열로 계산할 때 사용, window 구간에 NaN 이 있으면 NaN)
+    반환: {window: (latest_ma, prev_ma)}
+    """
+    valid = ~np.isnan(close)
+    zeros = np.zeros((1, close.shape[1]))
+    csum = np.concatenate([zeros, np.cumsum(np.where(valid, close, 0), axis=0)])
+    count = np.concatenate([zeros, np.cumsum(valid, axis=0)])
+    n = close.shape[0]
+
+    mas = {}
+    for window in windows:
+        ma_pair = []
+        for end in (n, n - 1):  # 당일, 전일
+            total = csum[end] - csum[end - window]
+            filled = count[end] - count[end - window] == window
+            ma_pair.append(np.where(filled, total / window, np.nan))
+        mas[window] = tuple(ma_pair)
+    return mas
+
+def _conditions(latest_close, prev_close, past_close, n_rows, window, latest_ma, prev_ma, compare_days=None):
+    """
+    조건 평가 (배열 모양은 종목별 1차원, 날짜 × 종목 2차원 모두 가능). 반환: 선택 여부 bool 배열
+    past_close: N일 전 종가 (compare_days 가 없으면 사용하지 않음)
+    """
+    eligible = n_rows >= max(window, 2)
+
+    if compare_days:
+        with np.errstate(invalid='ignore'):
+            compare_condition = (n_rows >= compare_days + 2) & (prev_close > past_close)
+        return eligible & compare_condition
+
+    with np.errstate(invalid='ignore'):
+        ma_condition = (~np.isnan(latest_ma) & ~np.isnan(prev_ma) &
+                        (prev_close <= prev_ma) & (latest_close > latest_ma))
+    return eligible & ma_condition
+
+def _select(codes, names, close, n_rows, window, latest_ma, prev_ma, compare_days=None):
+    """한 (window, compare_days) 조합의 조건을 평가해 결과 DataFrame 을 만듭니다."""
+    ma_col = f'MA{window}'
+    prev_ma_col = f'Prev_MA{window}'
+    columns = ['Code', 'Name', 'Close', ma_col, 'Prev_Close', prev_ma_col, 'Ratio', 'Compare_Price']
+
+    latest_close = close[-1]
+    prev_close = close[-2]
+    # N일 전 종가 (T-N): 마지막 행이 오늘(T), 그 앞이 어제(T-1)
+    past_close = close[-(compare_days + 1)] if compare_days else None
+    selected = _conditions(latest_close, prev_close, past_close, n_rows, window, latest_ma, prev_ma, compare_days)
+
+    results = []
+    for i in np.nonzero(selected)[0]:
+        ma = latest_ma[i]
+        p_ma = prev_ma[i]
+        results.append({
+            'Code': codes[i],
+            'Name': names[i],
+            'Close': latest_close[i],
+            ma_col: round(ma, 2) if pd.notna(ma) else 0,
+            'Prev_Close': prev_close[i],
+            prev_ma_col: round(p_ma, 2) if pd.notna(p_ma) else 0,
+            'Ratio': round((latest_close[i] / ma - 1) * 100, 2) if pd.notna(ma) and ma != 0 else 0,
+            'Compare_Price': past_close[i] if compare_days else 0,
+        })
+    return pd.DataFrame(results, columns=columns)
+
+def screen_many(panel, stocks, windows, compare_days_list=None, as_of=None):
+    """
+    여러 window (및 compare_days) 조합을 한 번에 평가합니다.
+    최근 종가는 한 번만 읽고, 모든 이동평균은 패널의 종가 누적합에서 계산합니다.
+    as_of: 이 날짜(휴장일이면 그 이전 거래일)를 오늘로 보고 평가 (종목별 기준 행만 바꾸고 파일은 자르지 않음)
+
+    - MA 조건: 전일 종가 <= 전일 MA 이고 당일 종가 > 당일 MA
+    - compare_days 지정 시: MA 조건 대신 전일 종가 > N일 전 종가 조건
+    반환: {(window, compare_days): 결과 DataFrame}
+          (Code, Name, Close, MA{window}, Prev_Close, Prev_MA{window}, Ratio, Compare_Price)
+    """
+    windows = list(dict.fromkeys(windows))
+    compare_days_list = list(dict.fromkeys(compare_days_list or [None]))
+
+    codes = stocks['Code'].tolist()
+    names = stocks['Name'].tolist()
+    cols = panel.ticker_index(codes)
+
+    max_compare = max(cd or 0 for cd in compare_days_list)
+    n = max(max_compare + 1, 2)
+    end = None if as_of is None else panel.end_rows(as_of, cols)
+    close = panel.at_offsets('Close', np.arange(n - 1, -1, -1), cols, end_rows=end)
+    n_rows = panel.at_offsets('Count', [0], cols, fill=0, end_rows=end)[0].astype(np.int64)
+
+    mas = _window_mas(panel, cols, windows, end_rows=end)
+
+    results = {}
+    for window in windows:
+        latest_ma, prev_ma = mas[window]
+        for compare_days in compare_days_list:
+            results[(window, compare_days)] = _select(codes, names, close, n_rows, window,
+                                                      latest_ma, prev_ma, compare_days)
+    return results
+
+def screen_crossover(panel, stocks, window, compare_days=None, as_of=None):
+    """단일 window 스크리닝 (screen_many 참고)"""
+    return screen_many(panel, stocks, [window], [compare_days], as_of)[(window, compare_days)]
+
+def _rows(panel, name, start, stop, cols, fill):
+    """패널 start:stop 행의 cols 열 (패널 앞쪽 밖의 행은 fill)"""
+    out = np.full((stop - start, len(cols)), fill, dtype=np.float64)
+    lo = max(start, 0)
+    if stop > lo:
+        out[lo - start:] = panel.field(name)[lo:stop][:, cols]
+    return out
+
+def _gap_column(panel, col):
+    """데이터가 빠진 구간이 있는 종목 한 개의 (Count 열, 데이터 행의 종가, 0 으로 시작하는 종가 누적합)"""
+    count = np.asarray(panel.field('Count')[:, col], dtype=np.int64)
+    data = np.nonzero(np.diff(count, prepend=0) > 0)[0]
+    close = np.asarray(panel.field('Close')[data, col], dtype=np.float64)
+    csum = np.concatenate([[0.0], np.asarray(panel.field('CloseSum')[data, col], dtype=np.float64)])
+    return count, close, csum
+
+def _gap_values(gap, rows, window, compare_days=None):
+    """
+    _gap_column 의 종목을 자기 데이터 행 기준으로 평가합니다. (rows: 패널 행 번호)
+    반환: (prev_close, past_close, latest_ma, prev_ma)
+    """
+    count, close, csum = gap
+    k = count[rows]  # 각 행까지의 데이터 개수
+
+    def close_at(i):  # i 번째(1부터) 데이터의 종가
+        return np.where(i >= 1, close[np.clip(i - 1, 0, None)], np.nan)
+
+    def ma_at(i):  # i 번째 데이터까지 window 개의 이동평균
+        return np.where(i >= window, (csum[np.clip(i, 0, None)] - csum[np.clip(i - window, 0, None)]) / window, np.nan)
+
+    past_close = close_at(k - compare_days) if compare_days else None
+    return close_at(k - 1), past_close, ma_at(k), ma_at(k - 1)
+
+def signal_blocks(panel, cols, window, row_start, row_stop, compare_days=None, block=250):
+    """
+    패널 row_start:row_stop 행의 스크리닝 조건을 block 행씩 날짜 × 종목(cols) 배열로 평가합니다.
+    각 종목은 데이터가 있는 행(거래일)에서만 선택됩니다. (screen_history, 포트폴리오 백테스트 공용)
+    데이터가 빠진 구간이 있는 종목은 따로 자기 데이터 행 기준으로 다시 계산합니다.
+    반환(yield): (블록 첫 행, selected, latest_close, prev_close, past_close, latest_ma, prev_ma)
+    """
+    cols = np.asarray(cols, dtype=np.int64)
+    last_row = panel.last_row[cols]
+    gaps = {i: _gap_column(panel, cols[i]) for i in np.nonzero(np.isin(cols, panel.gap_columns))[0]}
+    # 당일/전일 이동평균(window+1 행 앞 누적합)과 N일 전 종가에 필요한 앞부분
+    lookback = max(window, compare_days or 0) + 1
+
+    for b0 in range(row_start, row_stop, block):
+        b1 = min(b0 + block, row_stop)
+        close = _rows(panel, 'Close', b0 - lookback, b1, cols, np.nan)
+        csum = _rows(panel, 'CloseSum', b0 - lookback, b1, cols, 0)
+        count = _rows(panel, 'Count', b0 - lookback, b1, cols, 0)
+
+        k = lookback  # 블록 첫 행의 위치
+        rows = np.arange(b0, b1)[:, None]
+        latest_close = close[k:]
+        prev_close = close[k - 1:-1].copy()
+        past_close = close[k - compare_days:len(close) - compare_days].copy() if compare_days else None
+        mas = []
+        for shift in (0, 1):  # 당일, 전일
+            cur = slice(k - shift, len(close) - shift)
+            old = slice(k - shift - window, len(close) - shift - window)
+            filled = count[cur] - count[old] == window
+            mas.append(np.where(filled, (csum[cur] - csum[old]) / window, np.nan))
+        latest_ma, prev_ma = mas
+        n_rows = count[k:].astype(np.int64)
+        for i, gap in gaps.items():
+            prev_close[:, i], past, latest_ma[:, i], prev_ma[:, i] = _gap_values(gap, rows[:, 0], window, compare_days)
+            if compare_days:
+                past_close[:, i] = past
+
+        selected = _conditions(latest_close, prev_close, past_close, n_rows, window, latest_ma, prev_ma, compare_days)
+        selected &= ~np.isnan(latest_close) & (rows <= last_row)
+        yield b0, selected, latest_close, prev_close, past_close, latest_ma, prev_ma
+
+def screen_history(panel, stocks, window, start, end, compare_days=None, block=250):
+    """
+    start ~ end 의 모든 거래일에 대해 그날 screen_crossover 가 찾았을 종목(신호)을 한 번에 구합니다.
+    날짜 × 종목 배열로 block 거래일씩 평가하며, 각 종목은 데이터가 있는 날(거래일)에만 평가합니다.
+    (as_of 스크리닝은 종목별로 그날 이전 마지막 거래일의 신호와 같음)
+    반환: Date + screen_crossover 결과 컬럼 (날짜, 종목 목록 순)
+    """
+    ma_col = f'MA{window}'
+    prev_ma_col = f'Prev_MA{window}'
+    columns = ['Date', 'Code', 'Name', 'Close', ma_col, 'Prev_Close', prev_ma_col, 'Ratio', 'Compare_Price']
+
+    codes = np.array(stocks['Code'].tolist(), dtype=object)
+    names = np.array(stocks['Name'].tolist(), dtype=object)
+    cols = panel.ticker_index(codes)
+    keep = cols >= 0
+    codes, names, cols = codes[keep], names[keep], cols[keep]
+
+    row_start = int(np.searchsorted(panel.dates, np.datetime64(start, 'D'), side='left'))
+    row_stop = int(np.searchsorted(panel.dates, np.datetime64(end, 'D'), side='right'))
+
+    frames = []
+    for b0, selected, latest_close, prev_close, past_close, latest_ma, prev_ma in \
+            signal_blocks(panel, cols, window, row_start, row_stop, compare_days, block):
+        r, j = np.nonzero(selected)
+        if len(r) == 0:
+            continue
+
+        ma = latest_ma[r, j]
+        p_ma = prev_ma[r, j]
+        price = latest_close[r, j]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(~np.isnan(ma) & (ma != 0), np.round((price / ma - 1) * 100, 2), 0)
+        frames.append(pd.DataFrame({
+            'Date': pd.DatetimeIndex(panel.dates[b0 + r].astype('M8[ns]')),
+            'Code': codes[j],
+            'Name': names[j],
+            'Close': price,
+            ma_col: np.where(np.isnan(ma), 0, np.round(ma, 2)),
+            'Prev_Close': prev_close[r, j],
+            prev_ma_col: np.where(np.isnan(p_ma), 0, np.round(p_ma, 2)),
+            'Ratio': ratio,
+            'Compare_Price': past_close[r, j] if compare_days else 0,
+        }, columns=columns))
+
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+def screen_arrays(codes, names, closes, windows, compare_days_list=None):
+    """
+    패널 대신 종목별 종가 배열(closes: 1차원 배열 리스트)로 screen_many 와 같은 조건을 평가합니다.
+    방금 다운로드한 종목처럼 패널에 아직 반영되지 않은 종목을 바로 평가할 때 사용합니다.
+    반환: {(window, compare_days): 결과 DataFrame}
+    """
+    windows = list(dict.fromkeys(windows))
+    compare_days_list = list(dict.fromkeys(compare_days_list or [None]))
+
+    max_compare = max(cd or 0 for cd in compare_days_list)
+    n = max(max(windows) + 1, max_compare + 1, 2)
+    close = np.full((n, len(closes)), np.nan)
+    for j, values in enumerate(closes):
+        values = np.asarray(values, dtype=np.float64)[-n:]
+        if len(values):
+            close[n - len(values):, j] = values
+    n_rows = np.array([len(values) for values in closes], dtype=np.int64)
+
+    mas = _tail_window_mas(close, windows)
+
+    results = {}
+    for window in windows:
+        latest_ma, prev_ma = mas[window]
+        for compare_days in compare_days_list:
+            results[(window, compare_days)] = _select(list(codes), list(names), close, n_rows, window,
+                                                      latest_ma, prev_ma, compare_days)
+    return results
@@ -0,0 +1,169 @@
+import pandas as pd
+import threading
+
+import price_catalog
+import price_panel
+import run_metrics
+import stock_filter
+
+# 대시보드 등에서 프로세스 안에 띄워 두고 쓰는 스크리닝 서비스
+# - 전 종목 패널(mmap)을 한 번 열어 두고 계속 재사용합니다.
+#   (클릭할 때마다 stock_filter.py 를 새 프로세스로 실행해 라이브러리/데이터를 다시 읽지 않음)
+# - 종목 목록은 스크리닝마다 krx_universe 캐시에서 읽습니다. (캐시는 거래일마다 한 번 새로 받으므로
+#   대시보드를 계속 띄워 두어도 야간 업데이트 후의 신규 상장/상장 폐지가 반영됨)
+# - 결과는 DataFrame 으로 바로 돌려주고, 진행 상황은 progress(stage, done, total) 콜백으로 알립니다.
+# - 저장소가 바뀌면 (업데이트 후) 다음 스크리닝 때 패널을 다시 엽니다.
+
+class ScreenJob:
+    """
+    백그라운드 스레드에서 실행되는 스트리밍 스크리닝 작업.
+    실행 중에도 result() 로 지금까지 찾은 종목을 볼 수 있습니다.
+    """
+
+    def __init__(self, window, compare_days=None):
+        self.window = window
+        self.compare_days = compare_days
+        self.done = 0
+        self.total = 0
+        self.finished = False
+        self.error = None
+        self._chunks = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _progress(self, stage, done, total):
+        self.done, self.total = done, total
+
+    def _run(self, chunks):
+        run = run_metrics.start_run('screen')
+        run.extra.update({'windows': [self.window], 'compare_days': [self.compare_days]})
+        try:
+            for df in chunks:
+                with self._lock:
+                    self._chunks.append(stock_filter.format_result(df, self.window, self.compare_days))
+        except Exception as e:
+            self.error = e
+            run.count('errors')
+        finally:
+            run.extra['stocks'] = self.total
+            run.extra['found'] = {f"{self.window}/{self.compare_days}": sum(len(df) for df in self._chunks)}
+            run_metrics.finish_run(run)
+            self.finished = True
+
+    @property
+    def running(self):
+        return not self.finished
+
+    def result(self):
+        """지금까지 찾은 종목 (결과 파일과 같은 컬럼 순서, 종목 목록 순서와는 다를 수 있음)"""
+        with self._lock:
+            chunks = list(self._chunks)
+        if not chunks:
+            return stock_filter.format_result(
+                pd.DataFrame(columns=['Code', 'Name', 'Close', f'MA{self.window}', 'Prev_Close',
+                                      f'Prev_MA{self.window}', 'Ratio', 'Compare_Price']),
+                self.window, self.compare_days)
+        return pd.concat(chunks, ignore_index=True)
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.finished
+
+class ScreenService:
+    """
+    stocks: 종목 목록 (Code, Name). 지정하지 않으면 스크리닝할 때마다 KRX 종목 목록 캐시에서 읽습니다.
+    여러 스레드에서 호출해도 스크리닝은 한 번에 하나씩 실행됩니다.
+    """
+
+    def __init__(self, stocks=None):
+        self._stocks = stocks
+        self._panel = None
+        self._missing = set()  # 다운로드에 실패한 (데이터가 없는) 종목: update 가 아니면 다시 시도하지 않음
+        self._lock = threading.Lock()
+
+    @property
+    def stocks(self):
+        if self._stocks is not None:
+            return self._stocks
+        return stock_filter.get_krx_stocks()
+
+    def panel(self):
+        """최신 패널 (저장소가 바뀌었으면 다시 만들어 엶)"""
+        if self._panel is None or price_panel.is_stale(self._panel):
+            self._panel = price_panel.load_panel(verbose=False)
+        return self._panel
+
+    def current_panel(self):
+        """
+        디스크의 현재 패널 (오래되었어도 다시 만들지 않음).
+        스트리밍 스크리닝은 패널 생성 이후 바뀐 종목을 저장소에서 직접 읽으므로 기다리지 않고 바로 시작합니다.
+        """
+        path = price_panel._current_path()
+        if self._panel is None or (path is not None and path != self._panel.path):
+            self._panel = price_panel.load_panel(rebuild_if_stale=False, verbose=False)
+        return self._panel
+
+    def warm_up(self):
+        """종목 목록과 패널을 미리 읽어 둡니다."""
+        with self._lock:
+            self.stocks
+            self.panel()
+
+    def screen_many(self, windows, compare_days_list=None, update=False, limit=None, progress=None):
+        """
+        여러 window/compare_days 조합을 스크리닝합니다. (stock_filter.calculate_ma_and_filter_multi 참고)
+        반환: {(window, compare_days): 결과 DataFrame (결과 파일과 같은 컬럼 순서)}
+        """
+        with self._lock:
+            stocks = self.stocks
+            if limit:
+                stocks = stocks.head(limit)
+            if not update and self._missing:
+                stocks = stocks[~stocks['Code'].isin(self._missing)]
+            results = stock_filter.calculate_ma_and_filter_multi(
+                stocks, windows, update=update, compare_days_list=compare_days_list,
+                progress=progress or (lambda stage, done, total: None), panel=self.panel())
+            stored = set(price_catalog.tickers())
+            self._missing = (self._missing | set(stocks['Code'])) - stored
+        return {(window, compare_days): stock_filter.format_result(df, window, compare_days)
+                for (window, compare_days), df in results.items()}
+
+    def iter_screen(self, window, compare_days=None, update=False, progress=None):
+        """결과를 찾는 대로 DataFrame 조각으로 돌려줍니다. (stock_filter.iter_screen 참고)"""
+        with self._lock:
+            stocks = self.stocks
+            if not update and self._missing:
+                stocks = stocks[~stocks['Code'].isin(self._missing)]
+            for df in stock_filter.iter_screen(stocks, window, compare_days, update=update,
+                                               panel=self.current_panel(), progress=progress):
+                yield df
+            stored = set(price_catalog.tickers())
+            self._missing = (self._missing | set(stocks['Code'])) - stored
+
+    def start_screen(self, window, compare_days=None, update=False):
+        """
+        스트리밍 스크리닝을 백그라운드 스레드에서 시작하고 작업(ScreenJob)을 바로 반환합니다.
+        이미 실행 중인 작업이 있으면 끝난 뒤에 시작됩니다.
+        """
+        job = ScreenJob(window, compare_days)
+        chunks = self.iter_screen(window, compare_days, update=update, progress=job._progress)
+        job._thread = threading.Thread(target=job._run, args=(chunks,), daemon=True)
+        job._thread.start()
+        return job
+
+    def screen(self, window, compare_days=None, update=False, limit=None, progress=None):
+        """단일 window 스크리닝 결과 DataFrame"""
+        return self.screen_many([window], [compare_days], update=update, limit=limit,
+                                progress=progress)[(window, compare_days)]
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_service():
+    """프로세스 전체에서 공유하는 서비스 (처음 호출 시 생성)"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ScreenService()
+        return _service
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+import argparse
+import datetime
+import os
+
+import price_panel
+import screen_engine
+
+# 장중 재스크리닝용 전일(장 마감) 상태
+# 종목별로 전일 종가, window 일 종가 합, 내일 window 에서 빠질 값(dropout)을 저장해 두면
+# 새 봉(또는 장중 현재가) P 하나로 이동평균 돌파를 종목당 O(1) 에 평가할 수 있습니다.
+#   전일 MA = sum_w / w
+#   당일 MA = (sum_w - dropout + P) / w
+# 상태는 매일 밤 업데이트 후 패널에서 만들고 (screen_state.npz), 장중에는 현재가만 받아 평가합니다.
+
+STATE_FILE = 'screen_state.npz'
+DEFAULT_WINDOWS = [5, 10, 20, 60, 120, 200, 300]
+CLOSE_TAIL = 61  # compare_days 비교용으로 보관하는 최근 종가 수 (compare_days <= 60)
+
+def _end_rows(panel, before):
+    """종목별로 before 이전 마지막 데이터 행 (없으면 -1)"""
+    return panel.end_rows(np.datetime64(before, 'D') - np.timedelta64(1, 'D'))
+
+def build_state(panel=None, windows=None, before=None, path=STATE_FILE, tail=CLOSE_TAIL):
+    """
+    패널에서 전 종목의 장 마감 상태를 만들어 저장합니다.
+    before: 이 날짜 이전 봉까지로 상태를 만듦 (기본: 오늘 → 오늘 장중 봉이 저장돼 있어도 제외)
+    """
+    panel = panel or price_panel.load_panel(verbose=False)
+    windows = sorted(set(windows or DEFAULT_WINDOWS))
+    before = before or datetime.datetime.now().date()
+
+    end = _end_rows(panel, before)
+    n_rows = panel.at_offsets('Count', [0], fill=0, end_rows=end)[0].astype(np.int64)
+
+    arrays = {
+        'codes': panel.tickers,
+        'last_date': np.where(end >= 0, panel.dates[np.maximum(end, 0)], np.datetime64('NaT', 'D')),
+        'n_rows': n_rows,
+        # 최근 종가 (오래된 것 → 전일 순)
+        'close_tail': panel.at_offsets('Close', np.arange(tail - 1, -1, -1), end_rows=end),
+        'windows': np.array(windows, dtype=np.int64),
+        'before': np.datetime64(before, 'D'),
+        'built_at': np.array(datetime.datetime.now().timestamp()),
+        'panel_built_at': np.array(panel.meta['built_at']),
+    }
+    for window in windows:
+        csum = panel.at_offsets('CloseSum', [0, window], fill=0, end_rows=end)
+        cnt = panel.at_offsets('Count', [0, window], fill=0, end_rows=end)
+        arrays[f'sum_{window}'] = csum[0] - csum[1]
+        arrays[f'count_{window}'] = (cnt[0] - cnt[1]).astype(np.int64)
+        arrays[f'dropout_{window}'] = panel.at_offsets('Close', [window - 1], end_rows=end)[0]
+
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    return ScreenState(arrays)
+
+class ScreenState:
+    """저장된 장 마감 상태. evaluate() 로 새 가격에 대한 돌파 여부를 평가합니다."""
+
+    def __init__(self, arrays):
+        self._arrays = arrays
+        self.codes = arrays['codes']
+        self.windows = [int(w) for w in arrays['windows']]
+        self.last_date = arrays['last_date']
+        self.n_rows = arrays['n_rows']
+        self.close_tail = arrays['close_tail']
+        self.panel_built_at = float(arrays['panel_built_at'])
+        self.before = np.datetime64(arrays['before'], 'D')
+        self._index = {code: i for i, code in enumerate(self.codes.tolist())}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def evaluate(self, prices, window, compare_days=None, names=None):
+        """
+        prices: 종목 코드 → 새 봉 종가(현재가) (Series 또는 dict)
+        names: 종목 코드 → 종목명 (없으면 코드)
+        반환: screen_engine 과 같은 컬럼의 결과 DataFrame (가격이 없는 종목은 제외)
+        """
+        if window not in self.windows:
+            raise ValueError(f"상태에 {window}일 window 가 없습니다. (저장된 window: {self.windows})")
+        if compare_days and compare_days + 1 > self.close_tail.shape[0]:
+            raise ValueError(f"compare_days 는 {self.close_tail.shape[0] - 1} 이하여야 합니다.")
+
+        prices = pd.Series(prices, dtype='float64')
+        prices = prices[prices.index.isin(self._index)]
+        cols = np.array([self._index[code] for code in prices.index], dtype=np.int64)
+        price = prices.to_numpy()
+
+        sum_w = self._arrays[f'sum_{window}'][cols]
+        count_w = self._arrays[f'count_{window}'][cols]
+        dropout = self._arrays[f'dropout_{window}'][cols]
+
+        # 전일 MA: 전일까지 window 일, 당일 MA: dropout 을 빼고 새 가격을 더한 window 일
+        prev_ma = np.where(count_w == window, sum_w / window, np.nan)
+        dropped = ~np.isnan(dropout)
+        tail_sum = sum_w - np.where(dropped, dropout, 0)
+        tail_count = count_w - dropped
+        with np.errstate(invalid='ignore'):
+            latest_ma = np.where((tail_count == window - 1) & ~np.isnan(price), (tail_sum + price) / window, np.nan)
+
+        close = np.vstack([self.close_tail[:, cols], price])
+        n_rows = np.where(np.isnan(price), 0, self.n_rows[cols] + 1)
+
+        codes = prices.index.tolist()
+        names = names if names is not None else {}
+        return screen_engine._select(codes, [names.get(code, code) for code in codes], close, n_rows,
+                                     window, latest_ma, prev_ma, compare_days)
+
+def load_state(path=STATE_FILE):
+    """저장된 상태 (없으면 None)"""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return ScreenState({key: data[key] for key in data.files})
+
+def is_current(state, panel, windows=(), before=None):
+    """상태가 패널과 같은 데이터, 같은 기준일(before, 기본: 오늘)로 필요한 window 를 모두 포함해 만들어졌는지 확인합니다."""
+    before = np.datetime64(before or datetime.datetime.now().date(), 'D')
+    return (state is not None and state.panel_built_at == panel.meta['built_at'] and state.before == before and
+            all(window in state.windows for window in windows))
+
+def main():
+    parser = argparse.ArgumentParser(description="장중 재스크리닝용 장 마감 상태 생성")
+    parser.add_argument('--window', type=int, nargs='+', default=DEFAULT_WINDOWS, help="상태를 만들 이동평균 기간")
+    parser.add_argument('--before', type=str, help="이 날짜(YYYY-MM-DD) 이전 봉까지로 상태 생성 (기본: 오늘)")
+    args = parser.parse_args()
+
+    before = datetime.datetime.strptime(args.before, '%Y-%m-%d').date() if args.before else None
+    state = build_state(windows=args.window, before=before)
+    dates = state.last_date[~np.isnat(state.last_date)]
+    print(f"상태 생성 완료: {len(state)}개 종목, window {state.windows}, 기준일 {dates.max() if len(dates) else '-'}")
+
+if __name__ == "__main__":
+    main()
@@ -1,130 +1,77 @@
-import FinanceDataReader as fdr
 import pandas as pd
-from tqdm import tqdm
 import argparse
 import datetime
-import os
 import sys
 
-def get_krx_stocks():
-    """KRX(코스피, 코스닥, 코넥스)에 상장된 모든 종목을 가져옵니다."""
-    print("KRX 상장 종목을 가져오는 중...")
-    try:
-        stocks = fdr.StockListing('KRX')
-    except Exception as e:
-        print(f"KRX 전체 리스트 가져오기 실패 ({e}), KOSPI/KOSDAQ 개별 조회로 시도합니다...")
-        try:
-            kospi = fdr.StockListing('KOSPI')
-            kosdaq = fdr.StockListing('KOSDAQ')
-            stocks = pd.concat([kospi, kosdaq])
-        except Exception as e2:
-            print(f"개별 조회도 실패했습니다: {e2}")
-            # 최후의 수단: 로컬 파일(krx_stocks.csv) 로드 시도
-            try:
-                print("로컬 'krx_stocks.csv' 파일에서 종목 리스트를 읽어옵니다...")
-                stocks = pd.read_csv('krx_stocks.csv', dtype={'Code': str}) # Code는 문자열로 읽어야 함 (005930 유지)
-                # fdr.StockListing 결과와 컬럼명을 맞춰주는 것이 좋음 (필요 시)
-            except Exception as e3:
-                print(f"로컬 파일 로드도 실패했습니다: {e3}")
-                raise e3
-            
+import krx_universe
+import price_store
+import price_catalog
+import fetch_pool
+import price_panel
+import screen_engine
+import screen_state
+import run_metrics
+import data_cache
+
+def get_krx_stocks(offline=False):
+    """
+    KRX(코스피, 코스닥, 코넥스)에 상장된 모든 종목을 가져옵니다.
+    로컬 캐시(krx_universe)를 거래일마다 한 번만 새로 받고, offline 이면 캐시만 사용합니다.
+    """
+    with run_metrics.stage('universe'):
+        stocks = krx_universe.load_universe(offline=offline)
     print(f"{len(stocks)}개의 종목을 찾았습니다.")
     return stocks
 
-import concurrent.futures
-
 import concurrent.futures
 import multiprocessing
 
-def fetch_worker(ticker, start_date, queue):
-    """
-    별도 프로세스에서 실행될 데이터 수집 함수
-    """
-    try:
-        # fdr.DataReader가 내부적으로 requests를 쓰는데, 여기서도 타임아웃이 안 먹힐 수 있으므로
-        # 프로세스 강제 종료가 가장 확실함
-        df = fdr.DataReader(ticker, start=start_date)
-        queue.put(df)
-    except Exception:
-        queue.put(pd.DataFrame())
-
 def fetch_data_with_timeout(ticker, start_date, timeout=30):
     """
-    multiprocessing을 사용하여 타임아웃을 강제합니다.
+    상주 워커 프로세스 풀(fetch_pool)에서 데이터를 가져오며 타임아웃을 강제합니다.
+    fdr.DataReader가 내부적으로 requests를 쓰는데, 여기서는 타임아웃이 안 먹힐 수 있으므로
+    응답 없는 워커는 풀에서 강제 종료 후 교체됩니다. (실패/타임아웃 시 빈 데이터프레임)
     """
-    queue = multiprocessing.Queue()
-    p = multiprocessing.Process(target=fetch_worker, args=(ticker, start_date, queue))
-    p.start()
-    
-    try:
-        # 큐에서 데이터를 기다림 (타임아웃 적용)
-        df = queue.get(timeout=timeout)
-        
-        # 데이터는 받았지만 프로세스가 아직 안 끝났을 수 있음
-        p.join(timeout=1) 
-        if p.is_alive():
-            p.terminate()
-            p.join()
-            
-        return df
-    except multiprocessing.queues.Empty:
-        # 타임아웃 (데이터가 안 옴)
-        if p.is_alive():
-            p.terminate()
-            p.join()
-        # 타임아웃 에러는 로그 없이 조용히 넘어가거나, 필요하면 로그 남김
-        # 여기서는 빈 데이터프레임 반환으로 처리하여 진행 계속
-        return pd.DataFrame()
-    except Exception as e:
-        if p.is_alive():
-            p.terminate()
-            p.join()
-        return pd.DataFrame()
-
-import re
-
-def sanitize_filename(name):
-    """파일명으로 사용할 수 없는 문자를 제거합니다."""
-    return re.sub(r'[\\/*?:"<>|]', "", name)
+    return fetch_pool.get_pool().fetch(ticker, start_date, timeout=timeout)
 
 def get_stock_data(ticker, name, start_date, update=False):
     """
     주가 데이터를 가져옵니다. 로컬 캐시가 있으면 사용하고,
     update가 True이거나 캐시가 없으면 다운로드합니다.
-    파일명 형식: {ticker}_{name}.csv
+    저장 위치: price_store/{ticker}.npy (미변환 종목은 기존 stock_data/{ticker}_{name}.csv 를 읽음)
+    이력 부족/최신 여부는 카탈로그(price_catalog)로 판단하고, 필요한 경우에만 다운로드합니다.
     """
-    data_dir = 'stock_data'
-    os.makedirs(data_dir, exist_ok=True)
-    
-    safe_name = sanitize_filename(name)
-    file_name = f"{ticker}_{safe_name}.csv"
-    file_path = os.path.join(data_dir, file_name)
-    
-    # 구형 파일명(ticker.csv)이 존재하면 신규 형식으로 변경 시도
-    old_file_path = os.path.join(data_dir, f'{ticker}.csv')
-    if os.path.exists(old_file_path) and not os.path.exists(file_path):
-        try:
-            os.rename(old_file_path, file_path)
-        except:
-            pass 
-
     try:
-        if os.path.exists(file_path):
-            # 로컬 파일 로드
-            df = pd.read_csv(file_path, parse_dates=['Date'], index_col='Date')
-            
-            # 데이터 시작일 확인 (요청한 start_date보다 데이터가 늦게 시작하면, 과거 데이터가 부족한 것임)
-            # 여유를 조금 두기 위해 30일 정도 차이는 허용 (휴장일 등 고려)
-            req_start = datetime.datetime.strptime(start_date, '%Y-%m-%d')
-            if df.index[0] > req_start + datetime.timedelta(days=30):
-                # 과거 데이터 부족 -> 새로 다운로드
-                df = fetch_data_with_timeout(ticker, start_date, timeout=10)
-                if not df.empty:
-                    try:
-                        df.to_csv(file_path)
-                    except:
-                        pass
-                return df
+        in_catalog = price_catalog.get(ticker) is not None
+        if in_catalog and not price_catalog.covers(ticker, start_date):
+            # 과거 데이터 부족 (요청한 start_date보다 30일 이상 늦게 시작) -> 새로 다운로드
+            df = fetch_data_with_timeout(ticker, start_date, timeout=10)
+            if not df.empty:
+                try:
+                    price_store.save_prices(ticker, df, name)
+                except:
+                    pass
+            return df
+
+        df = price_store.load_prices(ticker, name)
+        if df is not None:
+            if not in_catalog:
+                # 미변환 CSV: 데이터 시작일 확인 (여유를 조금 두기 위해 30일 정도 차이는 허용, 휴장일 등 고려)
+                req_start = datetime.datetime.strptime(start_date, '%Y-%m-%d')
+                if df.index[0] > req_start + datetime.timedelta(days=30):
+                    # 과거 데이터 부족 -> 새로 다운로드
+                    df = fetch_data_with_timeout(ticker, start_date, timeout=10)
+                    if not df.empty:
+                        try:
+                            price_store.save_prices(ticker, df, name)
+                        except:
+                            pass
+                    return df
+                # 다음 실행부터 카탈로그로 조회되도록 저장소로 옮겨 둠
+                try:
+                    price_store.save_prices(ticker, df, name)
+                except:
+                    pass
 
             if update:
                 # 마지막 날짜 확인 후 업데이트
@@ -138,7 +85,7 @@ def get_stock_data(ticker, name, start_date, update=False):
                         if not new_df.empty:
                             df = pd.concat([df, new_df])
                             df = df[~df.index.duplicated(keep='last')] # 중복 제거
-                            df.to_csv(file_path)
+                            price_store.append_prices(ticker, new_df, name) # 새 행만 파일 끝에 추가
                     except Exception as e:
                         pass # 업데이트 실패 시 기존 데이터 사용
             return df
@@ -147,7 +94,7 @@ def get_stock_data(ticker, name, start_date, update=False):
             df = fetch_data_with_timeout(ticker, start_date, timeout=10)
             if not df.empty:
                 try:
-                    df.to_csv(file_path)
+                    price_store.save_prices(ticker, df, name)
                 except:
                     pass
             return df
@@ -156,13 +103,13 @@ def get_stock_data(ticker, name, start_date, update=False):
         try:
             df = fetch_data_with_timeout(ticker, start_date, timeout=30)
             if not df.empty:
-                df.to_csv(file_path)
+                price_store.save_prices(ticker, df, name)
             return df
         except:
             return pd.DataFrame()
 
-def process_stock(row, window, update, compare_days=None):
-    """개별 종목 처리 함수 (병렬 실행용)"""
+def prepare_stock(row, window, update, compare_days=None):
+    """개별 종목 데이터 준비 함수 (병렬 실행용): 저장소에 없거나 update 시 다운로드"""
     ticker = row['Code']
     name = row['Name']
     
@@ -173,147 +120,331 @@ def process_stock(row, window, update, compare_days=None):
         start_date = (datetime.datetime.now() - datetime.timedelta(days=needed_days*2 + 365)).strftime('%Y-%m-%d')
         
         # 캐싱된 데이터 가져오기 함수 사용
-        df = get_stock_data(ticker, name, start_date, update=update)
-        
-        if len(df) < window:
-            return None
+        get_stock_data(ticker, name, start_date, update=update)
+    except Exception as e:
+        run_metrics.count('errors', ticker=ticker)
 
-        # N일 단순 이동평균(SMA) 계산
-        ma_col = f'MA{window}'
-        df[ma_col] = df['Close'].rolling(window=window).mean()
-        
-        # 최근 2개의 데이터 포인트 가져오기
-        if len(df) < 2:
-            return None
-            
-        latest = df.iloc[-1]
-        prev = df.iloc[-2]
-        
-        latest_close = latest['Close']
-        latest_ma = latest[ma_col]
-        prev_close = prev['Close']
-        prev_ma = prev[ma_col]
-        
+def download_targets(stocks, update=False, offline=False):
+    """
+    카탈로그 기준으로 다운로드할 종목을 고릅니다.
+    update 시에는 최신이 아닌 종목, 아니면 저장소에 아직 없는 종목 (offline 이면 없음)
+    """
+    price_catalog.sync(save_changes=False)
+    if offline:
+        return stocks.iloc[:0]
+    if update:
+        today = datetime.datetime.now().date()
+        return stocks[[price_catalog.needs_update(code, today) for code in stocks['Code']]]
+    stored = set(price_catalog.tickers())
+    return stocks[~stocks['Code'].isin(stored)]
 
-        
-        # 가격 비교 필터 (이동평균 필터와 별개로 동작하거나 함께 동작)
-        # 여기서는 이동평균 조건이 만족되지 않아도, 가격 비교 조건이 있으면 체크하도록 로직을 수정해야 함
-        # 하지만 사용자가 "이평선 말고"라고 했으므로, 이평선 조건은 무시하고 가격 비교만 할 수도 있어야 함.
-        # 구조상 MA 필터가 메인이므로, compare_days가 설정되면 MA 조건 대신(혹은 추가로) 이걸 체크하는 식으로 변경
-        
-        result = {}
-        ma_condition = False
-        
-        # MA 조건 체크
-        if (pd.notna(latest_ma) and pd.notna(prev_ma) and
-            prev_close <= prev_ma and latest_close > latest_ma):
-            ma_condition = True
-            
-        compare_condition = False
-        compare_price = 0
-        
-        if compare_days:
-            # 데이터 충분한지 확인
-            if len(df) >= compare_days + 2:
-                # N일 전 종가 (T-N)
-                # iloc[-1]이 오늘, iloc[-2]가 어제(T-1)
-                # T-N은 iloc[-(N+1)]
-                past_data = df.iloc[-(compare_days + 1)]
-                past_close = past_data['Close']
-                compare_price = past_close
-                
-                # 조건: 전날 종가가 N일 전 종가를 돌파 (Prev_Close > Past_Close)
-                if prev_close > past_close:
-                    compare_condition = True
-        
-        # 결과 반환 로직
-        # 1. compare_days가 없으면 기존 MA 조건만 본다.
-        # 2. compare_days가 있으면 MA 조건 무시하고(또는 AND/OR?) 사용자의 요청은 "이평선 말고" 였으므로
-        #    compare_days가 있으면 그것만 만족해도 리턴하도록 함.
-        
-        if (compare_days and compare_condition) or (not compare_days and ma_condition):
-             return {
-                'Code': ticker,
-                'Name': name,
-                'Close': latest_close,
-                f'MA{window}': round(latest_ma, 2) if pd.notna(latest_ma) else 0,
-                'Prev_Close': prev_close,
-                f'Prev_MA{window}': round(prev_ma, 2) if pd.notna(prev_ma) else 0,
-                'Ratio': round((latest_close / latest_ma - 1) * 100, 2) if pd.notna(latest_ma) and latest_ma != 0 else 0,
-                'Compare_Price': compare_price if compare_days else 0
-            }
-            
-    except Exception as e:
-        return None
-    return None
+def print_progress(stage, done, total):
+    """기본 진행 상황 출력: PROGRESS:현재/전체 (대시보드 이전 버전이 stdout 에서 읽는 형식)"""
+    sys.stdout.write(f"\rPROGRESS:{done}/{total}")
+    sys.stdout.flush()
+    if stage == 'done':
+        print() # 줄바꿈
 
-def calculate_ma_and_filter(stocks, window=300, limit=None, update=False, compare_days=None):
+def calculate_ma_and_filter_multi(stocks, windows, limit=None, update=False, compare_days_list=None,
+                                  progress=None, panel=None, offline=False, as_of=None):
     """
-    병렬 처리를 이용하여 주가 데이터를 가져오고 필터링합니다.
+    필요한 종목 데이터를 병렬로 준비한 뒤, 전 종목 패널에서 여러 window/compare_days 조합을 한 번에 필터링합니다.
+    progress(stage, done, total): 진행 상황 콜백 (stage: 'prepare' 데이터 준비, 'done' 완료)
+                                  지정하지 않으면 PROGRESS:x/y 를 출력합니다.
+    panel: 이미 열어 둔 PricePanel (데이터를 새로 받지 않았을 때만 사용)
+    offline: 다운로드 없이 저장된 데이터만으로 계산
+    as_of: 이 날짜를 오늘로 보고 평가 (과거 시점 스크리닝, screen_engine.screen_many 참고)
+    반환: {(window, compare_days): 결과 DataFrame}
     """
-    results = []
-    
+    progress = progress or print_progress
     if limit:
         print(f"테스트를 위해 상위 {limit}개 종목만 분석합니다.")
         stocks = stocks.head(limit)
         
     total = len(stocks)
-    print(f"병렬 처리 시작 (Workers: 4)...")
+    max_window = max(windows)
+    max_compare = max((cd for cd in compare_days_list or [] if cd), default=None)
     
-    # 병렬 처리 (ProcessPoolExecutor 대신 ThreadPoolExecutor 사용 + 내부에서 multiprocessing.Process)
-    # 이유: ThreadPool이 가볍고, 내부에서 개별적으로 Process를 띄워 타임아웃 제어하는 구조가 더 안정적일 수 있음
-    # 다만 너무 많은 프로세스 생성 부하를 줄이기 위해 workers 수를 조절
-    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-        # 각 종목에 대해 process_stock 함수 실행 예약
-        future_to_stock = {executor.submit(process_stock, row, window, update, compare_days): row['Code'] for _, row in stocks.iterrows()}
+    targets = download_targets(stocks, update, offline)
+
+    if len(targets):
+        print(f"병렬 처리 시작 (Workers: 4)...")
         
-        completed_count = 0
-        for future in concurrent.futures.as_completed(future_to_stock):
-            completed_count += 1
+        # 병렬 처리: 스레드 4개가 종목을 나눠 맡고, 다운로드는 상주 워커 프로세스 풀(fetch_pool)에 맡김
+        # (타임아웃된 워커만 강제 종료 후 교체하므로 종목마다 프로세스를 새로 띄우지 않음)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(prepare_stock, row, max_window, update, max_compare) for _, row in targets.iterrows()]
             
-            # 진행 상황 출력 (10개 단위로)
-            if completed_count % 10 == 0 or completed_count == total:
-                sys.stdout.write(f"\rPROGRESS:{completed_count}/{total}")
-                sys.stdout.flush()
+            completed_count = 0
+            for future in concurrent.futures.as_completed(futures):
+                completed_count += 1
                 
-            try:
-                result = future.result()
-                if result:
-                    results.append(result)
-            except Exception as e:
-                pass
-
-    print() # 줄바꿈
+                # 진행 상황 알림 (10개 단위로)
+                if completed_count % 10 == 0 or completed_count == len(targets):
+                    progress('prepare', completed_count, total)
+        if progress is print_progress:
+            print() # 줄바꿈
+        price_catalog.save()
+        panel = None  # 저장소가 바뀌었으므로 다시 확인
+
+    # 전 종목 패널에서 모든 조합을 한 번에 계산 (저장소가 바뀌었으면 패널을 다시 만듦)
+    if panel is None or price_panel.is_stale(panel):
+        with run_metrics.stage('panel'):
+            panel = price_panel.load_panel()
+    with run_metrics.stage('screen'):
+        results = screen_engine.screen_many(panel, stocks, windows, compare_days_list, as_of=as_of)
+    
+    progress('done', total, total)
     return results
 
+def with_stored_tickers(stocks):
+    """
+    과거 시점 평가용 종목 목록: 현재 종목 목록에 없는 저장소 종목(상장 폐지 등)을 카탈로그의 이름으로 덧붙입니다.
+    (현재 상장 종목만 보면 그 시점에 거래되던 폐지 종목이 빠지므로)
+    """
+    listed = set(stocks['Code'])
+    extra = [(code, (price_catalog.get(code) or {}).get('name') or code)
+             for code in price_catalog.tickers() if code not in listed]
+    if not extra:
+        return stocks
+    return pd.concat([stocks, pd.DataFrame(extra, columns=['Code', 'Name'])], ignore_index=True)
+
+def signal_history(stocks, windows, start, end, compare_days_list=None, panel=None):
+    """
+    start ~ end 의 거래일마다 스크리닝했을 때의 신호 전체 (screen_engine.screen_history 참고)
+    저장된 데이터만 사용합니다. 반환: {(window, compare_days): Date 컬럼이 붙은 결과 DataFrame}
+    """
+    compare_days_list = list(dict.fromkeys(compare_days_list or [None]))
+    if panel is None or price_panel.is_stale(panel):
+        with run_metrics.stage('panel'):
+            panel = price_panel.load_panel()
+    with run_metrics.stage('screen'):
+        return {(window, compare_days): screen_engine.screen_history(panel, stocks, window, start, end, compare_days)
+                for window in dict.fromkeys(windows) for compare_days in compare_days_list}
+
+def _screen_from_store(rows, window, compare_days=None):
+    """패널을 거치지 않고 저장소에서 바로 읽어 평가합니다. (rows: (Code, Name) 리스트)"""
+    codes, names, closes = [], [], []
+    for code, name in rows:
+        rec = price_store.load_records(code)
+        if rec is None:
+            df = price_store.load_prices(code, name)
+            if df is None or df.empty:
+                continue
+            closes.append(df['Close'].to_numpy(dtype='float64'))
+        else:
+            closes.append(rec['Close'])
+        codes.append(code)
+        names.append(name)
+    if not codes:
+        return None
+    return screen_engine.screen_arrays(codes, names, closes, [window], [compare_days])[(window, compare_days)]
+
+def iter_screen(stocks, window, compare_days=None, update=False, offline=False, panel=None,
+                progress=None, chunk_size=100):
+    """
+    스크리닝 결과를 평가되는 대로 조각(DataFrame)으로 돌려주는 제너레이터.
+    1) 다운로드가 필요 없고 패널에 반영된 종목: 패널에서 한 번에 평가해 바로 반환 (첫 결과까지 대기 최소화)
+    2) 패널 생성 이후 파일이 바뀐 종목: 저장소에서 직접 읽어 chunk_size 개씩 평가
+    3) 다운로드가 필요한 종목: 받는 즉시 하나씩 평가
+    progress(stage, done, total): stage 는 'screen' (평가 중), 'done' (완료)
+    결과가 없는 조각은 반환하지 않습니다.
+    """
+    progress = progress or (lambda stage, done, total: None)
+    total = len(stocks)
+    targets = download_targets(stocks, update, offline)
+    target_codes = set(targets['Code'])
+
+    if panel is None:
+        with run_metrics.stage('panel'):
+            panel = price_panel.load_panel(rebuild_if_stale=False, verbose=False)
+    built_at = panel.meta['built_at']
+    in_panel = set(panel.tickers.tolist())
+
+    # 패널 값을 그대로 쓸 수 있는 종목 / 저장소에서 다시 읽어야 하는 종목
+    ready, changed = [], []
+    for code, name in zip(stocks['Code'], stocks['Name']):
+        if code in target_codes:
+            continue
+        entry = price_catalog.get(code)
+        if code in in_panel and (entry is None or entry['mtime'] <= built_at):
+            ready.append(code)
+        else:
+            changed.append((code, name))
+
+    done = 0
+    if ready:
+        with run_metrics.stage('screen'):
+            df = screen_engine.screen_crossover(panel, stocks[stocks['Code'].isin(ready)], window, compare_days)
+        done += len(ready)
+        progress('screen', done, total)
+        if not df.empty:
+            yield df
+
+    for start in range(0, len(changed), chunk_size):
+        chunk = changed[start:start + chunk_size]
+        with run_metrics.stage('screen'):
+            df = _screen_from_store(chunk, window, compare_days)
+        done += len(chunk)
+        progress('screen', done, total)
+        if df is not None and not df.empty:
+            yield df
+
+    if len(targets):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            futures = {executor.submit(prepare_stock, row, window, update, compare_days): (row['Code'], row['Name'])
+                       for _, row in targets.iterrows()}
+            for future in concurrent.futures.as_completed(futures):
+                with run_metrics.stage('screen'):
+                    df = _screen_from_store([futures[future]], window, compare_days)
+                done += 1
+                progress('screen', done, total)
+                if df is not None and not df.empty:
+                    yield df
+        price_catalog.save()
+
+    progress('done', total, total)
+
+def intraday_screen(stocks, windows, compare_days_list=None, prices=None):
+    """
+    장중 재스크리닝: 전일 장 마감 상태(screen_state)와 현재가만으로 전 종목을 종목당 O(1) 에 평가합니다.
+    prices: 종목 코드 → 현재가 (기본: stocks 의 Close, 당일 시세가 들어 있는 KRX 종목 목록)
+    상태가 없거나 패널/기준일/window 가 맞지 않으면 패널에서 새로 만듭니다.
+    반환: {(window, compare_days): 결과 DataFrame}
+    """
+    compare_days_list = list(dict.fromkeys(compare_days_list or [None]))
+    panel = price_panel.load_panel(verbose=False)
+    state = screen_state.load_state()
+    if not screen_state.is_current(state, panel, windows):
+        state = screen_state.build_state(panel, windows=set(screen_state.DEFAULT_WINDOWS) | set(windows))
+
+    if prices is None:
+        prices = pd.to_numeric(stocks.set_index('Code')['Close'], errors='coerce')
+    names = dict(zip(stocks['Code'], stocks['Name']))
+    return {(window, compare_days): state.evaluate(prices, window, compare_days, names)
+            for window in dict.fromkeys(windows) for compare_days in compare_days_list}
+
+def calculate_ma_and_filter(stocks, window=300, limit=None, update=False, compare_days=None):
+    """단일 window 필터링 (결과: 종목별 dict 리스트)"""
+    results = calculate_ma_and_filter_multi(stocks, [window], limit=limit, update=update,
+                                            compare_days_list=[compare_days])
+    return results[(window, compare_days)].to_dict('records')
+
+def format_result(df_result, window, compare_days=None):
+    """결과 파일/화면용 컬럼 순서: (Date,) Code, Name, Close, MA, Ratio, Prev_Close, Prev_MA (+ Compare_Price)"""
+    cols = ['Date'] if 'Date' in df_result.columns else []
+    cols += ['Code', 'Name', 'Close', f'MA{window}', 'Ratio', 'Prev_Close', f'Prev_MA{window}']
+    if compare_days:
+        cols.append('Compare_Price')
+    return df_result[cols]
+
+def save_result(df_result, window, compare_days, output_file):
+    """결과를 CSV(utf-8-sig)로 저장합니다. (대시보드 캐시의 이전 결과는 버림)"""
+    format_result(df_result, window, compare_days).to_csv(output_file, index=False, encoding='utf-8-sig')
+    data_cache.invalidate(output_file)
+
+def output_file_name(window, compare_days=None, multi_compare=False, as_of=None):
+    """
+    결과 파일명: stocks_above_{window}ma.csv (비교 기간이 여러 개면 _cmp{N} 추가)
+    as_of 가 있으면 날짜를 붙임: stocks_above_{window}ma_{YYYYMMDD}.csv (현재 결과 파일은 그대로 둠)
+    """
+    name = f'stocks_above_{window}ma'
+    if compare_days and multi_compare:
+        name += f'_cmp{compare_days}'
+    if as_of:
+        name += f'_{as_of:%Y%m%d}'
+    return f'{name}.csv'
+
+def history_file_name(window, start, end, compare_days=None, multi_compare=False):
+    """신호 이력 파일명: signals_{window}ma_{시작일}_{종료일}.csv (비교 기간이 여러 개면 _cmp{N} 추가)"""
+    name = f'signals_{window}ma'
+    if compare_days and multi_compare:
+        name += f'_cmp{compare_days}'
+    return f'{name}_{start:%Y%m%d}_{end:%Y%m%d}.csv'
+
 def main():
     parser = argparse.ArgumentParser(description="이동평균선을 상향 돌파한 KRX 종목 필터링")
-    parser.add_argument('--window', type=int, default=300, help="이동평균선 기간 (기본값: 300)")
+    parser.add_argument('--window', type=int, nargs='+', default=[300], help="이동평균선 기간, 여러 개 지정 가능 (기본값: 300)")
     parser.add_argument('--limit', type=int, help="분석할 종목 수 제한 (테스트용)")
-    parser.add_argument('--output', type=str, help="결과를 저장할 CSV 파일명 (미지정 시 자동 생성)")
+    parser.add_argument('--output', type=str, help="결과를 저장할 CSV 파일명 (미지정 시 자동 생성, 조합이 하나일 때만 사용 가능)")
     parser.add_argument('--update', action='store_true', help="기존 데이터가 있어도 최신 데이터로 업데이트 시도")
-    parser.add_argument('--compare-days', type=int, help="N일 전 종가와 비교하여 필터링 (N일 전 종가 > 전일 종가)")
+    parser.add_argument('--compare-days', type=int, nargs='+', help="N일 전 종가와 비교하여 필터링 (N일 전 종가 > 전일 종가), 여러 개 지정 가능")
+    parser.add_argument('--offline', action='store_true', help="네트워크 없이 캐시된 종목 목록과 저장된 데이터만 사용")
+    parser.add_argument('--intraday', action='store_true', help="전일 장 마감 상태와 KRX 종목 목록의 현재가로 빠르게 재스크리닝 (이력 다시 읽지 않음)")
+    parser.add_argument('--as-of', type=datetime.date.fromisoformat, metavar='DATE',
+                        help="이 날짜(YYYY-MM-DD)를 오늘로 보고 스크리닝 (결과 파일명에 날짜가 붙음)")
+    parser.add_argument('--range', type=datetime.date.fromisoformat, nargs=2, metavar=('START', 'END'),
+                        help="기간 안의 모든 거래일 신호 이력을 한 번에 계산 (signals_{N}ma_{시작}_{종료}.csv)")
+    parser.add_argument('--profile', choices=['cprofile', 'sample'], help="실행 구간 프로파일링 (결과는 run_reports/screen_last.json)")
     args = parser.parse_args()
 
-    window = args.window
-    output_file = args.output if args.output else f'stocks_above_{window}ma.csv'
+    windows = list(dict.fromkeys(args.window))
+    compare_days_list = list(dict.fromkeys(args.compare_days)) if args.compare_days else [None]
+    multi_compare = len(compare_days_list) > 1
+    if args.output and len(windows) * len(compare_days_list) > 1:
+        parser.error("--output 은 window/compare-days 조합이 하나일 때만 사용할 수 있습니다.")
+    if args.offline and args.update:
+        parser.error("--offline 과 --update 는 함께 사용할 수 없습니다.")
+    if args.intraday and (args.offline or args.update):
+        parser.error("--intraday 는 --offline/--update 와 함께 사용할 수 없습니다.")
+    if (args.as_of or args.range) and (args.intraday or args.update):
+        parser.error("--as-of/--range 는 --intraday/--update 와 함께 사용할 수 없습니다.")
+    if args.as_of and args.range:
+        parser.error("--as-of 와 --range 는 함께 사용할 수 없습니다.")
+    if args.range and args.range[0] > args.range[1]:
+        parser.error("--range 의 시작일이 종료일보다 늦습니다.")
 
-    stocks = get_krx_stocks()
-    
-    # update 인자 전달
-    filtered_stocks = calculate_ma_and_filter(stocks, window=window, limit=args.limit, update=args.update, compare_days=args.compare_days)
+    run = run_metrics.start_run('screen')
+    run.extra.update({'windows': windows, 'compare_days': compare_days_list, 'intraday': args.intraday,
+                      'as_of': args.as_of and args.as_of.isoformat(),
+                      'range': args.range and [date.isoformat() for date in args.range]})
+    try:
+        with run_metrics.profiled(run, args.profile):
+            if args.intraday:
+                # 현재가가 필요하므로 종목 목록은 캐시가 있어도 새로 받음
+                with run.stage('universe'):
+                    stocks = krx_universe.load_universe(refresh_cache=True)
+                if args.limit:
+                    stocks = stocks.head(args.limit)
+                with run.stage('screen'):
+                    all_results = intraday_screen(stocks, windows, compare_days_list)
+            elif args.range:
+                # 과거 기간: 그 사이 상장 폐지된 종목도 포함, 저장된 데이터만 사용
+                stocks = with_stored_tickers(get_krx_stocks(offline=args.offline))
+                if args.limit:
+                    stocks = stocks.head(args.limit)
+                all_results = signal_history(stocks, windows, args.range[0], args.range[1], compare_days_list)
+            else:
+                stocks = get_krx_stocks(offline=args.offline)
+                if args.as_of:
+                    stocks = with_stored_tickers(stocks)
+
+                # 모든 조합을 한 번의 데이터 로드로 계산
+                all_results = calculate_ma_and_filter_multi(stocks, windows, limit=args.limit, update=args.update,
+                                                            compare_days_list=compare_days_list, offline=args.offline,
+                                                            as_of=args.as_of)
+        run.extra['stocks'] = len(stocks)
+        run.extra['found'] = {f"{window}/{compare_days}": len(df) for (window, compare_days), df in all_results.items()}
+    finally:
+        run_metrics.finish_run(run)
     
-    if filtered_stocks:
-        df_result = pd.DataFrame(filtered_stocks)
-        cols = ['Code', 'Name', 'Close', f'MA{window}', 'Ratio', 'Prev_Close', f'Prev_MA{window}']
-        if args.compare_days:
-            cols.append('Compare_Price')
-        df_result = df_result[cols]
-        df_result.to_csv(output_file, index=False, encoding='utf-8-sig')
-        print(f"\n분석 완료! 결과가 '{output_file}'에 저장되었습니다. (총 {len(df_result)}개 종목)")
-        print(df_result.head())
-    else:
-        print(f"\n조건({window}일 이동평균 돌파)에 맞는 종목을 찾지 못했습니다.")
+    for (window, compare_days), df_result in all_results.items():
+        if args.range:
+            output_file = args.output or history_file_name(window, args.range[0], args.range[1], compare_days, multi_compare)
+        else:
+            output_file = args.output or output_file_name(window, compare_days, multi_compare, args.as_of)
+        
+        if not df_result.empty:
+            df_result = format_result(df_result, window, compare_days)
+            save_result(df_result, window, compare_days, output_file)
+            if args.range:
+                print(f"\n분석 완료! 신호 이력이 '{output_file}'에 저장되었습니다. "
+                      f"(총 {len(df_result)}건, {df_result['Date'].nunique()}거래일)")
+            else:
+                print(f"\n분석 완료! 결과가 '{output_file}'에 저장되었습니다. (총 {len(df_result)}개 종목)")
+            print(df_result.head())
+        else:
+            print(f"\n조건({window}일 이동평균 돌파)에 맞는 종목을 찾지 못했습니다.")
 
 if __name__ == "__main__":
     # Windows에서 multiprocessing 사용 시 필요
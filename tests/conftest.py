@@ -0,0 +1,46 @@
+import importlib
+import os
+import sys
+import types
+
+import pandas as pd
+import pytest
+
+# 저장소 루트의 모듈(price_store 등)을 바로 import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import price_catalog
+import data_cache
+
+def make_prices(dates, closes, **columns):
+    """테스트용 일봉 DataFrame (Open/High/Low 기본값은 종가, Volume 기본값 1000)"""
+    df = pd.DataFrame({'Close': closes}, index=pd.DatetimeIndex(dates, name='Date'))
+    for col in ['Open', 'High', 'Low']:
+        df[col] = columns.get(col, df['Close'])
+    df['Volume'] = columns.get('Volume', 1000)
+    return df[['Open', 'High', 'Low', 'Close', 'Volume']]
+
+@pytest.fixture
+def offline_import(monkeypatch):
+    """
+    FinanceDataReader 를 호출하면 실패하는 가짜 모듈로 바꿔 둔 뒤 모듈을 import 하는 함수.
+    (실제 패키지가 없어도, 있어도 테스트가 네트워크를 쓰지 않도록)
+    """
+    def offline(*args, **kwargs):
+        raise RuntimeError("테스트에서는 FinanceDataReader 를 호출하지 않습니다.")
+    stub = types.ModuleType('FinanceDataReader')
+    stub.DataReader = stub.StockListing = offline
+    monkeypatch.setitem(sys.modules, 'FinanceDataReader', stub)
+    return importlib.import_module
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """빈 임시 폴더를 작업 폴더로 쓰는 저장소 (price_store/, indicator_cache/ 등이 모두 이 안에 생김)"""
+    monkeypatch.chdir(tmp_path)
+    price_catalog.reload()
+    data_cache.get_cache().clear()
+    yield tmp_path
+    # 종료 시 자동 저장이 원래 작업 폴더에 쓰지 않도록 여기서 기록하고 비움
+    price_catalog.save()
+    price_catalog.reload()
+    data_cache.get_cache().clear()
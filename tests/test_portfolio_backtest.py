@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import price_panel
+import price_store
+import portfolio_backtest
+
+from conftest import make_prices
+
+DATES = pd.bdate_range('2024-01-01', periods=20)
+SIGNAL_ROW = 10  # 5일선 돌파: 종가 100 → 110
+ENTRY_ROW = 11   # 다음 날 시가에 진입 (110)
+
+def _bars(bars, tail_close):
+    """0~9행 100, 10행 110(돌파), 이후 bars 의 (Open, High, Low, Close, Volume), 나머지는 tail_close"""
+    rows = [(100, 100, 100, 100, 1000)] * SIGNAL_ROW + [(110, 110, 110, 110, 1000)] + list(bars)
+    rows += [(tail_close, tail_close, tail_close, tail_close, 1000)] * (len(DATES) - len(rows))
+    o, h, l, c, v = map(list, zip(*rows))
+    return make_prices(DATES, c, Open=o, High=h, Low=l, Volume=v)
+
+STOCKS = pd.DataFrame({'Code': ['000001', '000002', '000003'], 'Name': ['SUSPENDED', 'STOP', 'TARGET']})
+
+def _run(panel, **kwargs):
+    return portfolio_backtest.run_portfolio(panel, STOCKS, window=5, top_n=3, target=0.10, stop=0.05,
+                                            period_days=3, fee=0, tax=0, **kwargs)
+
+@pytest.fixture
+def panel(store):
+    price_store.save_prices('000001', _bars([(110, 112, 108, 111, 1000),
+                                             (0, 0, 0, 111, 0),             # 거래정지일 봉
+                                             (111, 112, 109, 111, 1000),
+                                             (111, 112, 109, 112, 1000)], 112), 'SUSPENDED')
+    price_store.save_prices('000002', _bars([(110, 111, 109, 110, 1000),
+                                             (108, 109, 100, 102, 1000)], 102), 'STOP')
+    price_store.save_prices('000003', _bars([(110, 112, 109, 111, 1000),
+                                             (125, 126, 124, 125, 1000)], 125), 'TARGET')
+    return price_panel.build_panel(verbose=False)
+
+@pytest.fixture
+def result(panel):
+    df_equity, df_trades, summary = _run(panel)
+    return df_equity, df_trades.set_index('Code'), summary
+
+def test_entries_at_next_open(result):
+    _, trades, _ = result
+    assert (trades['EntryDate'] == DATES[ENTRY_ROW]).all()
+    assert (trades['EntryPrice'] == 110).all()
+
+def test_suspended_bar_is_not_an_exit(result):
+    df_equity, trades, _ = result
+    trade = trades.loc['000001']
+    # 시가/고가/저가 0 인 봉에서 손절되지 않고, 거래된 날만 세어 3일째 종가에 청산
+    assert trade['Reason'] == 'time'
+    assert trade['ExitDate'] == DATES[ENTRY_ROW + 3]
+    assert trade['ExitPrice'] == 112
+    assert trade['Days'] == 3
+    assert (trades['ExitPrice'] > 0).all()
+    # 거래정지일에는 청산하지 않고 종가(111)로 평가 (같은 날 나머지 두 종목은 청산)
+    suspended = df_equity.set_index('Date').loc[DATES[ENTRY_ROW + 1]]
+    assert suspended['Positions'] == 1
+    assert suspended['Equity'] - suspended['Cash'] == pytest.approx(trade['Shares'] * 111)
+
+def test_intraday_stop_fills_at_stop_price(result):
+    _, trades, _ = result
+    trade = trades.loc['000002']
+    assert trade['Reason'] == 'stop'
+    assert trade['ExitDate'] == DATES[ENTRY_ROW + 1]
+    assert trade['ExitPrice'] == pytest.approx(110 * 0.95)
+
+def test_gap_over_target_fills_at_open(result):
+    _, trades, _ = result
+    trade = trades.loc['000003']
+    assert trade['Reason'] == 'target'
+    assert trade['ExitPrice'] == 125
+
+def test_summary_uses_plain_python_types(result):
+    _, _, summary = result
+    assert summary['trades'] == 3
+    assert summary['exits'] == {'time': 1, 'stop': 1, 'target': 1}
+    for key, value in summary.items():
+        assert not isinstance(value, np.generic), key
+
+def test_first_day_enters_on_previous_day_signal(panel):
+    # 신호 다음 날부터 시작해도 첫날 시가에 진입
+    df_equity, df_trades, _ = _run(panel, start=DATES[ENTRY_ROW])
+    assert df_equity['Date'].iloc[0] == DATES[ENTRY_ROW]
+    assert len(df_trades) == 3
+    assert (df_trades['EntryDate'] == DATES[ENTRY_ROW]).all()
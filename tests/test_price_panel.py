@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import price_panel
+import price_store
+import screen_engine
+
+from conftest import make_prices
+
+DATES = pd.bdate_range('2024-01-01', periods=30)
+
+@pytest.fixture
+def chart_data(offline_import):
+    return offline_import('chart_data')
+
+def _panel():
+    """000001 은 30일 전부, 000002 는 10~14행이 빠진 25일 (데이터가 빠진 구간이 있는 종목)"""
+    price_store.save_prices('000001', make_prices(DATES, np.arange(100, 130)))
+    gap_dates = DATES.delete(range(10, 15))
+    price_store.save_prices('000002', make_prices(gap_dates, np.arange(200, 225)))
+    return price_panel.build_panel(verbose=False)
+
+def test_gap_columns_and_data_counts(store):
+    panel = _panel()
+    assert panel.tickers[panel.gap_columns].tolist() == ['000002']
+    assert panel.n_rows.tolist() == [30, 25]
+
+def test_tail_skips_missing_rows(store):
+    panel = _panel()
+    close = panel.tail('Close', 20, panel.ticker_index(['000001', '000002']))
+    assert close[:, 0].tolist() == list(range(110, 130))
+    # 빈 칸 없이 최근 데이터 20개 (빠진 5일은 건너뜀)
+    assert close[:, 1].tolist() == list(range(205, 225))
+    # 데이터보다 길게 요청하면 앞쪽만 NaN
+    close = panel.tail('Close', 27, panel.ticker_index(['000002']))[:, 0]
+    assert np.isnan(close[:2]).all()
+    assert close[2:].tolist() == list(range(200, 225))
+
+def test_moving_averages_match_per_ticker_rolling(store, chart_data):
+    panel = _panel()
+    closes = pd.Series(np.arange(200, 225), dtype=float)
+    expected = closes.rolling(5).mean().to_numpy()
+
+    # 스파크라인의 MA (tail 기반)
+    _, ma = chart_data.load_sparklines(panel, ['000002'], 5, bars=15)
+    np.testing.assert_allclose(ma[:, 0], expected[-15:])
+
+    # 빈 구간 바로 뒤 날짜 기준 스크리닝의 MA (data_rows 기준)
+    stocks = pd.DataFrame({'Code': ['000002'], 'Name': ['GAP']})
+    mas = screen_engine._window_mas(panel, panel.ticker_index(['000002']), [5],
+                                    end_rows=panel.end_rows(DATES[16], panel.ticker_index(['000002'])))
+    latest_ma, prev_ma = mas[5]
+    assert latest_ma[0] == expected[11]
+    assert prev_ma[0] == expected[10]
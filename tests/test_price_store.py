@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+import price_catalog
+import price_store
+import indicator_cache
+
+from conftest import make_prices
+
+def _dates(start, n):
+    return pd.bdate_range(start, periods=n)
+
+def test_append_in_place_extends_file_and_checksum(store):
+    price_store.save_prices('000001', make_prices(_dates('2024-01-01', 30), np.arange(100, 130)), '테스트')
+    size = price_catalog.get('000001')['size']
+
+    price_store.append_prices('000001', make_prices(_dates('2024-02-12', 2), [200, 201]))
+    price_store.append_prices('000001', make_prices(_dates('2024-02-14', 1), [202]))
+
+    entry = price_catalog.get('000001')
+    rec = price_store.load_records('000001')
+    # 파일 끝에 덧붙임 (헤더 길이 그대로, 레코드 3개만큼 늘어남)
+    assert entry['size'] == size + 3 * rec.dtype.itemsize
+    assert entry['rows'] == len(rec) == 33
+    assert entry['last_date'] == '2024-02-14'
+    assert entry['name'] == '테스트'
+    # 덧붙인 바이트로 이어서 계산한 체크섬 == 파일 전체를 다시 읽어 계산한 값
+    assert entry['checksum'] == price_catalog._checksum(entry['path'])
+    assert price_catalog.verify() == []
+    # 지표 캐시도 이어서 계산한 누적합이 전체 계산과 같음
+    np.testing.assert_array_equal(indicator_cache.load('000001')['CloseSum'], np.cumsum(rec['Close']))
+
+def test_overlapping_append_rewrites_file(store):
+    price_store.save_prices('000001', make_prices(_dates('2024-01-01', 10), np.arange(100, 110)))
+    price_store.append_prices('000001', make_prices(_dates('2024-01-11', 3), [300, 301, 302]))
+
+    rec = price_store.load_records('000001')
+    assert len(rec) == 11  # 2024-01-11, 12 교체 + 15 추가
+    assert rec['Close'][-3:].tolist() == [300, 301, 302]
+    entry = price_catalog.get('000001')
+    assert entry['checksum'] == price_catalog._checksum(entry['path'])
+    assert price_catalog.verify() == []
+
+def test_verify_detects_modified_file(store):
+    price_store.save_prices('000001', make_prices(_dates('2024-01-01', 10), np.arange(100, 110)))
+    path = price_catalog.get('000001')['path']
+    with open(path, 'r+b') as f:
+        f.seek(-1, 2)
+        last = f.read(1)
+        f.seek(-1, 2)
+        f.write(bytes([last[0] ^ 0xff]))
+    assert price_catalog.verify() != []
+
+def test_legacy_entry_uses_whole_file_checksum(store):
+    price_store.save_prices('000001', make_prices(_dates('2024-01-01', 10), np.arange(100, 110)))
+    entry = price_catalog.get('000001')
+    entry.pop('checksum_scope')
+    entry['checksum'] = price_catalog._checksum(entry['path'], None)
+    assert price_catalog.verify() == []
+
+    # 이전 형식 항목에서는 이어서 계산하지 않고 파일을 읽어 새 형식으로 다시 계산
+    price_store.append_prices('000001', make_prices(_dates('2024-01-15', 1), [500]))
+    entry = price_catalog.get('000001')
+    assert entry['checksum_scope'] == price_catalog.CHECKSUM_SCOPE
+    assert entry['checksum'] == price_catalog._checksum(entry['path'])
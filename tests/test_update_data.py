@@ -0,0 +1,175 @@
+import asyncio
+import datetime
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import price_store
+import run_metrics
+
+from conftest import make_prices
+
+@pytest.fixture
+def update_data(offline_import):
+    return offline_import('update_data')
+
+@pytest.fixture
+def run(monkeypatch):
+    """세부 단계/카운터를 기록할 실행 (다른 실행과 섞이지 않도록 현재 실행을 바꿔 둠)"""
+    run = run_metrics.RunRecorder('update')
+    monkeypatch.setattr(run_metrics, '_current', run)
+    return run
+
+SNAPSHOT_DATE = datetime.date(2024, 1, 5)
+PREV_DATE = datetime.date(2024, 1, 4)
+
+def _listing(rows):
+    """fdr.StockListing('KRX') 모양의 스냅샷 표 (Code, Name, Open, High, Low, Close, Volume)"""
+    return pd.DataFrame(rows, columns=['Code', 'Name', 'Open', 'High', 'Low', 'Close', 'Volume'])
+
+def _save(ticker, dates, closes):
+    price_store.save_prices(ticker, make_prices(dates, closes), ticker)
+
+def test_appends_snapshot_row(store, update_data):
+    _save('000001', ['2024-01-03', '2024-01-04'], [100, 110])
+    results, fallback = update_data.ingest_snapshot(
+        _listing([('000001', 'A', 111, 125, 108, 121, 5000)]), SNAPSHOT_DATE, PREV_DATE)
+
+    assert fallback == []
+    assert results == ['Updated: A (1 rows added)']
+    df = price_store.load_prices('000001')
+    assert len(df) == 3
+    last = df.iloc[-1]
+    assert df.index[-1] == pd.Timestamp(SNAPSHOT_DATE)
+    assert [last[col] for col in ['Open', 'High', 'Low', 'Close', 'Volume']] == [111, 125, 108, 121, 5000]
+    assert last['Change'] == pytest.approx(121 / 110 - 1)
+
+def test_replaces_intraday_row_with_missing_change(store, update_data):
+    # 저장된 당일 행의 등락률이 NaN 이어도 직전 행 종가로 계산
+    df = make_prices(['2024-01-04', '2024-01-05'], [100, 104])
+    df['Change'] = np.nan
+    price_store.save_prices('000001', df, 'A')
+
+    results, fallback = update_data.ingest_snapshot(
+        _listing([('000001', 'A', 101, 112, 99, 110, 7000)]), SNAPSHOT_DATE, PREV_DATE)
+
+    assert fallback == []
+    df = price_store.load_prices('000001')
+    assert len(df) == 2
+    assert df['Close'].iloc[-1] == 110
+    assert df['Change'].iloc[-1] == pytest.approx(0.10)
+
+def test_replace_without_previous_row_falls_back(store, update_data):
+    df = make_prices(['2024-01-05'], [104])
+    df['Change'] = np.nan
+    price_store.save_prices('000001', df, 'A')
+
+    _, fallback = update_data.ingest_snapshot(
+        _listing([('000001', 'A', 101, 112, 99, 110, 7000)]), SNAPSHOT_DATE, PREV_DATE)
+
+    assert fallback == [('000001', 'A')]
+    assert price_store.load_prices('000001')['Close'].tolist() == [104]
+
+def test_unchanged_row_is_skipped(store, update_data):
+    _save('000001', ['2024-01-04', '2024-01-05'], [100, 110])
+    results, fallback = update_data.ingest_snapshot(
+        _listing([('000001', 'A', 110, 110, 110, 110, 1000)]), SNAPSHOT_DATE, PREV_DATE)
+
+    assert fallback == []
+    assert results == ['Up to date: A']
+
+def test_other_tickers_fall_back_to_download(store, update_data):
+    _save('000002', ['2024-01-03', '2024-01-04'], [100, 100])  # 거래정지 (거래량 0)
+    _save('000003', ['2024-01-02', '2024-01-03'], [100, 100])  # 하루 이상 밀림
+    listing = _listing([
+        ('000002', 'B', 100, 100, 100, 100, 0),
+        ('000003', 'C', 105, 105, 105, 105, 1000),
+        ('000004', 'D', 105, 105, 105, 105, 1000),  # 저장된 데이터 없음 (신규 상장)
+    ])
+    results, fallback = update_data.ingest_snapshot(listing, SNAPSHOT_DATE, PREV_DATE)
+
+    assert results == []
+    assert fallback == [('000002', 'B'), ('000003', 'C'), ('000004', 'D')]
+    assert len(price_store.load_prices('000002')) == 2
+    assert len(price_store.load_prices('000003')) == 2
+
+# --- asyncio 업데이트 모드 ---
+
+def _download(n=5):
+    return make_prices(pd.bdate_range('2024-01-01', periods=n), np.arange(100, 100 + n))
+
+class FlakyReader:
+    """
+    fdr.DataReader 대신 쓰는 reader. 종목별 첫 호출 동작:
+    'fail' 은 예외, 'hang' 은 timeout 보다 오래 멈춤, 그 외와 두 번째 호출부터는 데이터 반환
+    """
+
+    def __init__(self, first_calls, hang_seconds=0.5):
+        self.first_calls = first_calls
+        self.hang_seconds = hang_seconds
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, ticker, start=None):
+        with self._lock:
+            self.calls[ticker] = self.calls.get(ticker, 0) + 1
+            first = self.calls[ticker] == 1
+        behavior = self.first_calls.get(ticker) if first else None
+        if behavior == 'fail':
+            raise ConnectionError("일시적 오류")
+        if behavior == 'hang':
+            time.sleep(self.hang_seconds)
+        return _download()
+
+def test_update_all_async_retries_failures_and_timeouts(store, update_data, run):
+    reader = FlakyReader({'000001': 'fail', '000002': 'hang'})
+    stock_list = [('000001', 'FAIL'), ('000002', 'HANG'), ('000003', 'OK')]
+    results = asyncio.run(update_data.update_all_async(stock_list, concurrency=4, rate=1000, timeout=0.1,
+                                                       retries=2, backoff=0.01, reader=reader))
+
+    assert sorted(results) == ['Downloaded: FAIL (5 rows)', 'Downloaded: HANG (5 rows)', 'Downloaded: OK (5 rows)']
+    assert reader.calls == {'000001': 2, '000002': 2, '000003': 1}
+    assert run.counters['retries'] == 2
+    assert run.counters['failures'] == 1
+    assert run.counters['timeouts'] == 1
+    assert run.counters['empty_fetches'] == 0
+    for ticker, _ in stock_list:
+        assert price_store.load_prices(ticker)['Close'].tolist() == list(range(100, 105))
+
+def test_update_all_async_gives_up_after_retries(store, update_data, run):
+    def reader(ticker, start=None):
+        raise ConnectionError("계속 실패")
+    results = asyncio.run(update_data.update_all_async([('000001', 'A')], rate=1000, timeout=0.1,
+                                                       retries=2, backoff=0.01, reader=reader))
+
+    assert results == ['Failed to download: A']
+    assert run.counters['failures'] == 3
+    assert run.counters['retries'] == 2
+    assert run.counters['empty_fetches'] == 1
+    assert price_store.load_prices('000001') is None
+
+def test_update_all_async_appends_after_stored_date(store, update_data, run):
+    price_store.save_prices('000001', _download(3), 'A')
+    starts = []
+    def reader(ticker, start=None):
+        starts.append(start)
+        return make_prices(pd.bdate_range('2024-01-04', periods=2), [200, 201])
+    results = asyncio.run(update_data.update_all_async([('000001', 'A')], rate=1000, reader=reader))
+
+    assert results == ['Updated: A (2 rows added)']
+    assert starts == ['2024-01-04']
+    assert price_store.load_prices('000001')['Close'].tolist() == [100, 101, 102, 200, 201]
+
+def test_token_bucket_limits_rate(update_data):
+    async def take(n):
+        bucket = update_data.TokenBucket(rate=20, capacity=1)
+        start = time.monotonic()
+        for _ in range(n):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # 첫 토큰은 바로, 나머지 4개는 1/20초 간격
+    assert asyncio.run(take(5)) >= 0.18
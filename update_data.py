@@ -1,144 +1,432 @@
 import FinanceDataReader as fdr
+import numpy as np
 import pandas as pd
 import os
 import datetime
 import time
 import argparse
+import asyncio
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import sys
-import re
+
+import krx_universe
+import price_store
+import price_catalog
+import fetch_pool
+import price_panel
+import screen_state
+import run_metrics
 
 # 설정
 DATA_DIR = 'stock_data'
 MAX_WORKERS = 4  # 병렬 작업 수
 DEFAULT_DAYS = 3000 # 약 12년
 
-def sanitize_filename(name):
-    return re.sub(r'[\\/*?:"<>|]', "", name)
-
 def ensure_dir(directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
 import multiprocessing
 
-def fetch_worker(ticker, start_date, queue):
-    """별도 프로세스에서 실행될 데이터 수집 함수"""
-    try:
-        df = fdr.DataReader(ticker, start=start_date)
-        queue.put(df)
-    except Exception:
-        queue.put(pd.DataFrame())
-
 def fetch_data(ticker, start_date, timeout=10):
-    """multiprocessing을 사용하여 타임아웃을 강제합니다."""
-    # Windows에서 multiprocessing 사용 시 freeze_support 필요 (main guard 내에서 호출됨)
-    queue = multiprocessing.Queue()
-    p = multiprocessing.Process(target=fetch_worker, args=(ticker, start_date, queue))
-    p.start()
-    
-    try:
-        df = queue.get(timeout=timeout)
-        p.join(timeout=1)
-        if p.is_alive():
-            p.terminate()
-            p.join()
-        return df
-    except Exception:
-        if p.is_alive():
-            p.terminate()
-            p.join()
-        return pd.DataFrame()
+    """상주 워커 프로세스 풀에서 데이터를 가져옵니다. (타임아웃/실패 시 빈 데이터프레임)"""
+    return fetch_pool.get_pool(MAX_WORKERS).fetch(ticker, start_date, timeout=timeout)
 
-def process_stock(ticker, name):
-    safe_name = sanitize_filename(name)
-    file_path = os.path.join(DATA_DIR, f"{ticker}_{safe_name}.csv")
-    old_file_path = os.path.join(DATA_DIR, f"{ticker}.csv")
-    
-    # 구형 파일 이름 변경
-    if os.path.exists(old_file_path) and not os.path.exists(file_path):
-        os.rename(old_file_path, file_path)
-    
+def plan_update(ticker, name):
+    """
+    종목 업데이트 계획을 세웁니다: (기존 데이터 존재 여부, 다운로드 시작일)
+    - 이미 최신이면 시작일이 None
+    - 기존 데이터가 없거나 깨졌으면 DEFAULT_DAYS 전부터 새로 받음
+    """
     today = datetime.datetime.now().date()
     # 어제 날짜까지의 데이터를 확보하는 것이 목표 (장 중이면 오늘거 포함)
     
-    try:
-        if os.path.exists(file_path):
-            # 기존 파일 업데이트
-            try:
-                df = pd.read_csv(file_path, parse_dates=['Date'], index_col='Date')
-                if df.empty:
-                    raise ValueError("Empty file")
-                
-                last_date = df.index[-1].date()
-                
-                if last_date < today:
-                    # 업데이트 필요
-                    next_day = last_date + datetime.timedelta(days=1)
-                    new_df = fetch_data(ticker, next_day.strftime('%Y-%m-%d'), timeout=10)
-                    
-                    if not new_df.empty:
-                        df = pd.concat([df, new_df])
-                        df = df[~df.index.duplicated(keep='last')] # 중복 제거
-                        df.to_csv(file_path)
-                        return f"Updated: {name} ({len(new_df)} rows added)"
-                    else:
-                         return f"No new data: {name}"
-                else:
-                    return f"Up to date: {name}"
-            except Exception:
-                # 파일 깨짐 등 문제 발생 시 새로 받기
-                pass
-
-        # 신규 다운로드 (또는 재다운로드)
-        start_date = (datetime.datetime.now() - datetime.timedelta(days=DEFAULT_DAYS)).strftime('%Y-%m-%d')
-        df = fetch_data(ticker, start_date, timeout=10)
-        if not df.empty:
-            df.to_csv(file_path)
-            return f"Downloaded: {name} ({len(df)} rows)"
-        else:
-            return f"Failed to download: {name}"
+    # 카탈로그에 있으면 파일을 열지 않고 마지막 날짜 확인
+    last_date = price_catalog.last_date(ticker)
+    if last_date is not None:
+        if last_date < today:
+            return True, (last_date + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+        return True, None
+
+    if price_store.has_prices(ticker, name):
+        try:
+            # 미변환 CSV: 전체 이력을 읽지 않고 마지막 날짜만 확인
+            last_date = price_store.last_date(ticker, name)
+            if last_date is None:
+                raise ValueError("Empty file")
             
+            if last_date < today:
+                # 업데이트 필요: 마지막 날짜 다음 날부터
+                next_day = last_date + datetime.timedelta(days=1)
+                return True, next_day.strftime('%Y-%m-%d')
+            return True, None
+        except Exception:
+            # 파일 깨짐 등 문제 발생 시 새로 받기
+            pass
+
+    # 신규 다운로드 (또는 재다운로드)
+    start_date = (datetime.datetime.now() - datetime.timedelta(days=DEFAULT_DAYS)).strftime('%Y-%m-%d')
+    return False, start_date
+
+def apply_update(ticker, name, has_data, new_df):
+    """받아온 데이터를 저장하고 결과 메시지를 반환합니다. (기존 데이터가 있으면 새 행만 파일 끝에 추가)"""
+    if has_data:
+        if not new_df.empty:
+            price_store.append_prices(ticker, new_df, name)
+            return f"Updated: {name} ({len(new_df)} rows added)"
+        return f"No new data: {name}"
+
+    if not new_df.empty:
+        price_store.save_prices(ticker, new_df, name)
+        return f"Downloaded: {name} ({len(new_df)} rows)"
+    return f"Failed to download: {name}"
+
+# 결과 메시지 → 실행 보고서 카운터
+RESULT_COUNTERS = [
+    ('Updated', 'updated'),
+    ('Downloaded', 'downloaded'),
+    ('Up to date', 'up_to_date'),
+    ('No new data', 'no_new_data'),
+    ('Failed to download', 'download_failed'),
+    ('Error', 'errors'),
+]
+
+def count_result(run, result):
+    """process_stock 등의 결과 메시지를 실행 보고서 카운터에 더합니다."""
+    for prefix, counter in RESULT_COUNTERS:
+        if result.startswith(prefix):
+            run.count(counter)
+            return
+
+def process_stock(ticker, name):
+    try:
+        has_data, start_date = plan_update(ticker, name)
+        if start_date is None:
+            return f"Up to date: {name}"
+        new_df = fetch_data(ticker, start_date, timeout=10)
+        return apply_update(ticker, name, has_data, new_df)
     except Exception as e:
         return f"Error {name}: {str(e)}"
 
-def main():
+# --- 일괄 스냅샷 모드 ---
+# fdr.StockListing('KRX') 표에는 당일 전 종목의 시가/고가/저가/종가/거래량이 들어 있습니다.
+# 이 표 하나로 전 종목에 하루치 행을 추가하고, 공백이 있는 종목만 개별 다운로드합니다.
+
+SNAPSHOT_PROBE = '005930'  # 스냅샷 날짜 확인용 종목 (삼성전자)
+SNAPSHOT_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+def _snapshot_row(row):
+    """스냅샷 행 → (Open, High, Low, Close, Volume) 정수 튜플 (값이 비었거나 거래가 없으면 None)"""
+    try:
+        values = [row[col] for col in SNAPSHOT_COLUMNS]
+    except KeyError:
+        return None
+    if any(pd.isna(v) for v in values):
+        return None
+    values = [int(round(float(v))) for v in values]
+    if values[4] <= 0 or min(values[:4]) <= 0:
+        # 거래정지 종목은 스냅샷 가격이 전일 종가로 채워져 있으므로 개별 다운로드로 확인
+        return None
+    return tuple(values)
+
+def snapshot_dates(stocks, probe=SNAPSHOT_PROBE):
+    """
+    스냅샷 표의 거래일과 그 직전 거래일을 확인합니다: (snapshot_date, prev_date)
+    표에는 날짜가 없으므로 probe 종목의 최근 데이터를 한 번 받아 마지막 행과 비교합니다.
+    확인할 수 없으면 (None, None)
+    """
+    rows = stocks[stocks['Code'] == probe]
+    if rows.empty:
+        return None, None
+    values = _snapshot_row(rows.iloc[0])
+    if values is None:
+        return None, None
+
+    start_date = (datetime.datetime.now() - datetime.timedelta(days=14)).strftime('%Y-%m-%d')
+    df = fetch_data(probe, start_date, timeout=10)
+    if len(df) < 2:
+        return None, None
+    last = df.iloc[-1]
+    if tuple(int(round(float(last[col]))) for col in SNAPSHOT_COLUMNS[:4]) != values[:4]:
+        return None, None
+    return df.index[-1].date(), df.index[-2].date()
+
+def ingest_snapshot(stocks, snapshot_date, prev_date):
+    """
+    스냅샷 표의 하루치 데이터를 전 종목 저장소에 추가합니다.
+    - 마지막 저장일이 prev_date 인 종목: 스냅샷 행 1개 추가 (등락률은 저장된 전일 종가로 계산)
+    - 마지막 저장일이 snapshot_date 인 종목: 값이 바뀌었으면 교체, 같으면 건너뜀
+    - 그 외 (신규 상장, 며칠 이상 밀림, 거래정지 등): 개별 다운로드 대상으로 넘김
+    반환: (결과 메시지 리스트, 개별 다운로드할 (ticker, name) 리스트)
+    """
+    results = []
+    fallback = []
+    snap_day = np.datetime64(snapshot_date, 'D')
+    prev_day = np.datetime64(prev_date, 'D')
+
+    for _, row in stocks.iterrows():
+        ticker, name = row['Code'], row['Name']
+        try:
+            values = _snapshot_row(row)
+            # 카탈로그상 며칠 이상 밀린 종목은 파일을 열지 않고 개별 다운로드로
+            catalog_last = price_catalog.last_date(ticker)
+            if catalog_last is not None and catalog_last not in (snapshot_date, prev_date):
+                values = None
+            last = price_store.last_record(ticker, name) if values is not None else None
+            if last is None:
+                fallback.append((ticker, name))
+                continue
+
+            last_day = last['Date'].astype('M8[D]')
+            if last_day == snap_day:
+                if tuple(int(last[col]) for col in SNAPSHOT_COLUMNS) == values:
+                    results.append(f"Up to date: {name}")
+                    continue
+                # 장중에 받은 행을 확정 데이터로 교체
+                prev_close = None
+            elif last_day == prev_day:
+                prev_close = int(last['Close'])
+            else:
+                fallback.append((ticker, name))
+                continue
+
+            open_, high, low, close, volume = values
+            new_df = pd.DataFrame({'Open': [open_], 'High': [high], 'Low': [low],
+                                   'Close': [close], 'Volume': [volume]},
+                                  index=pd.DatetimeIndex([pd.Timestamp(snapshot_date)], name='Date'))
+            if prev_close is None:
+                # 교체 시 전일 종가는 저장된 종가와 등락률로 역산 (등락률이 없으면 저장된 직전 행의 종가)
+                change = float(last['Change'])
+                if not np.isnan(change) and change != -1:
+                    prev_close = int(last['Close']) / (1 + change)
+                else:
+                    tail = price_store.load_records_tail(ticker, 2)
+                    if tail is None or len(tail) < 2:
+                        fallback.append((ticker, name))
+                        continue
+                    prev_close = int(tail['Close'][0])
+            new_df['Change'] = close / prev_close - 1 if prev_close else 0.0
+            price_store.append_prices(ticker, new_df, name)
+            results.append(f"Updated: {name} (1 rows added)")
+        except Exception as e:
+            fallback.append((ticker, name))
+            results.append(f"Error {name}: {str(e)}")
+    return results, fallback
+
+# --- asyncio 업데이트 모드 ---
+# 다운로드는 I/O 대기가 대부분이므로 스레드 4개 대신 많은 요청을 동시에 진행합니다.
+# 데이터 소스에 부담을 주지 않도록 초당 요청 수는 토큰 버킷으로 제한합니다.
+
+class TokenBucket:
+    """초당 rate 개의 요청을 허용하는 토큰 버킷 (최대 capacity 개까지 몰아서 허용)"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+async def fetch_data_async(ticker, start_date, reader, limiter, executor, timeout=10, retries=2, backoff=1.0):
+    """
+    reader(ticker, start=...)를 스레드에서 실행해 데이터를 가져옵니다.
+    타임아웃/오류 시 backoff * 2^n 초 쉬고 재시도하며, 모두 실패하면 빈 데이터프레임을 반환합니다.
+    (타임아웃된 호출의 스레드는 강제 종료할 수 없으므로 끝날 때까지 executor 에 남습니다)
+    """
+    loop = asyncio.get_running_loop()
+    for attempt in range(retries + 1):
+        await limiter.acquire()
+        start = time.perf_counter()
+        try:
+            df = await asyncio.wait_for(loop.run_in_executor(executor, lambda: reader(ticker, start=start_date)), timeout)
+            run_metrics.add('fetch', time.perf_counter() - start, ticker)
+            if df is None or df.empty:
+                run_metrics.count('empty_fetches', ticker=ticker)
+                return pd.DataFrame()
+            return df
+        except Exception as e:
+            # 코루틴들이 한 스레드에서 번갈아 실행되므로 단계 시간은 직접 잰 값으로 기록
+            run_metrics.add('fetch', time.perf_counter() - start, ticker)
+            run_metrics.count('timeouts' if isinstance(e, asyncio.TimeoutError) else 'failures', ticker=ticker)
+            if attempt == retries:
+                run_metrics.count('empty_fetches', ticker=ticker)
+                return pd.DataFrame()
+            run_metrics.count('retries', ticker=ticker)
+            await asyncio.sleep(backoff * (2 ** attempt))
+
+async def process_stock_async(ticker, name, reader, limiter, semaphore, executor, timeout=10, retries=2, backoff=1.0):
+    """process_stock 의 asyncio 버전 (마지막 저장일 이후 행만 추가하는 동작은 동일)"""
+    async with semaphore:
+        loop = asyncio.get_running_loop()
+        try:
+            has_data, start_date = await loop.run_in_executor(executor, plan_update, ticker, name)
+            if start_date is None:
+                return f"Up to date: {name}"
+            new_df = await fetch_data_async(ticker, start_date, reader, limiter, executor,
+                                            timeout=timeout, retries=retries, backoff=backoff)
+            return await loop.run_in_executor(executor, apply_update, ticker, name, has_data, new_df)
+        except Exception as e:
+            return f"Error {name}: {str(e)}"
+
+async def update_all_async(stock_list, concurrency=16, rate=10.0, timeout=10, retries=2, backoff=1.0, reader=None):
+    """
+    (ticker, name) 목록 전체를 asyncio 로 업데이트합니다.
+    reader 를 지정하면 fdr.DataReader 대신 사용합니다. (오프라인 테스트용)
+    반환: 종목별 결과 메시지 리스트 (완료 순)
+    """
+    reader = reader or fdr.DataReader
+    limiter = TokenBucket(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    total = len(stock_list)
+    results = []
+
+    # 파일 입출력과 reader 호출용 스레드 (타임아웃으로 남는 스레드가 있어도 여유 있게)
+    executor = ThreadPoolExecutor(max_workers=concurrency * 2)
+    try:
+        tasks = [process_stock_async(ticker, name, reader, limiter, semaphore, executor,
+                                     timeout=timeout, retries=retries, backoff=backoff)
+                 for ticker, name in stock_list]
+        for completed, task in enumerate(asyncio.as_completed(tasks), 1):
+            result = await task
+            results.append(result)
+            if completed % 50 == 0 or completed == total:
+                print(f"[{completed}/{total}] {result}")
+    finally:
+        # 타임아웃으로 멈춘 스레드는 기다리지 않음
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+def main(use_async=False, concurrency=16, rate=10.0, timeout=10, retries=2, snapshot=False, profile=None):
+    """
+    전 종목 일일 업데이트.
+    use_async 이면 asyncio 모드(동시 요청 concurrency 개, 초당 rate 회 제한, 재시도 retries 회)로 실행합니다.
+    snapshot 이면 종목 목록 표(당일 시세 포함)로 전 종목을 한 번에 갱신하고, 나머지 종목만 개별 다운로드합니다.
+    단계별 시간/카운터는 run_reports/update_last.json 에 저장됩니다. (profile: 'cprofile' 또는 'sample')
+    """
     ensure_dir(DATA_DIR)
     
     print(f"[{datetime.datetime.now()}] Starting daily stock update...")
-    
-    # KRX 전 종목 가져오기
+    run = run_metrics.start_run('update')
     try:
-        stocks = fdr.StockListing('KRX')
+        with run_metrics.profiled(run, profile):
+            _update(run, use_async, concurrency, rate, timeout, retries, snapshot)
+    finally:
+        report = run_metrics.finish_run(run)
+        stages = ", ".join(f"{name} {value['seconds']:.1f}s" for name, value in report['stages'].items())
+        print(f"Run report: {run_metrics.report_path('update')} ({stages})")
+
+    print(f"[{datetime.datetime.now()}] Update finished.")
+
+def _update(run, use_async, concurrency, rate, timeout, retries, snapshot):
+    # KRX 전 종목 가져오기 (당일 시세가 필요하므로 캐시가 있어도 새로 받고, 실패하면 캐시 사용)
+    changes = None
+    try:
+        with run.stage('universe'):
+            stocks, changes = krx_universe.refresh()
         print(f"Found {len(stocks)} stocks.")
     except Exception as e:
         print(f"Failed to fetch stock list: {e}")
-        return
+        run.count('universe_failures')
+        try:
+            with run.stage('universe'):
+                stocks = krx_universe.load_universe(offline=True, verbose=False)
+            print(f"Using cached stock list ({len(stocks)} stocks).")
+        except Exception:
+            return
+    run.extra['stocks'] = len(stocks)
 
     # 종목 리스트 변환
     stock_list = []
     for _, row in stocks.iterrows():
         stock_list.append((row['Code'], row['Name']))
 
+    # 다른 프로세스가 바꾼 파일을 카탈로그에 반영하고 종목명 변경을 기록
+    with run.stage('catalog'):
+        price_catalog.sync(save_changes=False)
+        price_catalog.set_names(dict(stock_list))
+
+    # 지난 목록 이후 상장 폐지된 종목은 카탈로그에 표시 (업데이트 대상에서 빠짐, 신규 상장 종목은 새로 다운로드됨)
+    if changes is not None and not changes.empty:
+        listed = changes.loc[changes['Change'] == 'listed', 'Code'].tolist()
+        delisted = changes.loc[changes['Change'] == 'delisted', 'Code'].tolist()
+        price_catalog.retire(delisted, datetime.datetime.now().strftime('%Y-%m-%d'))
+        price_catalog.retire(listed, None)  # 재상장 종목은 폐지 표시 해제
+        print(f"Listed: {len(listed)}, Delisted: {len(delisted)}")
+
+    if snapshot:
+        snapshot_date, prev_date = snapshot_dates(stocks)
+        if snapshot_date is None:
+            print("Snapshot date unknown, falling back to per-ticker update.")
+        else:
+            with run.stage('snapshot'):
+                results, stock_list = ingest_snapshot(stocks, snapshot_date, prev_date)
+            for result in results:
+                count_result(run, result)
+            run.extra['snapshot_date'] = str(snapshot_date)
+            updated = sum(1 for result in results if result.startswith('Updated'))
+            print(f"Snapshot {snapshot_date}: {updated} updated, {len(stock_list)} left for per-ticker update.")
+
     # 병렬 처리
     total = len(stock_list)
     completed = 0
     
     print("Updating stocks...")
     
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {executor.submit(process_stock, ticker, name): (ticker, name) for ticker, name in stock_list}
-        
-        for future in as_completed(futures):
-            completed += 1
-            result = future.result()
+    run.extra['per_ticker'] = total
+    if use_async:
+        results = asyncio.run(update_all_async(stock_list, concurrency=concurrency, rate=rate,
+                                               timeout=timeout, retries=retries))
+        for result in results:
+            count_result(run, result)
+    else:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = {executor.submit(process_stock, ticker, name): (ticker, name) for ticker, name in stock_list}
             
-            # 진행률 표시 (한 줄로 업데이트하거나 100개마다 출력)
-            if completed % 50 == 0 or completed == total:
-                print(f"[{completed}/{total}] {result}")
+            for future in as_completed(futures):
+                completed += 1
+                result = future.result()
+                count_result(run, result)
+                
+                # 진행률 표시 (한 줄로 업데이트하거나 100개마다 출력)
+                if completed % 50 == 0 or completed == total:
+                    print(f"[{completed}/{total}] {result}")
 
-    print(f"[{datetime.datetime.now()}] Update finished.")
+    # 수집 워커 종료 (대시보드 스케줄러에서 실행될 때 다음 업데이트까지 상주하지 않도록)
+    fetch_pool.shutdown()
+    with run.stage('catalog'):
+        price_catalog.save()
+
+    # 스크리닝용 전 종목 패널 및 장중 재스크리닝용 장 마감 상태 갱신
+    try:
+        with run.stage('panel'):
+            panel = price_panel.build_panel(verbose=False)
+        with run.stage('state'):
+            screen_state.build_state(panel)
+    except Exception as e:
+        print(f"Failed to build price panel: {e}")
+        run.count('panel_failures')
 
 if __name__ == "__main__":
     multiprocessing.freeze_support()
-    main()
+    parser = argparse.ArgumentParser(description="KRX 전 종목 주가 데이터 업데이트")
+    parser.add_argument('--async', dest='use_async', action='store_true', help="asyncio 모드로 업데이트 (동시 요청 수 확대)")
+    parser.add_argument('--concurrency', type=int, default=16, help="asyncio 모드 동시 요청 수 (기본값: 16)")
+    parser.add_argument('--rate', type=float, default=10.0, help="asyncio 모드 초당 최대 요청 수 (기본값: 10)")
+    parser.add_argument('--timeout', type=float, default=10, help="asyncio 모드 종목당 요청 타임아웃 (초, 기본값: 10)")
+    parser.add_argument('--retries', type=int, default=2, help="asyncio 모드 실패 시 재시도 횟수 (기본값: 2)")
+    parser.add_argument('--snapshot', action='store_true', help="종목 목록 표의 당일 시세로 전 종목을 한 번에 갱신 (공백이 있는 종목만 개별 다운로드)")
+    parser.add_argument('--profile', choices=['cprofile', 'sample'], help="실행 구간 프로파일링 (결과는 run_reports/update_last.json)")
+    args = parser.parse_args()
+    main(use_async=args.use_async, concurrency=args.concurrency, rate=args.rate,
+         timeout=args.timeout, retries=args.retries, snapshot=args.snapshot, profile=args.profile)